@@ -0,0 +1,166 @@
+"""
+Offline latency benchmark for the bot's commands and game listener
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Drives the real cogs against the stand-ins in benchmarks/fakes.py, so no Discord guild or PostgreSQL server is needed.
+
+Usage (from the repository root):
+    python benchmarks/commands.py [--iterations 200] [--latency-ms 1.0] [--teams 16] [--members 5000] [--roles 200]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.fakes import FakeContext, FakeDatabase, FakeEmoji, FakeGuild, FakeMessage, FakePool  # noqa: E402
+from cogs import GameManagement, PlayerManagement, TeamManagement  # noqa: E402
+from discord_db_client import create_bot  # noqa: E402
+from listener import Listener  # noqa: E402
+
+
+POSITIONS = (("FORWARD", "SHOOTER"), ("DEFENSEMAN", "PASSER"), ("GOALIE", None))
+
+
+def build_league(guild: FakeGuild, database: FakeDatabase, teams: int, members: int, roles: int):
+    """Fills the guild and database with a league, active games between pairs of teams, and unrelated members and roles."""
+    for name in ("Forward", "Defenseman", "Goalie", "bot operator"):
+        guild.add_role(name)
+    guild.add_category("Vacant Stadiums")
+    active_category = guild.add_category("Active Stadiums")
+    for name in ("scores", "logs", "new-player-approvals", "general"):
+        guild.add_channel(name)
+
+    team_ids = [f"T{number:02d}" for number in range(teams)]
+    for team_id in team_ids:
+        role = guild.add_role(f"City{team_id} Name{team_id}", color=random.randrange(0xFFFFFF))
+        guild.emojis.append(FakeEmoji(guild.next_id(), team_id))
+        stadium = guild.add_channel(f"{team_id.lower()}-arena", category=active_category)
+        database.add_team(team_id, role.id, f"City{team_id}", f"Name{team_id}", stadium.id)
+        for position, archetype in POSITIONS:
+            member = guild.add_member(f"{team_id}-{position.lower()}")
+            database.add_player(member.id, f"First{member.id}", f"Last{team_id}{position}", position, archetype, team_id)
+
+    for _ in range(members):
+        guild.add_member(f"member{guild.next_id()}")
+    for _ in range(roles):
+        guild.add_role(f"role{guild.next_id()}")
+
+    game_ids = []
+    for away_team, home_team in zip(team_ids[::2], team_ids[1::2]):
+        game_id = guild.next_id()
+        database.add_game(game_id, home_team, away_team, database.teams[home_team]["channelid"])
+        game_ids.append(game_id)
+    return team_ids, game_ids
+
+
+def percentiles(timings):
+    cut_points = statistics.quantiles(timings, n=100, method="inclusive")
+    return cut_points[49], cut_points[94], cut_points[98]
+
+
+async def measure(database: FakeDatabase, scenario, iterations: int):
+    for _ in range(min(10, iterations)):  # Warm up
+        await scenario()
+    timings, round_trips = [], 0
+    for _ in range(iterations):
+        before = sum(database.round_trips.values())
+        start = time.perf_counter()
+        await scenario()
+        timings.append((time.perf_counter() - start) * 1000)
+        round_trips += sum(database.round_trips.values()) - before
+    return timings, round_trips / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="simulated database round trip latency")
+    parser.add_argument("--teams", type=int, default=16)
+    parser.add_argument("--members", type=int, default=5000, help="guild members that are not players")
+    parser.add_argument("--roles", type=int, default=200, help="guild roles that are not teams")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    database = FakeDatabase(latency=args.latency_ms / 1000)
+    guild = FakeGuild()
+    team_ids, game_ids = build_league(guild, database, args.teams, args.members, args.roles)
+
+    logger = logging.getLogger("benchmark")
+    bot = await create_bot(command_prefix="!", db=FakePool(database), logger=logger, help_command=None)
+    bot.get_channel = guild.get_channel
+    bot.get_user = guild.get_member
+    bot.get_guild = lambda guild_id: guild
+    bot._connection.user = guild.add_member("Fake Hockey Bot")
+
+    team_management, player_management = TeamManagement(bot), PlayerManagement(bot)
+    game_management, listener = GameManagement(bot), Listener(bot)
+    operator = guild.add_member("operator")
+    general = guild.get_channel(next(channel.id for channel in guild.channels if channel.name == "general"))
+    players = [player for player in database.player_rows.values()]
+
+    def context():
+        return FakeContext(bot, guild, operator, general)
+
+    async def teaminfo():
+        await team_management.team_info.callback(team_management, context(), random.choice(team_ids))
+
+    async def playerinfo():
+        player = random.choice(players)
+        await player_management.player_info.callback(player_management, context(), None, player_string=f"{player['firstname']} {player['lastname']}")
+
+    async def creategame():
+        game = database.games[random.choice(game_ids)]
+        await game_management.create_game.callback(game_management, context(), game["awayteam"], game["hometeam"])
+
+    async def gameinfo():
+        await game_management.game_info.callback(game_management, context(), random.choice(game_ids))
+
+    async def listgames():
+        await game_management.list_games.callback(game_management, context())
+
+    async def abandongame():
+        await game_management.abandon_game.callback(game_management, context(), random.choice(game_ids))
+        await creategame()  # Put the game back so that the next iteration has something to abandon
+
+    stadiums = [guild.get_channel(database.games[game_id]["stadium"]) for game_id in game_ids]
+    other_channels = [channel for channel in guild.channels if channel not in stadiums]
+    members = guild.members
+
+    async def on_message():
+        # Nine in ten messages are ordinary chatter that the listener should drop
+        channel = random.choice(stadiums) if random.random() < 0.1 else random.choice(other_channels)
+        await listener.process_game(FakeMessage("hello there", random.choice(members), channel, guild))
+
+    scenarios = {"teaminfo": teaminfo, "playerinfo": playerinfo, "creategame": creategame, "gameinfo": gameinfo,
+                 "listgames": listgames, "abandongame": abandongame, "on_message": on_message}
+    print(f"{args.teams} teams, {len(guild.members)} members, {len(guild.roles)} roles, {args.latency_ms} ms per round trip\n")
+    print(f"{'scenario':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'round trips':>12}")
+    for name, scenario in scenarios.items():
+        timings, round_trips = await measure(database, scenario, args.iterations)
+        p50, p95, p99 = percentiles(timings)
+        print(f"{name:<12} {p50:9.3f} {p95:9.3f} {p99:9.3f} {round_trips:12.2f}")
+    bot.deadlines.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
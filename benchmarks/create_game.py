@@ -0,0 +1,111 @@
+"""
+Compares the latency of the old multi-query game creation against the create_game() server-side function
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Usage (from the repository root, with configuration.json present):
+    python benchmarks/create_game.py HOME AWAY [--iterations 200]
+
+Both teams must exist and have full rosters. Every iteration runs inside a transaction that is rolled back, so the
+database is left untouched.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import schema  # noqa: E402
+
+
+async def old_create_game(connection, home_team: str, away_team: str):
+    """The sequence of queries GameManagement.create_game used to send, one round trip each."""
+    if not (await connection.fetchval("""SELECT EXISTS(SELECT 1 FROM teams WHERE teamid = UPPER($1))""", home_team)
+            and await connection.fetchval("""SELECT EXISTS(SELECT 1 FROM teams WHERE teamid = UPPER($1))""", away_team)):
+        return None
+    stadium = await connection.fetchval("""SELECT channelid FROM teams WHERE teamid = $1""", home_team)
+    if await connection.fetchval("""SELECT EXISTS(SELECT 1 FROM games WHERE stadium = $1 AND game_active)""", stadium):
+        return None
+    if await connection.fetchval("""SELECT EXISTS(
+                                    SELECT 1 FROM games
+                                    WHERE game_active AND
+                                    (hometeam = $1 OR awayteam = $1 OR hometeam = $2 or awayteam = $2))""", home_team, away_team):
+        return None
+    roster = []
+    for team in (home_team, away_team):
+        for position in ("FORWARD", "DEFENSEMAN"):
+            roster.extend(await connection.fetchrow("""SELECT playerid, playertype FROM players WHERE playerteam = $1 AND playerposition = $2""",
+                                                    team, position) or (None, None))
+        roster.append(await connection.fetchval("""SELECT playerid FROM players WHERE playerteam = $1 AND playerposition = 'GOALIE'""", team))
+    await connection.execute("""INSERT INTO games
+                                (hometeam, awayteam, homeroster, awayroster, stadium) VALUES
+                                (   $1,       $2,
+                                 (($3, $4), ($5, $6) , $7), (($8, $9), ($10, $11), $12), $13)""",
+                             home_team, away_team, *roster, stadium)
+    return await connection.fetchval("""SELECT deadline FROM games WHERE stadium = $1 AND game_active""", stadium)
+
+
+async def new_create_game(connection, home_team: str, away_team: str):
+    """The single round trip GameManagement.create_game now sends."""
+    return await connection.fetchrow("""SELECT * FROM create_game($1, $2, $3)""", home_team, away_team, None)
+
+
+async def time_iterations(connection, function, home_team: str, away_team: str, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        transaction = connection.transaction()
+        await transaction.start()
+        start = time.perf_counter()
+        await function(connection, home_team, away_team)
+        timings.append((time.perf_counter() - start) * 1000)
+        await transaction.rollback()
+    return timings
+
+
+def summarize(name: str, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:>8}: median {statistics.median(timings):7.3f} ms | p95 {p95:7.3f} ms | mean {statistics.mean(timings):7.3f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("home_team")
+    parser.add_argument("away_team")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--configuration", default="configuration.json")
+    args = parser.parse_args()
+
+    with open(args.configuration, "r") as configuration_file:
+        configuration = json.load(configuration_file)
+    connection = await asyncpg.connect(**configuration["postgresql_creds"])
+    try:
+        await schema.apply(connection)
+        home_team, away_team = args.home_team.upper(), args.away_team.upper()
+        for name, function in (("before", old_create_game), ("after", new_create_game)):
+            await time_iterations(connection, function, home_team, away_team, min(args.iterations, 10))  # Warm up caches
+            summarize(name, await time_iterations(connection, function, home_team, away_team, args.iterations))
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Measures play resolution throughput, single moves and NumPy batches
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Usage (from the repository root):
+    python benchmarks/engine.py [--moves 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import Action, Archetype, Outcome, resolve_batch, resolve_move  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--moves", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    actions = rng.integers(0, len(Action), args.moves)
+    offense_numbers = rng.integers(1, 1001, args.moves)
+    defense_numbers = rng.integers(1, 1001, args.moves)
+    archetypes = rng.integers(0, len(Archetype), args.moves)
+    clean_passes = rng.integers(0, 8, args.moves)
+
+    single_moves = min(args.moves, 100_000)
+    moves = [(Action(a), int(o), int(d), Archetype(t), int(c))
+             for a, o, d, t, c in zip(actions[:single_moves], offense_numbers[:single_moves], defense_numbers[:single_moves],
+                                      archetypes[:single_moves], clean_passes[:single_moves])]
+    start = time.perf_counter()
+    for move in moves:
+        resolve_move(*move)
+    single_time = time.perf_counter() - start
+    print(f"resolve_move:  {single_time / single_moves * 1e6:.3f} us/move ({single_moves} moves)")
+
+    start = time.perf_counter()
+    outcomes = resolve_batch(actions, offense_numbers, defense_numbers, archetypes, clean_passes)
+    batch_time = time.perf_counter() - start
+    print(f"resolve_batch: {batch_time / args.moves * 1e6:.3f} us/move ({args.moves} moves)")
+
+    counts = np.bincount(outcomes, minlength=len(Outcome))
+    for outcome in Outcome:
+        print(f"{outcome.name:>14}: {counts[outcome] / args.moves:6.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+In-process stand-ins for Discord and PostgreSQL, used to benchmark the cogs offline
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import random
+from collections import Counter
+from typing import Dict, List, Optional
+
+import nextcord
+
+from statements import Statements
+
+
+class Record(dict):
+    """Behaves like an asyncpg Record: subscriptable by column name, iterates over values."""
+    def __iter__(self):
+        return iter(self.values())
+
+
+# Discord
+
+class FakeAsset:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, color: int = 0):
+        self.id = role_id
+        self.name = name
+        self.color = nextcord.Colour(color)
+        self.mention = f"<@&{role_id}>"
+
+    def is_default(self) -> bool:
+        return self.name == "@everyone"
+
+    async def edit(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class FakeEmoji:
+    def __init__(self, emoji_id: int, name: str):
+        self.id = emoji_id
+        self.name = name
+
+    def __str__(self):
+        return f"<:{self.name}:{self.id}>"
+
+
+class FakeMessage:
+    def __init__(self, content: str, author, channel, guild=None):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.id = random.getrandbits(63)
+
+    async def reply(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def pin(self):
+        pass
+
+    async def unpin(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, name: str, guild=None, category=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self.category = category
+        self.topic = ""
+        self.mention = f"<#{channel_id}>"
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        return FakeMessage(content, None, self, self.guild)
+
+    def get_partial_message(self, message_id: int):
+        return FakeMessage(None, None, self, self.guild)
+
+    async def pins(self):
+        return []
+
+    async def edit(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class FakeMember:
+    def __init__(self, member_id: int, name: str, guild=None):
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.guild = guild
+        self.bot = False
+        self.roles: List[FakeRole] = []
+        self.mention = f"<@{member_id}>"
+        self.avatar = FakeAsset(f"https://cdn.example.com/avatars/{member_id}.png")
+        self.dm_channel = FakeChannel(member_id + 1, f"dm-{member_id}")
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        return await self.dm_channel.send(content, **kwargs)
+
+    async def add_roles(self, *roles):
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles):
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def edit(self, roles=None, **kwargs):
+        if roles is not None:
+            self.roles = list(roles)
+
+
+class FakeGuild:
+    """A guild with lists of roles, emojis, channels and members, and dictionary lookups by ID, like nextcord.Guild."""
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+        self.roles: List[FakeRole] = []
+        self.emojis: List[FakeEmoji] = []
+        self.channels: List[FakeChannel] = []
+        self.categories: List[FakeChannel] = []
+        self.members: List[FakeMember] = []
+        self._by_id: Dict[int, object] = {}
+        self._ids = iter(range(10 ** 6, 10 ** 9))
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add_role(self, name: str, color: int = 0) -> FakeRole:
+        role = FakeRole(self.next_id(), name, color)
+        self.roles.append(role)
+        self._by_id[role.id] = role
+        return role
+
+    async def create_role(self, name: str, **kwargs) -> FakeRole:
+        return self.add_role(name)
+
+    def add_channel(self, name: str, category: Optional[FakeChannel] = None) -> FakeChannel:
+        channel = FakeChannel(self.next_id(), name, self, category)
+        self.channels.append(channel)
+        self._by_id[channel.id] = channel
+        return channel
+
+    def add_category(self, name: str) -> FakeChannel:
+        category = FakeChannel(self.next_id(), name, self)
+        self.categories.append(category)
+        self.channels.append(category)
+        self._by_id[category.id] = category
+        return category
+
+    def add_member(self, name: str) -> FakeMember:
+        member = FakeMember(self.next_id(), name, self)
+        self.members.append(member)
+        self._by_id[member.id] = member
+        return member
+
+    def _get(self, item_id: int, kind: type):
+        item = self._by_id.get(item_id)
+        return item if isinstance(item, kind) else None
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self._get(channel_id, FakeChannel)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._get(member_id, FakeMember)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._get(role_id, FakeRole)
+
+
+class FakeContext:
+    """Just enough of commands.Context for the cogs' command callbacks."""
+    def __init__(self, bot, guild: FakeGuild, author: FakeMember, channel: FakeChannel, content: str = ""):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.message = FakeMessage(content, author, channel, guild)
+        self.invoked_subcommand = None
+        self.replies = 0
+
+    async def reply(self, *args, **kwargs):
+        self.replies += 1
+        return await self.channel.send(*args, **kwargs)
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+# PostgreSQL
+
+class FakePreparedStatement:
+    def __init__(self, database: "FakeDatabase", name: str):
+        self.database = database
+        self.name = name
+
+    async def _run(self, *args):
+        await self.database.round_trip(self.name)
+        handler = getattr(self.database, self.name, None)
+        return handler(*args) if handler else None
+
+    async def fetch(self, *args):
+        return await self._run(*args) or []
+
+    async def fetchrow(self, *args):
+        return await self._run(*args)
+
+    async def fetchval(self, *args):
+        return await self._run(*args)
+
+    async def executemany(self, args):
+        await self.database.round_trip(self.name)
+
+    def get_statusmsg(self):
+        return "UPDATE 1"
+
+
+class FakeConnection:
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+        self.prepared = {statement.name: FakePreparedStatement(database, statement.name) for statement in Statements.declared()}
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        await self.database.round_trip("BEGIN")
+        yield
+        await self.database.round_trip("COMMIT")
+
+    async def execute(self, query, *args):
+        await self.database.round_trip("execute")
+
+    async def executemany(self, query, args):
+        await self.database.round_trip("executemany")
+
+    async def fetch(self, query, *args):
+        await self.database.round_trip("fetch")
+        return []
+
+    async def copy_records_to_table(self, table, *, records, columns=None, **kwargs):
+        await self.database.round_trip(f"COPY {table}")
+
+
+class FakePool:
+    """Stands in for discord_db_client.DatabasePool. Every statement costs one round trip of the configured latency."""
+    def __init__(self, database: "FakeDatabase"):
+        self.database = database
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self.database)
+
+    def stats(self) -> dict:
+        return {}
+
+    async def close(self):
+        pass
+
+
+class FakeDatabase:
+    """
+    Holds teams, players and games in memory and answers the prepared statements the benchmarked commands use. Each
+    method is named after the statement in statements.Statements it answers; anything unanswered returns None.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = Counter()
+        self.teams: Dict[str, Record] = {}
+        self.player_rows: Dict[int, Record] = {}
+        self.games: Dict[int, Record] = {}
+
+    async def round_trip(self, name: str):
+        self.round_trips[name] += 1
+        await asyncio.sleep(self.latency)
+
+    def add_team(self, team_id: str, role_id: int, city: str, name: str, channel_id: int):
+        self.teams[team_id] = Record(teamid=team_id, roleid=role_id, city=city, name=name, logourl=None, channelid=channel_id)
+
+    def add_player(self, player_id: int, first_name: str, last_name: str, position: str, archetype: Optional[str], team_id: Optional[str]):
+        self.player_rows[player_id] = Record(playerid=player_id, firstname=first_name, lastname=last_name, playerposition=position,
+                                         playertype=archetype, playerteam=team_id, approved=True)
+
+    def add_game(self, game_id: int, home_team: str, away_team: str, stadium_id: int):
+        def roster(team_id):
+            members = {player["playerposition"]: player for player in self.player_rows.values() if player["playerteam"] == team_id}
+            return {"forward": {"playerid": members["FORWARD"]["playerid"], "playertype": members["FORWARD"]["playertype"]},
+                    "defenseman": {"playerid": members["DEFENSEMAN"]["playerid"], "playertype": members["DEFENSEMAN"]["playertype"]},
+                    "goalie": members["GOALIE"]["playerid"]}
+        self.games[game_id] = Record(gameid=game_id, hometeam=home_team, awayteam=away_team, homescore=0, awayscore=0,
+                                     homeroster=roster(home_team), awayroster=roster(away_team), movenum=0, stadium=stadium_id,
+                                     cleanpasses=0, waitingon_side="AWAY", possession="AWAY", waitingon_pos="FORWARD",
+                                     game_active=True, homedelays=0, awaydelays=0, homenumbers=None, awaynumbers=None,
+                                     deadline=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=24))
+
+    # Teams
+    def all_teams(self):
+        return list(self.teams.values())
+
+    # Players
+    def player(self, player_id):
+        return [self.player_rows[player_id]] if player_id in self.player_rows else []
+
+    def players(self, player_ids):
+        return [self.player_rows[player_id] for player_id in player_ids if player_id in self.player_rows]
+
+    def player_names(self):
+        return [Record(playerid=player["playerid"], firstname=player["firstname"], lastname=player["lastname"]) for player in self.player_rows.values()]
+
+    def player_team(self, player_id):
+        player = self.player_rows.get(player_id)
+        return player["playerteam"] if player else None
+
+    def team_members(self, team_id):
+        return [Record(playerid=player["playerid"], playerposition=player["playerposition"])
+                for player in self.player_rows.values() if player["playerteam"] == team_id]
+
+    # Games
+    def create_game(self, home_team, away_team, stadium_id):
+        game = next((game for game in self.games.values() if game["hometeam"] == home_team and game["awayteam"] == away_team), None)
+        if game is None:
+            return Record(result="roster_incomplete")
+        return Record(result="ok", new_game_id=game["gameid"], game_stadium=stadium_id or game["stadium"], game_deadline=game["deadline"],
+                      home_goalie_id=game["homeroster"]["goalie"], away_goalie_id=game["awayroster"]["goalie"])
+
+    def active_games(self):
+        return [game for game in self.games.values() if game["game_active"]]
+
+    def active_game_routes(self):
+        return [Record(gameid=game["gameid"], stadium=game["stadium"], homegoalie=game["homeroster"]["goalie"], awaygoalie=game["awayroster"]["goalie"])
+                for game in self.active_games()]
+
+    def active_game_states(self):
+        return self.active_games()
+
+    def game_state(self, game_id):
+        return self.games.get(game_id)
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark for parsing and storing goalie number lists
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Usage (from the repository root):
+    python benchmarks/number_list.py [--entries 10000 50000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from number_list import NumberList  # noqa: E402
+
+
+def json_roundtrip(text: str):
+    """Parsing into a list of ints and storing it as JSON text, for comparison."""
+    numbers = [int(entry) for entry in text.split(",")]
+    if not all(1 <= number <= 1000 for number in numbers):
+        raise ValueError
+    return json.loads(json.dumps(numbers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        text = ", ".join(str(random.randint(1, 1000)) for _ in range(entries))
+        numbers = NumberList.parse(text)
+        stored = numbers.to_bytes()
+        parse_time = min(timeit.repeat(lambda: NumberList.parse(text), number=1, repeat=args.repeat))
+        load_time = min(timeit.repeat(lambda: NumberList.from_bytes(stored), number=1, repeat=args.repeat))
+        json_time = min(timeit.repeat(lambda: json_roundtrip(text), number=1, repeat=args.repeat))
+        access_time = min(timeit.repeat(lambda: numbers.number_for_move(entries // 2), number=10_000, repeat=args.repeat)) / 10_000
+        print(f"{entries} entries:")
+        print(f"  parse + validate:      {parse_time * 1000:8.3f} ms")
+        print(f"  load from bytea:       {load_time * 1000:8.3f} ms")
+        print(f"  json list round trip:  {json_time * 1000:8.3f} ms")
+        print(f"  number_for_move:       {access_time * 1e9:8.1f} ns")
+        print(f"  stored size:           {len(stored):8d} bytes (JSON text: {len(json.dumps(list(numbers)))} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the in-memory player name search
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Usage (from the repository root):
+    python benchmarks/player_search.py [--players 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from player_search import PlayerSearch, normalize  # noqa: E402
+
+SYLLABLES = ["al", "an", "ar", "be", "bo", "ca", "da", "de", "el", "en", "er", "fa", "ga", "ha", "in", "is", "ja", "ka", "la",
+             "le", "li", "lo", "ma", "mi", "na", "ne", "ni", "no", "or", "ra", "re", "ri", "ro", "sa", "se", "son", "ta", "th",
+             "to", "va", "vi", "wa", "ya", "za"]
+
+
+def random_name() -> str:
+    return "".join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))).title()
+
+
+def linear_search(players, query: str):
+    """What the old TO_TSVECTOR(...) @@ TO_TSQUERY(...) query did: re-split every row's name on every search."""
+    query_words = normalize(query)
+    return [player_id for player_id, first_name, last_name in players
+            if all(word in normalize(f"{first_name} {last_name}") for word in query_words)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    players = [(player_id, random_name(), random_name()) for player_id in range(args.players)]
+    index = PlayerSearch(statements=None)
+    start = time.perf_counter()
+    for player_id, first_name, last_name in players:
+        index.add(player_id, first_name, last_name, keep_sorted=False)
+    index.sorted_words = sorted(index.players_by_word)  # As PlayerSearch.load() does
+    print(f"{args.players} players indexed in {(time.perf_counter() - start) * 1000:.0f} ms "
+          f"({len(index.players_by_word)} distinct words, {len(index.words_by_deletion)} deletion keys)\n")
+
+    _, first_name, last_name = random.choice(players)
+    typo = last_name[:2] + last_name[3:] if len(last_name) > 4 else last_name + "x"
+    queries = {"full name": f"{first_name} {last_name}", "last name": last_name, "prefixes": f"{first_name[:3]} {last_name[:3]}",
+               "typo": f"{first_name} {typo}", "punctuation": f"{first_name}'s & ({last_name})!"}
+    for label, query in queries.items():
+        results = index.search(query)
+        indexed = min(timeit.repeat(lambda: index.search(query), number=1, repeat=args.repeat))
+        print(f"{label:<12} {query!r:<32} {len(results):>3} results  {indexed * 1e6:9.1f} us")
+    scan = min(timeit.repeat(lambda: linear_search(players, queries["full name"]), number=1, repeat=3))
+    print(f"\nlinear scan of every name (the old query's approach): {scan * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
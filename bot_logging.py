@@ -0,0 +1,142 @@
+"""
+Logging setup for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import copy
+import datetime
+import glob
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from typing import Iterator, List, Optional
+
+LOG_FILE = "logs/bot.log"
+LOG_FORMAT = "%(asctime)s:%(levelname)s:%(name)s: %(message)s"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # The start of logging's default asctime, which the range filter parses
+TIMESTAMP_LENGTH = len("2022-01-01 00:00:00")
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue without formatting them. QueueHandler.prepare() normally formats on the calling thread,
+    which here is the event loop; this only resolves the message arguments, so mutable arguments are captured as they
+    are now, and leaves the formatting to the listener thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates when the file reaches max_bytes or has been open for rotate_interval seconds, whichever comes first, and
+    gzips the rotated files (bot.log.1.gz, bot.log.2.gz, ...). Runs on the QueueListener thread, so compression never
+    blocks the event loop.
+    """
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, rotate_interval: Optional[float] = None):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_interval = rotate_interval
+        self.opened_at = time.time()
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, destination: str):
+        with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:
+            shutil.copyfileobj(source_file, destination_file)
+        os.remove(source)
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if self.rotate_interval is not None and time.time() - self.opened_at >= self.rotate_interval:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+def setup_logging(loggers: List[logging.Logger], filename: str = LOG_FILE, max_bytes: int = 5_000_000, backup_count: int = 10,
+                  rotate_interval: Optional[float] = 86400.0) -> logging.handlers.QueueListener:
+    """
+    Routes the given loggers through a queue to a rotating file written by a background thread. The previous run's
+    log is rotated out (not truncated) at startup. Returns the started listener; stop it on shutdown to flush the queue.
+    """
+    file_handler = CompressedRotatingFileHandler(filename, max_bytes, backup_count, rotate_interval)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if os.path.exists(filename) and os.path.getsize(filename) > 0:
+        file_handler.doRollover()
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    for logger in loggers:
+        logger.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def log_files(filename: str = LOG_FILE) -> List[str]:
+    """Returns the current log file and its rotated predecessors, oldest first."""
+    rotated = glob.glob(f"{glob.escape(filename)}.*.gz")
+    rotated.sort(key=lambda path: int(path[len(filename) + 1:-len(".gz")]), reverse=True)
+    return rotated + ([filename] if os.path.exists(filename) else [])
+
+
+def tail(filename: str, lines: int, block_size: int = 65536) -> bytes:
+    """Returns the last lines of a log file, reading backwards in blocks instead of the whole file."""
+    with open(filename, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= lines:
+            step = min(block_size, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    return b"\n".join(data.splitlines()[-lines:]) + b"\n" if data else b""
+
+
+def _lines(path: str) -> Iterator[str]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as file:
+        yield from file
+
+
+def between(start: datetime.datetime, end: datetime.datetime, filename: str = LOG_FILE) -> Iterator[str]:
+    """
+    Yields every log line written from start up to end, across the current and rotated files. Lines without a timestamp
+    of their own (such as the rest of a traceback) belong to the record above them.
+    """
+    start_text, end_text = start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+    for path in log_files(filename):
+        inside = False
+        for line in _lines(path):
+            timestamp = line[:TIMESTAMP_LENGTH]
+            if len(timestamp) == TIMESTAMP_LENGTH and timestamp[4] == "-" and timestamp[10] == " ":
+                if timestamp > end_text:
+                    return
+                inside = timestamp >= start_text
+            if inside:
+                yield line
@@ -16,8 +16,12 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from asyncio import TimeoutError
+import asyncio
 import inspect
+import io
+import os
+import tempfile
+import time
 from datetime import datetime
 from time import mktime
 from typing import Optional, Union
@@ -25,11 +29,33 @@ from typing import Optional, Union
 import nextcord
 from nextcord.ext import commands
 
+import bot_logging
+import events
+import season_import
 from discord_db_client import Bot
-from util import fancy_archetype_name
+from engine import GameState
+from game_store import ActiveGame
+from metrics import KINDS, STATEMENT
+from scoreboard import GamePages
+from stats import PLAYER_COLUMNS
+from util import MOVES_PER_GAME, fancy_archetype_name
 
 
+MAX_SEARCH_RESULTS = 10
+MAX_UPLOAD_SIZE = 8_000_000  # Discord's attachment limit for servers without boosts
 QUESTION_MARK = "https://upload.wikimedia.org/wikipedia/commons/thumb/b/b0/Question_mark2.svg/1580px-Question_mark2.svg.png"
+CREATE_GAME_ERRORS = {
+    "same_team": "Error: A team cannot play against itself.",
+    "team_not_found": "Error: Home and/or away team not found.",
+    "no_stadium": "Error: Home team has no stadium.",
+    "stadium_in_use": "Error: Stadium is already in use!",
+    "team_in_game": "Error: One or both of the teams are in an existing match!",
+    "roster_incomplete": "Error: One or more of the teams has one or more unfilled positions. Game cannot begin.",
+}
+STAT_NAMES = {  # player_stats column -> how it is shown
+    "moves": "Moves", "passes": "Passes", "completedpasses": "Completed Passes", "dekes": "Dekes", "completeddekes": "Completed Dekes",
+    "shots": "Shots", "goals": "Goals", "turnovers": "Turnovers", "shotsfaced": "Shots Faced", "saves": "Saves", "goalsagainst": "Goals Against",
+}
 
 
 class TeamManagement(commands.Cog, name="Team Management"):
@@ -41,19 +67,19 @@ class TeamManagement(commands.Cog, name="Team Management"):
     async def team_info(self, ctx, team_id: Optional[str] = None):
         """Displays information about a specified team."""
         if team_id is None:  # If user does not specify a team, try to fetch their current team (if they have one) rather than immediately throwing error
-            author_associated_team = await self.bot.db.fetchval("""SELECT playerteam FROM players WHERE playerid = $1""", ctx.author.id)
+            author_associated_team = await self.bot.statements.player_team(ctx.author.id)
             if author_associated_team is None:
                 return await ctx.reply("Error: Please specify a team.")
             team_id = author_associated_team
         team_id = team_id.upper()
-        team_record = await self.bot.db.fetchrow("""SELECT roleid, logourl, city, name, channelid FROM teams WHERE teamid = $1""", team_id)
-        if team_record is None:
+        team = self.bot.teams.get(team_id)
+        if team is None:
             return await ctx.reply("Error: your team ID is invalid.")
-        if team_record["channelid"] is None:
+        if team.channel_id is None:
             home_stadium = "*None*"
         else:
-            home_stadium = self.bot.get_channel(team_record["channelid"]).mention
-        team_members = await self.bot.db.fetch("""SELECT playerid, playerposition FROM players WHERE playerteam = $1""", team_id)
+            home_stadium = self.bot.get_channel(team.channel_id).mention
+        team_members = await self.bot.statements.team_members(team_id)
         forward, defenseman, goalie = "*None*", "*None*", "*None*"
         for player in team_members:
             if player["playerposition"] == "FORWARD":
@@ -62,12 +88,12 @@ class TeamManagement(commands.Cog, name="Team Management"):
                 defenseman = self.bot.get_user(player["playerid"]).mention if self.bot.get_user(player["playerid"]) else "Unknown player with ID " + player["playerid"]
             if player["playerposition"] == "GOALIE":
                 goalie = self.bot.get_user(player["playerid"]).mention if self.bot.get_user(player["playerid"]) else "Unknown player with ID " + player["playerid"]
-        color = nextcord.utils.get(ctx.guild.roles, id=team_record["roleid"]).color
-        embed = nextcord.Embed(color=color, title=f"{team_record['city']} {team_record['name']} Team Info")
-        embed.set_thumbnail(url=team_record["logourl"] or QUESTION_MARK)
+        color = ctx.guild.get_role(team.role_id).color
+        embed = nextcord.Embed(color=color, title=f"{team.full_name} Team Info")
+        embed.set_thumbnail(url=team.logo_url or QUESTION_MARK)
         embed.add_field(name="Team ID", value=team_id, inline=False)
-        embed.add_field(name="City", value=team_record["city"])
-        embed.add_field(name="Name", value=team_record["name"], inline=True)
+        embed.add_field(name="City", value=team.city)
+        embed.add_field(name="Name", value=team.name, inline=True)
         embed.add_field(name="Home Stadium", value=home_stadium, inline=True)
         embed.add_field(name="Forward", value=str(forward), inline=True)
         embed.add_field(name="Defenseman", value=str(defenseman), inline=True)
@@ -81,8 +107,8 @@ class TeamManagement(commands.Cog, name="Team Management"):
             return await ctx.reply("Error: Team ID too long. Team IDs must be a maximum of 3 characters.")
         team_id = team_id.upper()
         role = await ctx.guild.create_role(name="Team Name", hoist=True)
-        # await self.bot.statements.add_new_team.fetch(team_id, role.id)
-        await self.bot.write("""INSERT INTO teams (teamid, roleid) VALUES ($1, $2)""", team_id, role.id)
+        team_record = await self.bot.statements.insert_team(team_id, role.id)
+        self.bot.teams.add(team_record)
         embed = nextcord.Embed(color=0, title="Team Name Info")
         embed.set_thumbnail(url=QUESTION_MARK)
         embed.add_field(name="Team ID", value=team_id, inline=False)
@@ -117,51 +143,119 @@ class TeamManagement(commands.Cog, name="Team Management"):
     @edit_team.command()
     async def city(self, ctx, team_id: str, *, new_city: str):
         team_id = team_id.upper()
-        team_record = await self.bot.db.fetchrow("""SELECT name, roleid FROM teams WHERE teamid = $1""", team_id)
-        if team_record is None:
+        team = self.bot.teams.get(team_id)
+        if team is None:
             return await ctx.reply("Error: your team ID is invalid.")
-        await self.bot.write("""UPDATE teams SET city = $1 WHERE teamid = $2""", new_city, team_id)
-        role = nextcord.utils.get(ctx.guild.roles, id=team_record["roleid"])
-        await role.edit(name=f"{new_city} {team_record['name']}")
-        return await ctx.reply(f"Success: Team name is now {new_city} {team_record['name']}.")
+        await self.bot.statements.set_team_city(new_city, team_id)
+        self.bot.teams.update(team_id, city=new_city)
+        role = ctx.guild.get_role(team.role_id)
+        self.bot.mutations.edit_role(role, name=team.full_name)
+        return await ctx.reply(f"Success: Team name is now {team.full_name}.")
 
     @edit_team.command()
     async def name(self, ctx, team_id: str, *, new_name: str):
         team_id = team_id.upper()
-        team_record = await self.bot.db.fetchrow("""SELECT city, roleid FROM teams WHERE teamid = $1""", team_id)
-        if team_record is None:
+        team = self.bot.teams.get(team_id)
+        if team is None:
             return await ctx.reply("Error: your team ID is invalid.")
-        await self.bot.write("""UPDATE teams SET name = $1 WHERE teamid = $2""", new_name, team_id)
-        role = nextcord.utils.get(ctx.guild.roles, id=team_record["roleid"])
-        await role.edit(name=f"{team_record['city']} {new_name}")
-        return await ctx.reply(f"Success: Team name is now {team_record['city']} {new_name}.")
+        await self.bot.statements.set_team_name(new_name, team_id)
+        self.bot.teams.update(team_id, name=new_name)
+        role = ctx.guild.get_role(team.role_id)
+        self.bot.mutations.edit_role(role, name=team.full_name)
+        return await ctx.reply(f"Success: Team name is now {team.full_name}.")
 
     @edit_team.command()
     async def stadium(self, ctx, team_id: str, new_stadium: nextcord.TextChannel):
         team_id = team_id.upper()
-        if not await self.bot.statements.team_exists(team_id):
+        if not self.bot.teams.exists(team_id):
             return await ctx.reply("Error: your team ID is invalid.")
-        await self.bot.write("""UPDATE teams SET channelid = $1 WHERE teamid = $2""", new_stadium.id, team_id)
+        await self.bot.statements.set_team_stadium(new_stadium.id, team_id)
+        self.bot.teams.update(team_id, channel_id=new_stadium.id)
         return await ctx.reply(f"Success: {new_stadium.mention} is now the specified team's home stadium.")
 
     @edit_team.command()
     async def logo(self, ctx, team_id: str, *, logo_url: str):
         team_id = team_id.upper()
-        if not await self.bot.statements.team_exists(team_id):
+        if not self.bot.teams.exists(team_id):
             return await ctx.reply("Error: your team ID is invalid.")
-        await self.bot.write("""UPDATE teams SET logourl = $1 WHERE teamid = $2""", logo_url, team_id)
+        await self.bot.statements.set_team_logo(logo_url, team_id)
+        self.bot.teams.update(team_id, logo_url=logo_url)
         return await ctx.reply(f"Success: Changed the specified team's logo.")
 
     @edit_team.command(aliases=['colour'])
     async def color(self, ctx, team_id: str, new_color: str):
         team_id = team_id.upper()
-        role_id = await self.bot.db.fetchval("""SELECT roleid FROM teams WHERE teamid = $1""", team_id)
+        role_id = self.bot.teams.role_id(team_id)
         if role_id is None:
             return await ctx.reply("Error: your team ID is invalid.")
-        role = nextcord.utils.get(ctx.guild.roles, id=role_id)
-        await role.edit(color=int(new_color, 16))
+        role = ctx.guild.get_role(role_id)
+        self.bot.mutations.edit_role(role, color=nextcord.Colour(int(new_color, 16)))
         return await ctx.reply(f"Success: Team color changed.")
 
+    @commands.command(name="importseason")
+    @commands.has_role("bot operator")
+    async def import_season(self, ctx, mode: Optional[str] = None):
+        """Imports teams and rosters from attached CSV or JSON files (see season_import.py). Use "importseason dryrun" to preview."""
+        if not ctx.message.attachments:
+            return await ctx.reply("Error: Please attach the season's CSV or JSON files to the command.")
+        dry_run = mode is not None and mode.lower() in ("dryrun", "dry-run", "preview")
+        try:
+            season = season_import.parse_season({attachment.filename: (await attachment.read()).decode("utf-8-sig")
+                                                 for attachment in ctx.message.attachments})
+        except (season_import.SeasonFileError, UnicodeDecodeError) as error:
+            return await ctx.reply(f"Error: The files could not be imported:\n{str(error)[:1800]}")
+        current_teams, current_players = await season_import.current_rows(self.bot.db.fetch, season)
+        missing = season_import.unknown_teams(season, current_teams)
+        if missing:
+            return await ctx.reply(f"Error: Players are rostered to teams that do not exist: {', '.join(missing)}")
+        unnamed = season_import.unnamed_teams(season, current_teams)
+        if unnamed:
+            return await ctx.reply(f"Error: New teams need a city and a name: {', '.join(unnamed)}")
+
+        discord_plan = season_import.DiscordPlan(self.bot, ctx.guild, season)
+        if dry_run:
+            discord_plan.plan_members()
+            plan = season_import.plan_database(season, current_teams, current_players)
+            lines = (["Database:"] + (plan.describe() or ["No changes"]) + ["", "Discord:"]
+                     + ([job.description for job in discord_plan.create + discord_plan.update] or ["No changes"])
+                     + (["", "Warnings:"] + discord_plan.warnings if discord_plan.warnings else []))
+            return await ctx.reply(f"Dry run: {len(plan.describe())} database and {len(discord_plan.create) + len(discord_plan.update)} Discord changes.",
+                                   file=nextcord.File(io.BytesIO("\n".join(lines).encode("utf-8")), filename="season_import.txt"))
+
+        progress_message = await ctx.reply("Importing season...")
+        last_edit = 0.0
+
+        async def progress(stage: str, done: int, total: int):
+            nonlocal last_edit
+            if done == total or time.monotonic() - last_edit > 2:  # Keep progress edits well under the rate limit
+                last_edit = time.monotonic()
+                await progress_message.edit(content=f"Importing season... {stage}: {done}/{total}")
+
+        failures = await season_import.run_jobs(discord_plan.create, progress=lambda done, total: progress("roles and channels", done, total),
+                                                logger=self.bot.logger)
+        if failures:
+            return await progress_message.edit(content="Error: Nothing was imported, since these roles or channels could not be created:\n"
+                                                       + "\n".join(failures)[:1800])
+        plan = season_import.plan_database(season, current_teams, current_players)
+        try:
+            async with self.bot.db.acquire() as connection:
+                await season_import.import_rows(connection, plan, current_teams)
+        except season_import.SeasonFileError as error:
+            return await progress_message.edit(content=f"Error: The import was rolled back:\n{str(error)[:1800]}")
+        await self.bot.teams.refresh()
+        await self.bot.player_search.load()
+
+        discord_plan.plan_members()
+        failures = await season_import.run_jobs(discord_plan.update, progress=lambda done, total: progress("roles", done, total),
+                                                logger=self.bot.logger)
+        self.bot.logger.info(f"{ctx.author} imported a season: {len(plan.describe())} database and "
+                             f"{len(discord_plan.create) + len(discord_plan.update)} Discord changes")
+        report = [f"Success: Season imported. {len(plan.new_teams)} new and {len(plan.changed_teams)} changed teams, "
+                  f"{len(plan.new_players)} new and {len(plan.changed_players)} changed players, "
+                  f"{len(discord_plan.create) + len(discord_plan.update) - len(failures)} Discord changes."]
+        report += [f"Failed: {failure}" for failure in failures] + [f"Warning: {warning}" for warning in discord_plan.warnings]
+        return await progress_message.edit(content="\n".join(report)[:2000])
+
     @commands.group()
     @commands.has_role("bot operator")
     async def roster(self, ctx):
@@ -174,25 +268,22 @@ class TeamManagement(commands.Cog, name="Team Management"):
     @roster.command()
     async def add(self, ctx, team_id: str, player: nextcord.Member):
         team_id = team_id.upper()
-        if not await self.bot.statements.team_exists(team_id):
+        if not self.bot.teams.exists(team_id):
             return await ctx.reply("""Error: Team does not exist.""")
-        player_record = await self.bot.db.fetchrow("""SELECT CONCAT(firstname, ' ', lastname) AS fullname, approved, playerposition FROM players WHERE playerid = $1""",
-                                                   player.id)
+        player_record = await self.bot.statements.player_roster_info(player.id)
         if player_record is None:
             return await ctx.reply("Error: Player has not registered.")
         if not player_record["approved"]:
             return await ctx.reply("Error: Player has not been approved.")
-        team_position_filled = await self.bot.db.fetchval("""SELECT EXISTS(SELECT 1 FROM players WHERE playerteam = $1 AND playerposition = $2)""",
-                                                          team_id, player_record['playerposition'])
+        team_position_filled = await self.bot.statements.team_position_filled(team_id, player_record['playerposition'])
         if team_position_filled:
             return await ctx.reply(f"Error: Position is already filled."
                                    f"Please use command `{self.bot.command_prefix}roster remove [{team_id.upper()}] [{player_record['playerposition'].lower()}]`"
                                    f"to remove existing player from team.")
-        role_id = await self.bot.db.fetchval("""SELECT roleid FROM teams WHERE teamid = $1""", team_id)
-        role = nextcord.utils.get(ctx.guild.roles, id=role_id)
-        await player.add_roles(role)
+        role = ctx.guild.get_role(self.bot.teams.role_id(team_id))
+        self.bot.mutations.add_roles(player, role)
         self.bot.logger.info(f"{ctx.author} added {player} to team {team_id}")
-        await self.bot.write("""UPDATE players SET playerteam = $1 WHERE playerid = $2""", team_id, player.id)
+        await self.bot.statements.set_player_team(team_id, player.id)
         return await ctx.reply(f"Success: {player_record['fullname']} has been rostered for {team_id}.")
 
     @roster.command(aliases=["cut"])
@@ -202,24 +293,20 @@ class TeamManagement(commands.Cog, name="Team Management"):
                 raise commands.MissingRequiredArgument(inspect.Parameter("position", inspect.Parameter.POSITIONAL_OR_KEYWORD))
             team_id_or_player = team_id_or_player.upper()
             position = position.upper()
-            if not await self.bot.statements.team_exists(team_id_or_player):
+            if not self.bot.teams.exists(team_id_or_player):
                 return await ctx.reply("""Error: Team does not exist.""")
-            player_id = await self.bot.db.fetchval("""SELECT playerid FROM players WHERE playerteam = $1 AND playerposition = $2""", team_id_or_player, position)
-            player_name = await self.bot.db.fetchval("""SELECT CONCAT(firstname, ' ', lastname) AS fullname FROM players WHERE playerid = $1""", player_id)
-            role_id = await self.bot.db.fetchval("""SELECT roleid FROM teams WHERE teamid = $1""", team_id_or_player)  # TODO: Convert all this to one joined expression
-            team_id_or_player = nextcord.utils.get(ctx.guild.members, id=player_id)
+            player_id = await self.bot.statements.team_player_at_position(team_id_or_player, position)
+            player_name = await self.bot.statements.player_full_name(player_id)
+            role_id = self.bot.teams.role_id(team_id_or_player)
+            team_id_or_player = ctx.guild.get_member(player_id)
         else:
             player_id = team_id_or_player.id
-            player_name = await self.bot.db.fetchval("""SELECT CONCAT(firstname, ' ', lastname) AS fullname FROM players WHERE playerid = $1""", player_id)
-            role_id = await self.bot.db.fetchval("""SELECT roleid
-                                                    FROM teams
-                                                    WHERE teamid = (
-                                                        SELECT playerteam FROM players WHERE playerid = $1
-                                                    )""", team_id_or_player.id)
-        await self.bot.write("""UPDATE players SET playerteam = $1 WHERE playerid = $2""", None, player_id)
-        team_role = nextcord.utils.get(ctx.guild.roles, id=role_id)
+            player_name, player_team = await self.bot.statements.player_name_and_team(player_id) or (None, None)
+            role_id = self.bot.teams.role_id(player_team) if player_team else None
+        await self.bot.statements.set_player_team(None, player_id)
+        team_role = ctx.guild.get_role(role_id)
         if team_id_or_player:
-            await team_id_or_player.remove_roles(team_role)
+            self.bot.mutations.remove_roles(team_id_or_player, team_role)
         return await ctx.reply(f"Success: {player_name} has been removed from {team_role.name}.")
 
     @roster.error
@@ -237,28 +324,31 @@ class PlayerManagement(commands.Cog, name="Player Management"):
     """Manage and edit individual players."""
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.active_registrations = []
 
     @commands.command(name="playerinfo")
     async def player_info(self, ctx, player: Optional[nextcord.Member] = None, *, player_string: Optional[str] = None):
         """Displays information about a player."""
         player = ctx.author if player is None and player_string is None else player  # player defaults to the author if neither a string or mention is provided
         if player is None:
-            players = await self.bot.db.fetch("""SELECT * FROM players WHERE TO_TSVECTOR(CONCAT(firstname, ' ', lastname)) @@ TO_TSQUERY($1)""",
-                                              player_string.replace(" ", " & "))
+            results = self.bot.player_search.search(player_string, limit=MAX_SEARCH_RESULTS)
+            exact_results = [result for result in results if result.exact]
+            if len(exact_results) == 1:  # A full name match wins over partial and fuzzy matches
+                results = exact_results
+            players = await self.bot.statements.players([result.player_id for result in results]) if results else []
+            order = {result.player_id: position for position, result in enumerate(results)}
+            players.sort(key=lambda record: order[record["playerid"]])
         else:
-            players = await self.bot.db.fetch("""SELECT * FROM players WHERE playerid = $1""", player.id)
+            players = await self.bot.statements.player(player.id)
         if len(players) == 0:
             return await ctx.reply("Error: Your search turned up no results.")
         if len(players) != 1:
             list_of_players = "\n".join(f"{x['firstname']} {x['lastname']} (ID: {x['playerid']})" for x in players)
             return await ctx.reply(f"Error: Your search turned up multiple results:\n{list_of_players}\nPlease refine your query or mention the user directly.")
         player_record = players[0]
-        player = nextcord.utils.get(ctx.message.guild.members, id=player_record["playerid"])
+        player = ctx.message.guild.get_member(player_record["playerid"])
         if player_record["playerteam"]:
-            teaminfo = await self.bot.db.fetchrow("""SELECT city, name, roleid FROM teams WHERE teamid = $1""", player_record["playerteam"])
-            team_full_name = f"{teaminfo['city']} {teaminfo['name']}"
-            color = nextcord.utils.get(ctx.message.guild.roles, name=team_full_name).color
+            team_full_name = self.bot.teams.get(player_record["playerteam"]).full_name
+            color = self.bot.guild_indexes.get(ctx.message.guild).role_named(team_full_name).color
         else:
             team_full_name = "Free Agent"
             color = 0
@@ -279,164 +369,48 @@ class PlayerManagement(commands.Cog, name="Player Management"):
 
     @commands.command()
     async def register(self, ctx):
-        player_already_registered = await self.bot.db.fetchval("""SELECT EXISTS(SELECT 1 FROM players WHERE playerid = $1)""", ctx.author.id)
+        player_already_registered = await self.bot.statements.player_registered(ctx.author.id)
         if player_already_registered:
             return await ctx.reply(f"Error: You have already registered. Please ask a commissioner for help with changing your player.")
-        if ctx.author.id in self.active_registrations:
-            return await ctx.reply("Error: You have an active registration process still going on."
+        if self.bot.registrations.in_progress(ctx.author.id):
+            return await ctx.reply("Error: You have an active registration process still going on. "
                                    "Reply to your registration message with \"ABORT\" and run this command again to start over.")
-        embed = nextcord.Embed(color=0, title="New Player Registration")
-        embed.set_thumbnail(url=ctx.author.avatar.url)
-        embed.set_footer(text="Reply with \"ABORT\" at any time to cancel registration or start over.")
-        embed.add_field(name="First Name", value="*None*")
-        embed.add_field(name="Last Name", value="*None*")
-        embed.add_field(name="Position", value="*None*")
-        initial_message = await ctx.author.send(content="Player registration has started."
-                                                "Please reply to this message with what you want your `First Name` to be.",
-                                                embed=embed)
+        await self.bot.registrations.start(ctx)
         await ctx.reply("Please check your DMs for more details.")
-        self.active_registrations.append(ctx.author.id)
-        self.bot.logger.info(f"Registration process has started for {ctx.author}")
-
-        async def abort(abort_message):
-            self.active_registrations.remove(ctx.author.id)
-            embed.clear_fields()
-            embed.description = "Registration aborted."
-            await initial_message.edit(content="Registration aborted.", embed=embed)
-            self.bot.logger.info(f"{ctx.author} aborted registration")
-            return await abort_message.reply("Registration aborted successfully!")
-
-        def check(m):
-            return m.channel == initial_message.channel
-
-        def reaction_check(reaction, user):
-            return reaction.message.channel == initial_message.channel and user == ctx.author and reaction.emoji in ["✅", "❌"]
-
-        try:
-            message = await self.bot.wait_for("message", timeout=600.0, check=check)
-            first_name = message.content
-            if first_name == "ABORT":
-                return await abort(message)
-            embed.set_field_at(0, name="First Name", value=first_name)
-            await initial_message.edit(content="Please reply to this message with what you want your `Last Name` to be.", embed=embed)
-            message = await self.bot.wait_for("message", timeout=600.0, check=check)
-            last_name = message.content
-            if last_name == "ABORT":
-                return await abort(message)
-            embed.set_field_at(1, name="Last Name", value=last_name)
-            await initial_message.edit(content="Please reply to this message with what you want your `Position` to be. You can choose from:\n"
-                                               "Forward (offense)\n"
-                                               "Defenseman (defense)\n"
-                                               "Goalie", embed=embed)
-            while True:
-                message = await self.bot.wait_for("message", timeout=600.0, check=check)
-                position = message.content.upper()
-                if position == "ABORT":
-                    return await abort(message)
-                if position not in ["GOALIE", "FORWARD", "DEFENSEMAN"]:
-                    await message.reply("Error: Please type a valid position in your message. Positions include:\n"
-                                        "Forward (offense)\n"
-                                        "Defenseman (defense)\n"
-                                        "Goalie")
-                    continue
-                embed.set_field_at(2, name="Position", value=position.title())
-                break
-            archetype = None
-            formatted_archetype = None  # Seperate value formatted_archetype will track simplified archetype name for database
-            if position != "GOALIE":
-                embed.add_field(name="Archetype", value="*None*")
-                if position == "DEFENSEMAN":
-                    await initial_message.edit(content="Please reply to this message with what you want your `Archetype` to be. You can choose from:\n"
-                                                       "Enforcer (bonus to passing ranges)\n"
-                                                       "Offensive Defenseman (bonus to shooting ranges)\n"
-                                                       "Finesser (bonus to deking ranges)", embed=embed)
-                else:
-                    await initial_message.edit(content="Please reply to this message with what you want your `Archetype` to be. You can choose from:\n"
-                                                       "Playmaker (bonus to passing ranges)\n"
-                                                       "Sniper (bonus to shooting ranges)\n"
-                                                       "Dangler (bonus to deking ranges)", embed=embed)
-                while True:
-                    message = await self.bot.wait_for("message", timeout=600.0, check=check)
-                    archetype = message.content.upper()
-                    if archetype == "ABORT":
-                        return await abort(message)
-                    if archetype in ["ENFORCER", "PLAYMAKER"]:
-                        formatted_archetype = "PASSER"
-                    if archetype in ["OFFENSIVE DEFENSEMAN", "SNIPER"]:
-                        formatted_archetype = "SHOOTER"
-                    if archetype in ["FINESSER", "DANGLER"]:
-                        formatted_archetype = "DEKER"
-                    if formatted_archetype is None:
-                        await message.reply("Error: Please type a valid archetype in your message. Archetypes include:"
-                                            "Playmaker (bonus to passing ranges)\n"
-                                            "Sniper (bonus to shooting ranges)\n"
-                                            "Dangler (bonus to deking ranges)")
-                        continue
-                    embed.set_field_at(3, name="Archetype", value=archetype.title())
-                    break
-            await initial_message.add_reaction("✅")
-            await initial_message.add_reaction("❌")
-            await initial_message.edit(content="Your application has finished. Send it to the Commissioners' Office for approval?", embed=embed)
-            approval_reaction = await self.bot.wait_for("reaction_add", timeout=600.0, check=reaction_check)
-            if approval_reaction == "❌":
-                return await abort(initial_message)
-            self.active_registrations.remove(ctx.author.id)
-            await initial_message.edit("Registration finished. Sending to Commissioners' Office.")
-            await self.bot.write("""INSERT INTO players
-                                    (playerid, playerposition, playertype, firstname, lastname)
-                                    VALUES ($1, $2, $3, $4, $5)""",
-                                 ctx.author.id, position, formatted_archetype, first_name, last_name)
-            approval_channel = nextcord.utils.get(ctx.message.guild.channels, name="new-player-approvals")
-            embed = nextcord.Embed(color=0, title="New Application")
-            embed.set_thumbnail(url=ctx.author.avatar.url)
-            embed.add_field(name="Name", value=f"{first_name} {last_name}")
-            embed.add_field(name="Position", value=position.title())
-            if archetype is not None:
-                embed.add_field(name="Archetype", value=archetype.title())
-            embed.add_field(name="User", value=ctx.author.mention, inline=False)
-            return await approval_channel.send(content=f"New application received. "
-                                                       f"Issue command `{self.bot.command_prefix}approve {ctx.author.id}` to approve the application and "
-                                                       f"`{self.bot.command_prefix}reject {ctx.author.id} [reason]` to reject.", embed=embed)
-        except TimeoutError:
-            self.active_registrations.remove(ctx.author.id)
-            embed.clear_fields()
-            embed.description = "Registration timed out."
-            await initial_message.edit(content="Registration automatically abandoned.", embed=embed)
-            self.bot.logger.info(f"{ctx.author}'s registration timed out")
-            return await ctx.author.send("There have been 10 minutes since the last reply.\n"
-                                         "Registration has automatically terminated. Please restart the registration process.")
 
     @commands.command()
     @commands.has_role("bot operator")
     async def approve(self, ctx, player_id: int):
-        player = await self.bot.db.fetchrow("""SELECT playerposition, playertype, lastname, approved FROM players WHERE playerid = $1""", player_id)
-        player_member = nextcord.utils.get(ctx.guild.members, id=player_id)
+        player = await self.bot.statements.player_approval_info(player_id)
+        player_member = ctx.guild.get_member(player_id)
         if player is None:
             return await ctx.reply("Error: Player not found.")
         if player["approved"]:
             return await ctx.reply("Error: Player already approved.")
         if player_member is None:
-            await self.bot.write("""DELETE FROM players WHERE playerid = $1""", player_id)
+            await self.bot.statements.delete_player(player_id)
+            self.bot.player_search.remove(player_id)
             return await ctx.reply("Error: Player has left the server. Application automatically deleted from database.")
         await player_member.send("Your application has been approved by a member of the Commissioners' Office.\nYou are now free to sign with a team.")
-        await player_member.add_roles(nextcord.utils.get(ctx.guild.roles, name=player["playerposition"].title()))
+        self.bot.mutations.add_roles(player_member, self.bot.guild_indexes.get(ctx.guild).role_named(player["playerposition"].title()))
         # await self.bot.webhook_template_tweet("media",
         #                                       f"{player['playerposition'].lower()}_joined{'_'+player['playertype'].lower() if player['playertype'] else ''}",
         #                                       user=player_member.mention,
         #                                       last_name=player["lastname"])
-        await self.bot.write("""UPDATE players SET approved = 't' WHERE playerid = $1""", player_id)
+        await self.bot.statements.approve_player(player_id)
         return await ctx.reply("Player successfully approved.")
 
     @commands.command()
     @commands.has_role("bot operator")
     async def reject(self, ctx, player_id: int, *, reason: Optional[str] = None):
-        player_approved = await self.bot.db.fetchval("""SELECT approved FROM players WHERE playerid = $1""", player_id)
-        player_member = nextcord.utils.get(ctx.message.guild.members, id=player_id)
+        player_approved = await self.bot.statements.player_approved(player_id)
+        player_member = ctx.message.guild.get_member(player_id)
         if player_approved is None:
             return await ctx.reply("Error: Player not found.")
         if player_approved:
             return await ctx.reply(f"Error: Player already approved. Please use command {self.bot.command_prefix}deleteplayer to delete the player.")
-        await self.bot.write("""DELETE FROM players WHERE playerid = $1""", player_id)
+        await self.bot.statements.delete_player(player_id)
+        self.bot.player_search.remove(player_id)
         if player_member is None:
             return await ctx.reply("Error: Player has left the server. Application automatically deleted from database.")
         if reason:
@@ -466,18 +440,20 @@ class PlayerManagement(commands.Cog, name="Player Management"):
 
     @edit_player.command(name="firstname")
     async def first_name(self, ctx, player: nextcord.Member, *, new_name: str):
-        player_last_name = await self.bot.db.fetchval("""SELECT lastname FROM players WHERE playerid = $1""", player.id)
+        player_last_name = await self.bot.statements.player_last_name(player.id)
         if player_last_name is None:
             return await ctx.reply("Error: Player has not registered. Please tell the player to register or add them manually.")
-        await self.bot.write("""UPDATE players SET firstname = $1 WHERE playerid = $2""", new_name, player.id)
+        await self.bot.statements.set_player_first_name(new_name, player.id)
+        self.bot.player_search.rename(player.id, first_name=new_name)
         return await ctx.reply(f"Success: Player name is now {new_name} {player_last_name}.")
 
     @edit_player.command(name="lastname")
     async def last_name(self, ctx, player: nextcord.Member, *, new_name: str):
-        player_first_name = await self.bot.db.fetchval("""SELECT firstname FROM players WHERE playerid = $1""", player.id)
+        player_first_name = await self.bot.statements.player_first_name(player.id)
         if player_first_name is None:
             return await ctx.reply("Error: Player has not registered. Please tell the player to register or add them manually.")
-        await self.bot.write("""UPDATE players SET lastname = $1 WHERE playerid = $2""", new_name, player.id)
+        await self.bot.statements.set_player_last_name(new_name, player.id)
+        self.bot.player_search.rename(player.id, last_name=new_name)
         return await ctx.reply(f"Success: Player name is now {player_first_name} {new_name}.")
 
     @edit_player.command()
@@ -485,27 +461,25 @@ class PlayerManagement(commands.Cog, name="Player Management"):
         position = position.upper()
         if position not in ["FORWARD", "DEFENSEMAN", "GOALIE"]:
             return await ctx.reply("Error: You did not enter a valid position. Please try again.")
-        player_record = await self.bot.db.fetchrow("""SELECT CONCAT(firstname, ' ', lastname) AS fullname, playerteam, playerposition, playertype
-                                                      FROM players WHERE playerid = $1""",
-                                                   player.id)
+        player_record = await self.bot.statements.player_position_info(player.id)
         if player_record is None:
             return await ctx.reply("Error: Player has not registered. Please tell the player to register or add them manually.")
         if player_record["playerposition"] == position:
             return await ctx.reply("Error: Player is already this position.")
         if player_record["playerteam"]:
-            target_position_filled = await self.bot.db.fetchval("""SELECT EXISTS(SELECT 1 FROM players WHERE playerteam = $1 AND playerposition = $2)""",
-                                                                player_record["playerteam"], position)
+            target_position_filled = await self.bot.statements.team_position_filled(player_record["playerteam"], position)
             if target_position_filled:
                 return await ctx.reply("Error: Cannot move player within team. Please either empty the target position or make the player a free agent.")
         if position == "GOALIE":
             new_archetype = None
         else:
             new_archetype = "PASSER" if player_record["playerposition"] == "GOALIE" else player_record["playertype"]
-        await self.bot.write("""UPDATE players SET playerposition = $1, playertype = $2 WHERE playerid = $3""", position, new_archetype, player.id)
-        old_role = nextcord.utils.get(ctx.guild.roles, name=player_record["playerposition"].title())
-        new_role = nextcord.utils.get(ctx.guild.roles, name=position.title())
-        await player.remove_roles(old_role)
-        await player.add_roles(new_role)
+        await self.bot.statements.set_player_position(position, new_archetype, player.id)
+        old_role = self.bot.guild_indexes.get(ctx.guild).role_named(player_record["playerposition"].title())
+        new_role = self.bot.guild_indexes.get(ctx.guild).role_named(position.title())
+        # Queued back to back, so the swap goes out as a single edit of the member's roles
+        self.bot.mutations.remove_roles(player, old_role)
+        self.bot.mutations.add_roles(player, new_role)
         return await ctx.reply(f"Success: {player_record['fullname']}'s position changed to {position.title()}.")
 
     @edit_player.command()
@@ -519,14 +493,12 @@ class PlayerManagement(commands.Cog, name="Player Management"):
             archetype = "DEKER"
         if archetype not in ["PASSER", "SHOOTER", "DEKER"]:
             return await ctx.reply("Error: Valid archetype not found. Valid archetypes are: passer, shooter, deker")
-        player_record = await self.bot.db.fetchrow("""SELECT CONCAT(firstname, ' ', lastname) AS fullname, playerposition, playertype
-                                                      FROM players WHERE playerid = $1""",
-                                                   player.id)
+        player_record = await self.bot.statements.player_position_info(player.id)
         if player_record is None:
             return await ctx.reply("Error: Player has not registered. Please tell the player to register or add them manually.")
         if player_record["playerposition"] == "GOALIE":
             return await ctx.reply("Error: Player is a goalie and does not have an archetype.")
-        await self.bot.write("""UPDATE players SET playertype = $1 WHERE playerid = $2""", archetype, player.id)
+        await self.bot.statements.set_player_archetype(archetype, player.id)
         return await ctx.reply(f"Success: {player_record['fullname']}'s archetype changed to {fancy_archetype_name(player_record['playerposition'], archetype)}")
 
 
@@ -537,128 +509,234 @@ class GameManagement(commands.Cog):
 
     @commands.command(name="creategame", aliases=["startgame"])
     @commands.has_role("bot operator")
-    async def create_game(self, ctx, away_team: str, home_team: str, stadium=Optional[nextcord.TextChannel]):
+    async def create_game(self, ctx, away_team: str, home_team: str, stadium: Optional[nextcord.TextChannel] = None):
         """Creates a game. Starts by default in home team's stadium unless neutral site specified."""
         away_team, home_team = away_team.upper(), home_team.upper()
         if any((len(away_team) > 3, len(home_team) > 3)):
             return await ctx.reply("Error: Team ID cannot be longer than 3 characters.")
 
-        if not (await self.bot.statements.team_exists(home_team) and await self.bot.statements.team_exists(away_team)):
-            return await ctx.reply("Error: Home and/or away team not found.")
-
-        stadium = stadium or await self.bot.db.fetchval("""SELECT channelid FROM teams WHERE teamid = $1""", home_team)
-        if stadium is None:
-            return await ctx.reply("Error: Home team has no stadium.")
-
-        if await self.bot.db.fetchval("""SELECT EXISTS(SELECT 1 FROM games WHERE stadium = $1 AND game_active)""", stadium):
-            return await ctx.reply("Error: Stadium is already in use!")
-
-        if await self.bot.db.fetchval("""SELECT EXISTS(
-                                         SELECT 1 FROM games
-                                         WHERE game_active AND
-                                         (hometeam = $1 OR awayteam = $1 OR hometeam = $2 or awayteam = $2))""", home_team, away_team):
-            return await ctx.reply("Error: One or both of the teams are in an existing match!")
-
-        # This is the best way to do it for now. One day I'll improve this by implementing a postgres statement for it.
-        home_forward_id, home_forward_type = await self.bot.db.fetchrow("""SELECT playerid, playertype FROM players WHERE playerteam = $1 AND playerposition = 'FORWARD'""", home_team) or (None, None)
-        home_defenseman_id, home_defenseman_type = await self.bot.db.fetchrow("""SELECT playerid, playertype FROM players WHERE playerteam = $1 AND playerposition = 'DEFENSEMAN'""", home_team) or (None, None)
-        home_goalie_id = await self.bot.db.fetchval("""SELECT playerid from players WHERE playerteam = $1 AND playerposition = 'GOALIE'""", home_team)
-        away_forward_id, away_forward_type = await self.bot.db.fetchrow("""SELECT playerid, playertype FROM players WHERE playerteam = $1 AND playerposition = 'FORWARD'""", away_team) or (None, None)
-        away_defenseman_id, away_defenseman_type = await self.bot.db.fetchrow("""SELECT playerid, playertype FROM players WHERE playerteam = $1 AND playerposition = 'DEFENSEMAN'""", away_team) or (None, None)
-        away_goalie_id = await self.bot.db.fetchval("""SELECT playerid from players WHERE playerteam = $1 AND playerposition = 'GOALIE'""", away_team)
-
-        if not all({home_forward_id, home_defenseman_id, home_goalie_id, away_forward_id, away_defenseman_id, away_goalie_id}):
-            return await ctx.reply("Error: One or more of the teams has one or more unfilled positions. Game cannot begin.")
-
-        await self.bot.write("""INSERT INTO games
-                                (hometeam, awayteam, homeroster, awayroster, stadium) VALUES
-                                (   $1,       $2,
-                                 (($3, $4), ($5, $6) , $7), (($8, $9), ($10, $11), $12), $13)""",
-                             home_team, away_team, home_forward_id, home_forward_type, home_defenseman_id,
-                             home_defenseman_type, home_goalie_id, away_forward_id, away_forward_type,
-                             away_defenseman_id, away_defenseman_type, away_goalie_id, stadium)
-        deadline = await self.bot.db.fetchval("""SELECT deadline FROM games WHERE stadium = $1 AND game_active""", stadium)
-
-        stadium = self.bot.get_channel(stadium)
-        home_role, away_role = await self.bot.role_from_id(stadium.guild.id, home_team), await self.bot.role_from_id(stadium.guild.id, away_team)
-        home_goalie, away_goalie = self.bot.get_user(home_goalie_id), self.bot.get_user(away_goalie_id)
+        if home_team == away_team:
+            return await ctx.reply(CREATE_GAME_ERRORS["same_team"])
+        if not (self.bot.teams.exists(home_team) and self.bot.teams.exists(away_team)):
+            return await ctx.reply(CREATE_GAME_ERRORS["team_not_found"])
+
+        # Validation, conflict checks, roster lookups and the insert all happen atomically in one round trip
+        game = await self.bot.statements.create_game(home_team, away_team, stadium.id if stadium else None)
+        if game["result"] != "ok":
+            return await ctx.reply(CREATE_GAME_ERRORS[game["result"]])
+        deadline = game["game_deadline"]
+        self.bot.deadlines.track(game["new_game_id"], deadline)
+        self.bot.router.add_game(game["new_game_id"], game["game_stadium"], (game["home_goalie_id"], game["away_goalie_id"]))
+        active_game = await self.bot.games.add(game["new_game_id"])
+
+        stadium = self.bot.get_channel(game["game_stadium"])
+        home_role, away_role = self.bot.role_from_id(stadium.guild.id, home_team), self.bot.role_from_id(stadium.guild.id, away_team)
+        home_goalie, away_goalie = self.bot.get_user(game["home_goalie_id"]), self.bot.get_user(game["away_goalie_id"])
         await stadium.send(f"Game has started between {home_role.mention} and {away_role.mention}.\n\n"
                            f"{home_goalie.mention} and {away_goalie.mention}, please DM your lists.")
-        active_category = nextcord.utils.get(ctx.guild.categories, name="Active Stadiums")
-        await home_goalie.send("Please DM a list of numbers from 1-1000 separated by commas.")
-        await away_goalie.send("Please DM a list of numbers from 1-1000 separated by commas.")
-        await ctx.reply(f"Success: Game started in {stadium.mention}.")
-        return await stadium.edit(topic=f"{away_role.mention} 0 - 0 {home_role.mention} (0 CP | 25 moves left | 1st | Deadline: <t:{int(mktime(deadline.timetuple()))}:f>)", category=active_category)
+        active_category = self.bot.guild_indexes.get(ctx.guild).category_named("Active Stadiums")
+        await home_goalie.send(f"Please DM a list of at least {MOVES_PER_GAME} numbers from 1-1000 separated by commas.")
+        await away_goalie.send(f"Please DM a list of at least {MOVES_PER_GAME} numbers from 1-1000 separated by commas.")
+        self.bot.scoreboards.game_started(active_game, active_category)
+        return await ctx.reply(f"Success: Game started in {stadium.mention}.")
 
     @commands.command(name="abandongame", aliases=["stopgame"])
     @commands.has_role("bot operator")
     async def abandon_game(self, ctx, game_id: Optional[int] = None):
-        game_id = game_id or ctx.channel.id
-        game = await self.bot.db.fetchrow("""SELECT hometeam, awayteam, homescore, awayscore, gameid, stadium FROM games WHERE gameid = $1 AND game_active""", game_id)
+        if game_id is None:  # The game being played in this channel, if it is a stadium
+            game_id = self.bot.router.stadiums.get(ctx.channel.id)
+        game = self.bot.games.get(game_id)
         if game is None:
             return await ctx.reply("Error: Game not found.")
-        scores_channel = nextcord.utils.get(ctx.guild.channels, name="scores")
-        await scores_channel.send(f"{self.bot.emoji_from_id(ctx.guild.id, game['awayteam'])} {game['awayscore']} - "
-                                  f"{game['homescore']} {self.bot.emoji_from_id(ctx.guild.id, game['hometeam'])} "
+        scores_channel = self.bot.guild_indexes.get(ctx.guild).channel_named("scores")
+        await scores_channel.send(f"{self.bot.emoji_from_id(ctx.guild.id, game.away_team)} {game.state.awayscore} - "
+                                  f"{game.state.homescore} {self.bot.emoji_from_id(ctx.guild.id, game.home_team)} "
                                   f"(GAME ABANDONED)")
-        await self.bot.write("""UPDATE games SET game_active = 'f' WHERE gameid = $1""", game['gameid'])
-        stadium = self.bot.get_channel(game["stadium"])
-        vacant_category = nextcord.utils.get(ctx.guild.categories, name="Vacant Stadiums")
+        game.game_active = False
+        self.bot.games.remove(game.game_id)
+        await self.bot.games.save(game)  # Queued behind any moves still being written, so it always lands last
+        self.bot.deadlines.untrack(game.game_id)
+        self.bot.router.remove_game(game.game_id)
+        stadium = self.bot.get_channel(game.stadium)
+        vacant_category = self.bot.guild_indexes.get(ctx.guild).category_named("Vacant Stadiums")
         if stadium != ctx.channel:
             await stadium.send("Game has been abandoned by a bot operator.")
-        await ctx.reply("Game successfuly abandoned.")
-        return await stadium.edit(topic="", category=vacant_category)
+        self.bot.scoreboards.game_ended(game, vacant_category)
+        return await ctx.reply("Game successfuly abandoned.")
 
     @commands.command(name="gameinfo")
     async def game_info(self, ctx, game_id: Optional[int] = None):
-        game_id = game_id or ctx.channel.id
-        game = await self.bot.db.fetchrow("""SELECT hometeam, awayteam, homescore, awayscore, homeroster,
-                                             awayroster, movenum, stadium, cleanpasses, waitingon_side, possession,
-                                             waitingon_pos, game_active, gameid, deadline FROM games WHERE gameid = $1""",
-                                          game_id)
-        if game is None:
-            return await ctx.reply("Error: Game not found.")
-        period, moves_left = (game["movenum"] // 25) + 1, 25 - (game['movenum'] % 25)
+        if game_id is None:  # The game being played in this channel, if it is a stadium
+            game_id = self.bot.router.stadiums.get(ctx.channel.id)
+            if game_id is None:
+                return await ctx.reply("Error: Game not found.")
+        game = self.bot.games.get(game_id)
+        if game is None:  # Only finished games need the database
+            record = await self.bot.statements.game_state(game_id)
+            if record is None:
+                return await ctx.reply("Error: Game not found.")
+            game = ActiveGame.from_record(record)
+        state = game.state
+        period, moves_left = (state.movenum // 25) + 1, 25 - (state.movenum % 25)
         embed = nextcord.Embed(color=0xCC5500, title="Game Info", timestamp=datetime.now())
-        embed.add_field(name="Home Team", value=(await self.bot.role_from_id(ctx.guild.id, game["hometeam"])).mention)
-        embed.add_field(name="Away Team", value=(await self.bot.role_from_id(ctx.guild.id, game["awayteam"])).mention)
-        embed.add_field(name="Stadium", value=self.bot.get_channel(game["stadium"]).mention)
-        embed.add_field(name="Score", value=f"{game['awayteam']} {game['awayscore']} - {game['homescore']} {game['hometeam']}")
-        embed.add_field(name="Period", value=["x", "1st", "2nd", "3rd"][period])
+        embed.add_field(name="Home Team", value=self.bot.role_from_id(ctx.guild.id, game.home_team).mention)
+        embed.add_field(name="Away Team", value=self.bot.role_from_id(ctx.guild.id, game.away_team).mention)
+        embed.add_field(name="Stadium", value=self.bot.get_channel(game.stadium).mention)
+        embed.add_field(name="Score", value=f"{game.away_team} {state.awayscore} - {state.homescore} {game.home_team}")
+        embed.add_field(name="Period", value=["x", "1st", "2nd", "3rd"][min(period, 3)])
         embed.add_field(name="Moves Left", value=moves_left)
-        embed.add_field(name="Possession", value=(await self.bot.role_from_id(ctx.guild.id, game[f"{game['possession'].lower()}team"])).mention)
-        embed.add_field(name="Clean Passes", value=game["cleanpasses"])
-        embed.add_field(name="Game Active?", value="Yes" if game["game_active"] else "No")
-        embed.add_field(name="Home Forward", value=self.bot.get_user(game["homeroster"]["forward"]["playerid"]).mention)
-        embed.add_field(name="Home Defenseman", value=self.bot.get_user(game["homeroster"]["defenseman"]["playerid"]).mention)
-        embed.add_field(name="Home Goalie", value=self.bot.get_user(game["homeroster"]["goalie"]).mention)
-        embed.add_field(name="Away Forward", value=self.bot.get_user(game["awayroster"]["forward"]["playerid"]).mention)
-        embed.add_field(name="Away Defenseman", value=self.bot.get_user(game["awayroster"]["defenseman"]["playerid"]).mention)
-        embed.add_field(name="Away Goalie", value=self.bot.get_user(game["awayroster"]["goalie"]).mention)
-        embed.add_field(name="Waiting on number from team", value=(await self.bot.role_from_id(ctx.guild.id, game[f"{game['waitingon_side'].lower()}team"])).mention)
-        embed.add_field(name="Waiting on number from position", value=game["waitingon_pos"].title())
-        embed.add_field(name="Deadline", value=f"<t:{int(mktime(game['deadline'].timetuple()))}:f>")
-        embed.set_footer(text=f"Game ID: {game['gameid']}")
+        embed.add_field(name="Possession", value=self.bot.role_from_id(ctx.guild.id, game.team(state.possession)).mention)
+        embed.add_field(name="Clean Passes", value=state.cleanpasses)
+        embed.add_field(name="Game Active?", value="Yes" if game.game_active else "No")
+        embed.add_field(name="Home Forward", value=self.bot.get_user(game.home_roster.forward).mention)
+        embed.add_field(name="Home Defenseman", value=self.bot.get_user(game.home_roster.defenseman).mention)
+        embed.add_field(name="Home Goalie", value=self.bot.get_user(game.home_roster.goalie).mention)
+        embed.add_field(name="Away Forward", value=self.bot.get_user(game.away_roster.forward).mention)
+        embed.add_field(name="Away Defenseman", value=self.bot.get_user(game.away_roster.defenseman).mention)
+        embed.add_field(name="Away Goalie", value=self.bot.get_user(game.away_roster.goalie).mention)
+        embed.add_field(name="Waiting on number from team", value=self.bot.role_from_id(ctx.guild.id, game.team(game.waitingon_side)).mention)
+        embed.add_field(name="Waiting on number from position", value=state.waitingon_pos.title())
+        embed.add_field(name="Deadline", value=f"<t:{int(mktime(game.deadline.timetuple()))}:f>")
+        embed.set_footer(text=f"Game ID: {game.game_id}")
         return await ctx.reply(embed=embed)
 
     @commands.command(name="listgames", aliases=["listactivegames"])
-    async def list_games(self, ctx):
-        games = await self.bot.db.fetch("""SELECT hometeam, awayteam, homescore, awayscore, gameid, movenum FROM games WHERE game_active""")
-        if len(games) == 0:
-            return await ctx.reply("There are no active games.")
-        message_str = "```\nACTIVE GAMES:\n"
-        for game in games:
-            period, moves_left = (game["movenum"] // 25) + 1, 25 - (game['movenum'] % 25)
-            message_str += f"{game['awayteam']} {game['awayscore']} - {game['homescore']} {game['hometeam']} " \
-                           f"({['x', '1st', '2nd', '3rd'][period]} | {moves_left} moves left | ID: {game['gameid']})\n"
-        message_str += "```"
-        return await ctx.reply(message_str)
+    async def list_games(self, ctx, *filters: str):
+        """Lists active games. Filter by team ID and/or period (1, 2, 3), e.g. "listgames ABC 3"."""
+        team_id, period = None, None
+        for game_filter in filters:
+            if self.bot.teams.exists(game_filter):
+                team_id = game_filter.upper()
+            elif game_filter.lower().rstrip("stndrd") in ("1", "2", "3"):
+                period = int(game_filter[0])
+            else:
+                return await ctx.reply(f"Error: {game_filter} is not a team ID or a period (1, 2 or 3).")
+        lines = self.bot.scoreboards.listing(team_id, period)
+        if len(lines) == 0:
+            return await ctx.reply("There are no active games." if not filters else "There are no active games that match.")
+        pages = self.bot.scoreboards.pages(lines, "Active Games" + (f" ({' '.join(filters)})" if filters else ""))
+        if len(pages) == 1:
+            return await ctx.reply(embed=pages[0])
+        view = GamePages(pages, ctx.author.id)
+        view.message = await ctx.reply(embed=pages[0], view=view)
+        return view.message
+
+    @commands.command(name="replaygame")
+    @commands.has_role("bot operator")
+    async def replay_game(self, ctx, game_id: int, move: Optional[int] = None):
+        """Rebuilds a game from its play-by-play log, up to a given move or to the end, and checks it against the saved game."""
+        game_events = await self.bot.events.game(game_id)
+        if len(game_events) == 0:
+            return await ctx.reply("Error: That game has no play-by-play events.")
+        if move is not None:
+            game_events = game_events[:max(move, 0)]
+        try:
+            replayed = list(events.replay(game_events))
+        except events.ReplayError as error:
+            return await ctx.reply(f"Error: The play-by-play log does not add up: {error}")
+        lines = [f"{event.movenum + 1:>2} {'HOME' if event.home else 'AWAY'} {event.action.name.lower():<5} {event.offensenumber:>4} vs. "
+                 f"{event.defensenumber:>4} {event.outcome.name.replace('_', ' ').lower():<13} {state.awayscore}-{state.homescore}"
+                 for event, state in replayed[-15:]]
+        state = replayed[-1][1] if replayed else GameState()
+        embed = nextcord.Embed(color=0xCC5500, title=f"Game {game_id} Replay", description="```\n" + "\n".join(lines or ["No moves"]) + "\n```")
+        embed.add_field(name="Moves Replayed", value=len(replayed))
+        embed.add_field(name="Score", value=f"{state.awayscore} - {state.homescore} (away - home)")
+        embed.add_field(name="Possession", value=f"{state.possession.title()} {state.waitingon_pos.lower()}")
+        if move is None:
+            saved = self.bot.games.get(game_id)
+            saved_state = saved.state if saved else ActiveGame.from_record(await self.bot.statements.game_state(game_id)).state
+            embed.add_field(name="Matches Saved Game?", value="Yes" if saved_state == state else f"No, saved game is at {saved_state}", inline=False)
+        return await ctx.reply(embed=embed)
+
+    @commands.command(name="exportevents")
+    @commands.has_role("bot operator")
+    async def export_events(self, ctx, scope: str, key: Optional[str] = None, file_format: str = "csv"):
+        """Uploads play-by-play events as CSV or Parquet: "exportevents game 12", "exportevents team ABC parquet" or "exportevents all"."""
+        scope = scope.lower()
+        if scope == "all" and key is not None:
+            key, file_format = None, key
+        file_format = file_format.lower()
+        if scope not in events.SCOPES:
+            return await ctx.reply(f"Error: Export a game, a team or all, not {scope}.")
+        if file_format not in events.FORMATS:
+            return await ctx.reply(f"Error: Export as {' or '.join(events.FORMATS)}, not {file_format}.")
+        if scope == "game" and (key is None or not key.isdigit()):
+            return await ctx.reply("Error: Please specify a game ID.")
+        if scope == "team" and (key is None or not self.bot.teams.exists(key)):
+            return await ctx.reply("Error: Please specify a valid team ID.")
+        if file_format == "parquet" and events.pq is None:
+            return await ctx.reply("Error: Parquet export needs pyarrow, which is not installed. Export as CSV instead.")
+        key = int(key) if scope == "game" else key.upper() if key else None
+        with tempfile.TemporaryFile() as output:  # Streamed to disk a batch at a time, never held in memory
+            async with self.bot.db.acquire() as connection:
+                written = await events.export_events(connection, output, file_format, scope, key)
+            size = output.tell()
+            if written == 0:
+                return await ctx.reply("There are no events to export.")
+            if size > MAX_UPLOAD_SIZE:
+                return await ctx.reply(f"Error: The export is {size / 1_000_000:.1f} MB, which is too large to upload. "
+                                       f"Use python events.py export from the server instead.")
+            output.seek(0)
+            filename = f"events-{scope}{f'-{key}' if key else ''}.{file_format}".lower()
+            return await ctx.reply(f"{written} events.", file=nextcord.File(output, filename=filename))
 
     @commands.command()
     async def rulebook(self, ctx):
         return await ctx.reply("https://docs.google.com/document/d/1iwjePj_75XspX1sGH5PndSelOhV5X0NcoskAneEFe-c/edit?usp=sharing")
 
 
+class Statistics(commands.Cog):
+    """League standings and player statistics."""
+    def __init__(self, bot: Bot):
+        self.bot = bot
+
+    @commands.command()
+    async def standings(self, ctx):
+        """Displays the league standings. Wins are worth 2 points and ties 1."""
+        standings = self.bot.stats.standings()
+        if len(standings) == 0:
+            return await ctx.reply("No games have been finished yet.")
+        lines = [f"{'Team':<6} {'W':>3} {'L':>3} {'T':>3} {'PTS':>4} {'GF':>4} {'GA':>4} {'DIFF':>5}"]
+        lines += [f"{standing.team_id:<6} {standing.wins:>3} {standing.losses:>3} {standing.ties:>3} {standing.points:>4} "
+                  f"{standing.goals_for:>4} {standing.goals_against:>4} {standing.goal_difference:>+5}" for standing in standings]
+        return await ctx.reply(embed=nextcord.Embed(color=0, title="Standings", description="```\n" + "\n".join(lines) + "\n```"))
+
+    @commands.command()
+    async def leaders(self, ctx, stat: str = "goals"):
+        """Displays the players with the most of a stat, e.g. "leaders saves"."""
+        column = stat.lower().replace("_", "").replace("-", "")
+        if column not in PLAYER_COLUMNS:
+            return await ctx.reply(f"Error: Unknown stat. Use one of {', '.join(PLAYER_COLUMNS)}.")
+        leaders = self.bot.stats.leaders(column)
+        if len(leaders) == 0:
+            return await ctx.reply(f"No one has any {STAT_NAMES[column].lower()} yet.")
+        lines = []
+        for rank, (player_id, total) in enumerate(leaders, start=1):
+            user = self.bot.get_user(player_id)
+            lines.append(f"{rank}. {user.mention if user else f'Unknown player with ID {player_id}'}: {total}")
+        return await ctx.reply(embed=nextcord.Embed(color=0, title=f"{STAT_NAMES[column]} Leaders", description="\n".join(lines)))
+
+    @commands.command(name="playerstats")
+    async def player_stats(self, ctx, player: Optional[nextcord.Member] = None):
+        """Displays a player's statistics. Defaults to your own."""
+        player = player or ctx.author
+        totals = self.bot.stats.player(player.id)
+        if not totals["moves"] and not totals["shotsfaced"]:
+            return await ctx.reply(f"Error: {player.display_name} has not played yet.")
+        embed = nextcord.Embed(color=0, title=f"{player.display_name} Statistics")
+        if totals["moves"]:
+            for column in ("moves", "passes", "completedpasses", "dekes", "completeddekes", "shots", "goals", "turnovers"):
+                embed.add_field(name=STAT_NAMES[column], value=totals[column])
+            for name, attempts, successes in (("Pass", "passes", "completedpasses"), ("Deke", "dekes", "completeddekes"), ("Shooting", "shots", "goals")):
+                if totals[attempts]:
+                    embed.add_field(name=f"{name} %", value=f"{100 * totals[successes] / totals[attempts]:.1f}")
+        if totals["shotsfaced"]:
+            for column in ("shotsfaced", "saves", "goalsagainst"):
+                embed.add_field(name=STAT_NAMES[column], value=totals[column])
+            embed.add_field(name="Save %", value=f"{100 * totals['saves'] / totals['shotsfaced']:.1f}")
+        return await ctx.reply(embed=embed)
+
+
 class MetaAdmin(commands.Cog):
     """Commands related to the functioning of the bot."""
     def __init__(self, bot: Bot):
@@ -679,11 +757,121 @@ class MetaAdmin(commands.Cog):
         embed = nextcord.Embed(color=0, title="Eval", description=f"```py\n{result}\n```")
         await ctx.reply(embed=embed)
 
+    @commands.group(hidden=True, invoke_without_command=True)
+    @commands.is_owner()
+    async def logs(self, ctx, lines: int = 200):
+        """Uploads the last lines of the current log file."""
+        if not os.path.exists(bot_logging.LOG_FILE):
+            return await ctx.reply("Error: Nothing has been logged yet.")
+        data = await asyncio.to_thread(bot_logging.tail, bot_logging.LOG_FILE, max(lines, 1))
+        return await ctx.reply(file=nextcord.File(io.BytesIO(data[-MAX_UPLOAD_SIZE:]), filename="bot.log"))
+
+    @logs.command(name="range")
+    async def logs_range(self, ctx, start: str, end: Optional[str] = None):
+        """Uploads the log lines between two times (YYYY-MM-DD HH:MM, quoted), searching rotated logs too. End defaults to now."""
+        try:
+            start_time = datetime.fromisoformat(start)
+            end_time = datetime.fromisoformat(end) if end else datetime.now()
+        except ValueError:
+            return await ctx.reply("Error: Times must look like \"2022-05-01 18:30\".")
+
+        def read_range() -> bytes:
+            return "".join(bot_logging.between(start_time, end_time)).encode("utf-8")
+        data = await asyncio.to_thread(read_range)
+        if not data:
+            return await ctx.reply("Error: Nothing was logged in that time range.")
+        note = "Range was too large; only the most recent part was uploaded." if len(data) > MAX_UPLOAD_SIZE else None
+        return await ctx.reply(note, file=nextcord.File(io.BytesIO(data[-MAX_UPLOAD_SIZE:]), filename="bot.log"))
+
     @commands.command(hidden=True)
     @commands.is_owner()
-    async def logs(self, ctx):
-        """Uploads the bot.log file."""
-        return await ctx.reply(file=nextcord.File("bot.log"))
+    async def refreshteams(self, ctx):
+        """Reloads the team registry from the database."""
+        await self.bot.teams.refresh()
+        return await ctx.reply(f"Team registry refreshed. {len(self.bot.teams)} teams loaded.")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def refreshplayers(self, ctx):
+        """Rebuilds the player search index from the database."""
+        await self.bot.player_search.load()
+        return await ctx.reply(f"Player search index rebuilt. {len(self.bot.player_search)} players indexed.")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def refreshwebhooks(self, ctx, webhook_name: Optional[str] = None):
+        """Drops cached webhook URLs, profiles and templates so they are reloaded from the database."""
+        self.bot.webhooks.invalidate(webhook_name)
+        return await ctx.reply("Webhook cache cleared.")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def rebuildstats(self, ctx):
+        """Recomputes standings and player statistics from the games table and the play-by-play log, for when results have been corrected by hand."""
+        start = time.perf_counter()
+        await self.bot.stats.rebuild()
+        return await ctx.reply(f"Statistics rebuilt for {len(self.bot.stats.standings())} teams and {len(self.bot.stats.players)} players "
+                               f"in {time.perf_counter() - start:.2f} s.")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def routestats(self, ctx):
+        """Displays how many messages the game listener has routed and dropped."""
+        router = self.bot.router
+        counts = "\n".join(f"{route.value}: {count}" for route, count in router.routed.items()) or "No messages seen yet"
+        return await ctx.reply(f"```\n{counts}\n\nActive stadiums: {len(router.stadiums)}\nGoalie lists owed: {len(router.owed_lists)}\n```")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def queuestats(self, ctx):
+        """Displays the background queues of role and channel edits, webhook posts and stadium topics."""
+        mutations, webhooks = self.bot.mutations, self.bot.webhooks
+        return await ctx.reply(f"```\nRole and channel edits: {mutations.depth} waiting, {mutations.queued} queued, {mutations.coalesced} coalesced, "
+                               f"{mutations.skipped} skipped, {mutations.sent} sent, {mutations.retries} retries, {mutations.failures} failed\n"
+                               f"Webhook posts: {webhooks.queue_depth()} waiting, {webhooks.posts_queued} queued, "
+                               f"{webhooks.requests_sent} requests sent, {webhooks.failures} failed\n"
+                               f"Stadium topics: {self.bot.scoreboards.topic_edits} written, {self.bot.scoreboards.topics_deferred} deferred, "
+                               f"{self.bot.scoreboards.scoreboard_edits} scoreboard edits\n```")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def dbstats(self, ctx):
+        """Displays how saturated the database connection pool is."""
+        stats = self.bot.db.stats()
+        embed = nextcord.Embed(color=0, title="Database Pool")
+        embed.add_field(name="Connections", value=f"{stats['in_use']} in use / {stats['idle']} idle ({stats['min_size']}-{stats['max_size']})")
+        embed.add_field(name="Waiting", value=stats["waiting"])
+        embed.add_field(name="Acquisitions", value=stats["acquisitions"])
+        embed.add_field(name="Acquire Timeouts", value=stats["acquire_timeouts"])
+        embed.add_field(name="Wait Time", value=f"{stats['average_wait_ms']:.2f} ms avg / {stats['max_wait_ms']:.2f} ms max")
+        statement_lines = "\n".join(f"{name}: {histogram.count} calls, {histogram.total * 1000:.0f} ms total, {histogram.average * 1000:.2f} ms avg"
+                                    for name, histogram in self.bot.metrics.of_kind(STATEMENT)[:10])
+        if not self.bot.metrics.enabled:
+            statement_lines = "Metrics are disabled in configuration.json"
+        embed.add_field(name="Statements (by total time)", value=f"```\n{statement_lines or 'No statements run yet'}\n```", inline=False)
+        return await ctx.reply(embed=embed)
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def metrics(self, ctx, kind: Optional[str] = None):
+        """Displays latency percentiles for commands, statements and Discord REST calls. Use "metrics reset" to start over."""
+        metrics = self.bot.metrics
+        if kind == "reset":
+            metrics.reset()
+            return await ctx.reply("Metrics reset.")
+        if kind is not None and kind not in KINDS:
+            return await ctx.reply(f"Error: Unknown metric kind. Use one of {', '.join(KINDS)} or reset.")
+        if not metrics.enabled:
+            return await ctx.reply("Error: Metrics are disabled in configuration.json.")
+        since = datetime.fromtimestamp(metrics.started).strftime("%Y-%m-%d %H:%M:%S")
+        embed = nextcord.Embed(color=0, title="Metrics", description=f"Since {since}. In flight: "
+                               + ", ".join(f"{metric_kind} {metrics.in_flight[metric_kind]}" for metric_kind in KINDS))
+        for metric_kind in ([kind] if kind else KINDS):
+            lines = [f"{name[:32]:<32} {histogram.count:>6} {histogram.percentile(0.5) * 1000:>7.1f} {histogram.percentile(0.95) * 1000:>7.1f} "
+                     f"{histogram.percentile(0.99) * 1000:>7.1f} {histogram.errors:>4}" for name, histogram in metrics.of_kind(metric_kind)[:10]]
+            header = f"{'name':<32} {'calls':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'errs':>4}"
+            embed.add_field(name=f"{metric_kind.capitalize()}s (by total time)", value=f"```\n{header}\n" + ("\n".join(lines) or "Nothing recorded yet") + "\n```", inline=False)
+        return await ctx.reply(embed=embed)
 
     @commands.command(hidden=True)
     @commands.is_owner()
@@ -696,4 +884,5 @@ def setup(bot: Bot):
     bot.add_cog(TeamManagement(bot))
     bot.add_cog(PlayerManagement(bot))
     bot.add_cog(GameManagement(bot))
+    bot.add_cog(Statistics(bot))
     bot.add_cog(MetaAdmin(bot))
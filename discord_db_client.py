@@ -16,15 +16,130 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import contextlib
 import datetime
 import json
 import random as r
+import time
+from typing import AsyncIterator, Iterable
 
-import aiohttp
+import asyncpg
 import nextcord
-from asyncpg import Connection
+from asyncpg.pool import Pool
 from nextcord.ext import commands
 
+import schema
+from game_router import GameRouter
+from discord_mutations import MutationQueue
+from events import EventLog
+from game_store import ActiveGameStore
+from guild_index import GuildIndexes
+from metrics import Metrics
+from player_search import PlayerSearch
+from registration import RegistrationManager
+from scheduler import DeadlineScheduler
+from scoreboard import Scoreboards
+from statements import Statement, Statements, UnitOfWork
+from stats import StatsEngine
+from team_registry import TeamRegistry
+from webhooks import WebhookManager
+
+
+class BotConnection(asyncpg.Connection):
+    """A pooled connection that carries its own set of prepared statements."""
+    prepared: dict
+
+
+async def init_connection(connection: BotConnection):
+    """Runs once for every new connection in the pool, including ones opened to replace dropped connections."""
+    await connection.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    await Statements.prepare(connection)
+
+
+class DatabasePool:
+    """Wraps an asyncpg pool, applying a timeout to every acquire and keeping track of how saturated the pool is."""
+    def __init__(self, pool: Pool, acquire_timeout: float):
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.acquisitions = 0
+        self.acquire_timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """Acquires a connection from the pool, raising asyncio.TimeoutError if none frees up in time."""
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - start
+        self.acquisitions += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            yield connection
+        finally:
+            await self.pool.release(connection)
+
+    async def fetch(self, query: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetchval(query, *args)
+
+    async def execute(self, query: str, *args):
+        async with self.acquire() as connection:
+            return await connection.execute(query, *args)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of pool usage."""
+        size, idle = self.pool.get_size(), self.pool.get_idle_size()
+        return {
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "waiting": self.waiting,
+            "acquisitions": self.acquisitions,
+            "acquire_timeouts": self.acquire_timeouts,
+            "average_wait_ms": self.total_wait / self.acquisitions * 1000 if self.acquisitions else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def create_db_pool(credentials: dict, app_name: str, min_size: int = 2, max_size: int = 10, acquire_timeout: float = 10.0) -> DatabasePool:
+    """Makes sure the server-side objects the bot needs exist, then opens a connection pool to PostgreSQL."""
+    connection = await asyncpg.connect(**credentials, server_settings={"application_name": app_name})
+    try:
+        await schema.apply(connection)
+    finally:
+        await connection.close()
+    pool = await asyncpg.create_pool(**credentials,
+                                     min_size=min_size,
+                                     max_size=max_size,
+                                     init=init_connection,
+                                     connection_class=BotConnection,
+                                     server_settings={"application_name": app_name})
+    return DatabasePool(pool, acquire_timeout)
+
 
 class Bot(commands.Bot):
     """Represents both a connection to the PostgreSQL Client and Discord. Do not create this object directly; use create_bot() instead."""
@@ -36,47 +151,87 @@ class Bot(commands.Bot):
         intents.members = True
         intents.message_content = True
 
-        self.db: Connection = kwargs.pop("db")
+        self.db: DatabasePool = kwargs.pop("db")
         self.logger = kwargs.pop("logger")
-        self.statements = lambda: None  # Best way to create an object that accepts attributes
+        self.metrics = Metrics(self.logger, enabled=kwargs.pop("metrics_enabled", True))
+        self.statements = Statements(self.db, self.metrics)
+        self.teams = TeamRegistry(self.statements)
+        self.player_search = PlayerSearch(self.statements)
+        self.webhooks = WebhookManager(self.statements, self.logger, self.metrics)
+        self.mutations = MutationQueue(self.logger, self.metrics)
+        self.deadlines = DeadlineScheduler(self)
+        self.router = GameRouter(self.statements)
+        self.games = ActiveGameStore(self)
+        self.stats = StatsEngine(self)
+        self.events = EventLog(self)
+        self.scoreboards = Scoreboards(self)
         super().__init__(**kwargs, allowed_mentions=allowed_mentions, intents=intents)
+        self.metrics.instrument_http(self.http)
+        self.guild_indexes = GuildIndexes(self)
+        self.registrations = RegistrationManager(self)
+
+    @contextlib.asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[UnitOfWork]:
+        """
+        Queues writes and commits them all in one transaction when the block exits, or none of them if it raises:
+
+            async with bot.unit_of_work() as work:
+                work.add(Statements.set_player_team, team_id, player_id)
+                work.add_many(Statements.save_game_state, rows)
+        """
+        work = UnitOfWork()
+        yield work
+        await self.statements.commit(work)
 
     async def write(self, query: str, *args):
         """Write something to the database."""
-        async with self.db.transaction():
-            await self.db.execute(query, *args)
+        async with self.unit_of_work() as work:
+            work.add(query, *args)
+
+    async def write_many(self, statement: Statement, args: Iterable[tuple]):
+        """Runs an execute statement once per tuple of arguments, pipelined in one transaction."""
+        async with self.unit_of_work() as work:
+            work.add_many(statement, args)
 
     async def webhook_template(self, webhook_name: str, template_name: str, **kwargs):
-        webhook = await self.db.fetchrow("""SELECT webhookurl, templates FROM webhooks WHERE webhookname = $1""", webhook_name)
-        async with aiohttp.ClientSession() as session:
-            webhook_model = nextcord.Webhook.from_url(url=webhook["webhookurl"], session=session)
-            await webhook_model.send(content=webhook["templates"][template_name].format(**kwargs))
+        self.webhooks.send(webhook_name, content=await self.webhooks.render(webhook_name, template_name, **kwargs))
 
     async def webhook_template_tweet(self, webhook_name: str, template_name: str, **kwargs):
-        webhook = await self.db.fetchrow("""SELECT webhookurl, twitter_handle, twittername, avatar, templates FROM webhooks WHERE webhookname = $1""", webhook_name)
-        embed = nextcord.Embed(description=webhook["templates"][template_name].format(**kwargs), color=0x1DA1F2, timestamp=datetime.datetime.now())
+        webhook = await self.webhooks.get(webhook_name)
+        embed = nextcord.Embed(description=webhook.templates[template_name].format(**kwargs), color=0x1DA1F2, timestamp=datetime.datetime.now())
         embed.set_footer(text="Fake Twitter", icon_url="https://abs.twimg.com/icons/apple-touch-icon-192x192.png")
         embed.add_field(name="Retweets", value=str(r.randint(100, 2500)))
         embed.add_field(name="Likes", value=str(r.randint(100, 2500)))
-        embed.set_author(name=f"{webhook['twittername']} (@{webhook['twitter_handle']})", icon_url=str(webhook["avatar"]))
-        async with aiohttp.ClientSession() as session:
-            webhook_model = nextcord.Webhook.from_url(url=webhook["webhookurl"], session=session)
-            await webhook_model.send(embed=embed)
+        embed.set_author(name=f"{webhook.twitter_name} (@{webhook.twitter_handle})", icon_url=str(webhook.avatar))
+        self.webhooks.send(webhook_name, embed=embed)
+
+    async def close(self):
+        self.deadlines.stop()
+        self.metrics.stop()
+        await self.games.close()
+        await self.mutations.close()
+        await self.webhooks.close()
+        await super().close()
 
 
 async def create_bot(**kwargs) -> Bot:
     """Creates a Bot object."""
     bot = Bot(**kwargs)
-    await bot.db.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
-    team_exists = await bot.db.prepare("""SELECT EXISTS(SELECT 1 FROM teams WHERE teamid = UPPER($1))""")
-    setattr(bot.statements, "team_exists", team_exists.fetchval)
-    get_role_id = await bot.db.prepare("""SELECT roleid FROM teams WHERE teamid = UPPER($1)""")
+    await bot.teams.refresh()
+    await bot.player_search.load()
+    await bot.games.load()
+    await bot.stats.load()
+    await bot.deadlines.load()
+    await bot.router.load()
+    await bot.registrations.load()
+    bot.deadlines.start()
 
-    async def role_from_id(guild_id: int, team_id: str):
-        return nextcord.utils.get(bot.get_guild(guild_id).roles, id=await get_role_id.fetchval(team_id))
+    def role_from_id(guild_id: int, team_id: str):
+        return bot.get_guild(guild_id).get_role(bot.teams.role_id(team_id))
 
     def emoji_from_id(guild_id: int, team_id: str):
-        return nextcord.utils.get(bot.get_guild(guild_id).emojis, name=team_id) or nextcord.utils.get(bot.get_guild(guild_id).emojis, name="UNKNOWN")
+        guild_index = bot.guild_indexes.get(guild_id)
+        return guild_index.emoji_named(team_id) or guild_index.emoji_named("UNKNOWN")
     bot.role_from_id = role_from_id
     bot.emoji_from_id = emoji_from_id
     return bot
@@ -0,0 +1,203 @@
+"""
+Queued Discord role and channel edits for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import nextcord
+
+from metrics import Metrics
+
+MAX_ATTEMPTS = 3
+CONCURRENCY = 4  # Requests in flight at once. They are usually on different routes, so nextcord rate limits them separately
+
+
+async def with_retries(request: Callable[[], Awaitable], on_retry: Optional[Callable[[], None]] = None):
+    """
+    Sends a Discord request, retrying with exponential backoff when Discord answers with a rate limit or server error
+    that nextcord has given up on. Raises the last error once MAX_ATTEMPTS have failed, or any other error at once. The
+    one retry policy for background Discord requests; see MutationQueue and season_import.run_jobs.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return await request()
+        except nextcord.HTTPException as error:
+            if (error.status == 429 or error.status >= 500) and attempt < MAX_ATTEMPTS:
+                if on_retry is not None:
+                    on_retry()
+                await asyncio.sleep(2 ** attempt)
+                continue
+            raise
+
+
+class MemberRoles:
+    """The roles to add to and remove from one member, as of the latest call. Adding a role cancels a queued removal and vice versa."""
+    __slots__ = ("member", "add", "remove")
+
+    def __init__(self, member: nextcord.Member):
+        self.member = member
+        self.add: Dict[int, nextcord.Role] = {}
+        self.remove: Dict[int, nextcord.Role] = {}
+
+
+class MutationQueue:
+    """
+    Queues role and channel edits and sends them in the background, so commands can reply without waiting on Discord.
+    Edits are coalesced while they wait: every role change queued for a member goes out as one member.edit(roles=...),
+    and repeated edits of one role or channel are merged into one request with the latest value of each field. Edits
+    that would not change anything are dropped. Requests that Discord rejects with a rate limit or server error are
+    retried with backoff.
+    """
+    def __init__(self, logger, metrics: Metrics, coalesce_delay: float = 0.5):
+        self.logger = logger
+        self.coalesce_delay = coalesce_delay
+        self._members: Dict[Tuple[int, int], MemberRoles] = {}  # (guild ID, member ID) -> pending role changes
+        self._edits: Dict[Tuple[str, int], Tuple[object, dict]] = {}  # ("role" or "channel", ID) -> (object, fields)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.queued = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.sent = 0
+        self.retries = 0
+        self.failures = 0
+        metrics.gauge("mutation_queue_depth", lambda: self.depth)
+        metrics.gauge("mutations_queued_total", lambda: self.queued)
+        metrics.gauge("mutations_coalesced_total", lambda: self.coalesced)
+        metrics.gauge("mutations_sent_total", lambda: self.sent)
+        metrics.gauge("mutation_retries_total", lambda: self.retries)
+        metrics.gauge("mutation_failures_total", lambda: self.failures)
+
+    @property
+    def depth(self) -> int:
+        """Requests waiting to be sent."""
+        return len(self._members) + len(self._edits)
+
+    def _queued(self, merged: bool):
+        self.queued += 1
+        if merged:
+            self.coalesced += 1
+        self._idle.clear()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _member(self, member: nextcord.Member) -> Tuple[MemberRoles, bool]:
+        key = (member.guild.id, member.id)
+        pending = self._members.get(key)
+        if pending is None:
+            pending = self._members[key] = MemberRoles(member)
+            return pending, False
+        pending.member = member
+        return pending, True
+
+    def add_roles(self, member: nextcord.Member, *roles: Optional[nextcord.Role]):
+        """Queues roles to be given to a member. Roles that are None are ignored, like a failed name lookup."""
+        pending, merged = self._member(member)
+        for role in roles:
+            if role is not None:
+                pending.remove.pop(role.id, None)
+                pending.add[role.id] = role
+        self._queued(merged)
+
+    def remove_roles(self, member: nextcord.Member, *roles: Optional[nextcord.Role]):
+        """Queues roles to be taken from a member. Roles that are None are ignored."""
+        pending, merged = self._member(member)
+        for role in roles:
+            if role is not None:
+                pending.add.pop(role.id, None)
+                pending.remove[role.id] = role
+        self._queued(merged)
+
+    def edit_role(self, role: nextcord.Role, **fields):
+        """Queues a role edit (name, color, ...). Fields from later edits of the same role replace earlier ones."""
+        self._edit("role", role, fields)
+
+    def edit_channel(self, channel: nextcord.abc.GuildChannel, **fields):
+        """Queues a channel edit (topic, category, ...). Fields from later edits of the same channel replace earlier ones."""
+        self._edit("channel", channel, fields)
+
+    def _edit(self, kind: str, target, fields: dict):
+        key = (kind, target.id)
+        pending = self._edits.get(key)
+        if pending is None:
+            self._edits[key] = (target, dict(fields))
+        else:
+            pending[1].update(fields)
+        self._queued(pending is not None)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.coalesce_delay)  # Let changes made in quick succession pile up first
+            self._wakeup.clear()
+            members, self._members = self._members, {}
+            edits, self._edits = self._edits, {}
+            jobs = [self._member_job(pending) for pending in members.values()]
+            jobs += [self._edit_job(target, fields) for target, fields in edits.values()]
+            semaphore = asyncio.Semaphore(CONCURRENCY)
+
+            async def run(job):
+                async with semaphore:
+                    await self._send(*job)
+            await asyncio.gather(*(run(job) for job in jobs if job is not None))
+            if not self._members and not self._edits:
+                self._idle.set()
+
+    def _member_job(self, pending: MemberRoles) -> Optional[Tuple[str, Callable[[], Awaitable]]]:
+        # Work from the member's roles as they are now, not as they were when the change was queued
+        member = pending.member.guild.get_member(pending.member.id) or pending.member
+        current = [role for role in member.roles if not role.is_default()]
+        roles = [role for role in current if role.id not in pending.remove]
+        roles += [role for role_id, role in pending.add.items() if role_id not in {role.id for role in current}]
+        if {role.id for role in roles} == {role.id for role in current}:
+            self.skipped += 1
+            return None
+        return f"set roles of {member}", lambda: member.edit(roles=roles)
+
+    def _edit_job(self, target, fields: dict) -> Optional[Tuple[str, Callable[[], Awaitable]]]:
+        fields = {name: value for name, value in fields.items() if getattr(target, name, object()) != value}
+        if not fields:
+            self.skipped += 1
+            return None
+        return f"edit {target}", lambda: target.edit(**fields)
+
+    async def _send(self, description: str, request: Callable[[], Awaitable]):
+        try:
+            await with_retries(request, on_retry=self._retried)
+            self.sent += 1
+        except Exception as error:
+            self.failures += 1
+            self.logger.error(f"Failed to {description}: {error!r}")
+
+    def _retried(self):
+        self.retries += 1
+
+    async def flush(self):
+        """Waits until everything queued so far has been sent."""
+        if self._task is not None and not self._task.done():
+            await self._idle.wait()
+
+    async def close(self):
+        """Sends everything still queued, then stops the worker."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
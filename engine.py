@@ -0,0 +1,174 @@
+"""
+Play resolution engine for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Every move compares the number submitted by the player with the puck against the defending number. The closer the two
+numbers are (wrapping around at 1000), the better the result for the offense. Everything here is a pure function of
+its arguments, so moves can be resolved in the bot, in a worker process, or by the million for balance testing.
+resolve_batch() needs NumPy, which is only required for batch resolution.
+"""
+
+import enum
+import functools
+from typing import NamedTuple, Optional
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for resolve_batch()
+    np = None
+
+from util import MOVES_PER_GAME
+
+
+MIN_NUMBER, MAX_NUMBER = 1, 1000
+
+
+class Action(enum.IntEnum):
+    PASS = 0
+    SHOOT = 1
+    DEKE = 2
+
+
+class Archetype(enum.IntEnum):
+    NONE = 0
+    PASSER = 1
+    SHOOTER = 2
+    DEKER = 3
+
+    @classmethod
+    def from_db(cls, playertype: Optional[str]) -> "Archetype":
+        """Converts a players.playertype value (PASSER, SHOOTER, DEKER or NULL) into an Archetype."""
+        return cls[playertype.upper()] if playertype else cls.NONE
+
+
+class Outcome(enum.IntEnum):
+    PASS_COMPLETE = 0
+    DEKE_COMPLETE = 1
+    TURNOVER = 2
+    GOAL = 3
+    SAVE = 4
+    MISS = 5
+
+
+# Largest difference that still counts as a success for each action
+SUCCESS_RANGE = {Action.PASS: 300, Action.DEKE: 200, Action.SHOOT: 50}
+# Largest difference on a shot that the goalie saves, rather than the shot missing entirely
+SAVE_RANGE = 350
+# Archetypes widen the success range of the action they specialise in
+ARCHETYPE_BONUS = {Archetype.PASSER: Action.PASS, Archetype.SHOOTER: Action.SHOOT, Archetype.DEKER: Action.DEKE}
+ARCHETYPE_RANGE_BONUS = 25
+# Each clean pass before a shot widens the scoring range, up to a cap
+CLEAN_PASS_BONUS = 15
+MAX_CLEAN_PASS_BONUS = 5
+
+
+def difference(offense_number: int, defense_number: int) -> int:
+    """Distance between two numbers on a 1-1000 circle, so 1 and 1000 are 1 apart. Between 0 and 500."""
+    distance = abs(offense_number - defense_number)
+    return min(distance, MAX_NUMBER - distance)
+
+
+def success_range(action: Action, archetype: Archetype = Archetype.NONE, clean_passes: int = 0) -> int:
+    result = SUCCESS_RANGE[action]
+    if ARCHETYPE_BONUS.get(archetype) == action:
+        result += ARCHETYPE_RANGE_BONUS
+    if action == Action.SHOOT:
+        result += CLEAN_PASS_BONUS * min(clean_passes, MAX_CLEAN_PASS_BONUS)
+    return result
+
+
+def resolve_move(action: Action, offense_number: int, defense_number: int, archetype: Archetype = Archetype.NONE, clean_passes: int = 0) -> Outcome:
+    """Resolves a single move."""
+    for number in (offense_number, defense_number):
+        if not MIN_NUMBER <= number <= MAX_NUMBER:
+            raise ValueError(f"Number {number} is not between {MIN_NUMBER} and {MAX_NUMBER}")
+    diff = difference(offense_number, defense_number)
+    if diff <= success_range(action, archetype, clean_passes):
+        return {Action.PASS: Outcome.PASS_COMPLETE, Action.DEKE: Outcome.DEKE_COMPLETE, Action.SHOOT: Outcome.GOAL}[action]
+    if action == Action.SHOOT:
+        return Outcome.SAVE if diff <= SAVE_RANGE else Outcome.MISS
+    return Outcome.TURNOVER
+
+
+class GameState(NamedTuple):
+    """The parts of a games row that change from move to move."""
+    homescore: int = 0
+    awayscore: int = 0
+    movenum: int = 0
+    cleanpasses: int = 0
+    possession: str = "AWAY"
+    waitingon_pos: str = "FORWARD"
+
+    @property
+    def is_over(self) -> bool:
+        return self.movenum >= MOVES_PER_GAME
+
+
+def apply_outcome(state: GameState, outcome: Outcome) -> GameState:
+    """Returns the game state after a move with the given outcome. The team with the puck is always the one waited on."""
+    other_side = "HOME" if state.possession == "AWAY" else "AWAY"
+    state = state._replace(movenum=state.movenum + 1)
+    if outcome == Outcome.PASS_COMPLETE:
+        return state._replace(cleanpasses=state.cleanpasses + 1,
+                              waitingon_pos="DEFENSEMAN" if state.waitingon_pos == "FORWARD" else "FORWARD")
+    if outcome == Outcome.DEKE_COMPLETE:
+        return state._replace(cleanpasses=state.cleanpasses + 2)
+    if outcome == Outcome.GOAL:
+        scoring_side = f"{state.possession.lower()}score"
+        state = state._replace(**{scoring_side: getattr(state, scoring_side) + 1})
+        return state._replace(cleanpasses=0, possession=other_side, waitingon_pos="FORWARD")
+    # Turnovers, saves and misses all give the puck to the defending team's defenseman
+    return state._replace(cleanpasses=0, possession=other_side, waitingon_pos="DEFENSEMAN")
+
+
+@functools.lru_cache(maxsize=None)
+def _success_table():
+    success = np.zeros((len(Action), len(Archetype)), dtype=np.int16)
+    for action in Action:
+        for archetype in Archetype:
+            success[action, archetype] = success_range(action, archetype)
+    return success
+
+
+def resolve_batch(actions, offense_numbers, defense_numbers, archetypes=None, clean_passes=None):
+    """
+    Resolves many moves at once. Every argument is an array-like of the same length; actions and archetypes hold
+    Action and Archetype values. Returns an int8 array of Outcome values.
+    """
+    if np is None:
+        raise RuntimeError("resolve_batch() requires NumPy")
+    actions = np.asarray(actions, dtype=np.int8)
+    offense_numbers = np.asarray(offense_numbers, dtype=np.int16)
+    defense_numbers = np.asarray(defense_numbers, dtype=np.int16)
+    archetypes = np.zeros_like(actions) if archetypes is None else np.asarray(archetypes, dtype=np.int8)
+    clean_passes = np.zeros_like(actions) if clean_passes is None else np.asarray(clean_passes, dtype=np.int16)
+    for numbers in (offense_numbers, defense_numbers):
+        if numbers.size and (numbers.min() < MIN_NUMBER or numbers.max() > MAX_NUMBER):
+            raise ValueError(f"Numbers must be between {MIN_NUMBER} and {MAX_NUMBER}")
+
+    distance = np.abs(offense_numbers - defense_numbers)
+    diff = np.minimum(distance, MAX_NUMBER - distance)
+    shots = actions == Action.SHOOT
+    ranges = _success_table()[actions, archetypes] + np.where(shots, CLEAN_PASS_BONUS * np.minimum(clean_passes, MAX_CLEAN_PASS_BONUS), 0)
+    success = diff <= ranges
+
+    outcomes = np.full(actions.shape, Outcome.TURNOVER, dtype=np.int8)
+    outcomes[success & (actions == Action.PASS)] = Outcome.PASS_COMPLETE
+    outcomes[success & (actions == Action.DEKE)] = Outcome.DEKE_COMPLETE
+    outcomes[success & shots] = Outcome.GOAL
+    outcomes[~success & shots & (diff <= SAVE_RANGE)] = Outcome.SAVE
+    outcomes[~success & shots & (diff > SAVE_RANGE)] = Outcome.MISS
+    return outcomes
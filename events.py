@@ -0,0 +1,286 @@
+"""
+Play-by-play event log for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Every resolved move is appended to the game_events table: who moved, both numbers, the result and the score after
+it. Events are COPYed in batches in the same transaction as the game state they produced, so the log and the games
+table always agree, and replay() can rebuild any game's state move by move from the log alone. Exports stream from
+a server-side cursor in batches, so a whole season never has to fit in memory. Parquet export needs pyarrow, which is
+only required for that.
+
+Usage (from the repository root):
+    python events.py export {game ID | team ID | all} [--since YYYY-MM-DD] [--format csv|parquet] [--output FILE]
+    python events.py replay GAME_ID
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import json
+import sys
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for Parquet export
+    pa = pq = None
+
+from engine import Action, Archetype, GameState, Outcome, apply_outcome
+from statements import Statements, UnitOfWork
+
+FORMATS = ("csv", "parquet")
+SCOPES = ("game", "team", "all")
+EXPORT_BATCH_SIZE = 5000  # Rows fetched from the cursor, and written as one Parquet row group, at a time
+
+
+class GameEvent(NamedTuple):
+    """A row of game_events: one resolved move. cleanpasses is from before the move; the scores are from after it."""
+    gameid: int
+    movenum: int  # The move's number within the game, from 0
+    home: bool  # Whether the home team had the puck
+    playerid: int
+    goalieid: int  # The defending goalie
+    archetype: Archetype
+    action: Action
+    offensenumber: int
+    defensenumber: int
+    cleanpasses: int
+    outcome: Outcome
+    homescore: int
+    awayscore: int
+    resolvedat: datetime.datetime
+
+    @classmethod
+    def of_move(cls, game, before: GameState, player_id: int, archetype: Archetype, action: Action, offense_number: int,
+                defense_number: int, outcome: Outcome, resolved_at: datetime.datetime) -> "GameEvent":
+        """The event of a move that took game from the before state to its current state."""
+        defending_side = "AWAY" if before.possession == "HOME" else "HOME"
+        return cls(game.game_id, before.movenum, before.possession == "HOME", player_id, game.roster(defending_side).goalie, archetype, action,
+                   offense_number, defense_number, before.cleanpasses, outcome, game.state.homescore, game.state.awayscore, resolved_at)
+
+    @classmethod
+    def from_record(cls, record) -> "GameEvent":
+        return cls(*(record[field] for field in cls._fields))._replace(archetype=Archetype(record["archetype"]), action=Action(record["action"]),
+                                                                       outcome=Outcome(record["outcome"]))
+
+    def as_row(self) -> tuple:
+        """The event as COPY wants it, with enums as their SMALLINT values."""
+        return (*self[:5], int(self.archetype), int(self.action), *self[7:10], int(self.outcome), *self[11:])
+
+
+class ReplayError(Exception):
+    """Raised when a game's events do not add up: a move is missing, or the recorded score differs from the replayed one."""
+
+
+def replay(events: Iterable[GameEvent]) -> Iterator[Tuple[GameEvent, GameState]]:
+    """Applies a game's events, in move order, to a new game. Yields each event with the state right after it."""
+    state = GameState()
+    for event in events:
+        if event.movenum != state.movenum:
+            raise ReplayError(f"Game {event.gameid} expected move {state.movenum} but the log has move {event.movenum}")
+        if event.home != (state.possession == "HOME"):
+            raise ReplayError(f"Game {event.gameid} move {event.movenum} was made by the wrong team")
+        state = apply_outcome(state, event.outcome)
+        if (state.homescore, state.awayscore) != (event.homescore, event.awayscore):
+            raise ReplayError(f"Game {event.gameid} move {event.movenum} recorded a score of {event.awayscore}-{event.homescore} "
+                              f"but replays to {state.awayscore}-{state.homescore}")
+        yield event, state
+
+
+class EventLog:
+    """
+    Collects the events of resolved moves in memory until the game store writes the game states they belong to. They
+    are COPYed in that same transaction (see ActiveGameStore._flush), so events are only ever written with their state.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self._pending: List[GameEvent] = []
+
+    def record(self, event: GameEvent):
+        self._pending.append(event)
+
+    def drain(self, work: UnitOfWork) -> List[GameEvent]:
+        """Queues every event recorded since the last drain on a unit of work. If the work fails they are dropped along with their states."""
+        events, self._pending = self._pending, []
+        work.copy("game_events", GameEvent._fields, (event.as_row() for event in events))
+        return events
+
+    def discard(self, game_id: int) -> List[GameEvent]:
+        """Takes a game's undrained events back out, for when the state they lead to will not be written."""
+        discarded = [event for event in self._pending if event.gameid == game_id]
+        self._pending = [event for event in self._pending if event.gameid != game_id]
+        return discarded
+
+    async def game(self, game_id: int) -> List[GameEvent]:
+        """Reads one game's events, in move order. Games are short, so this does not need to stream."""
+        return [GameEvent.from_record(record) for record in await self.bot.statements.game_events(game_id)]
+
+
+# Events with the teams that played, and which team had the puck, for export. The WHERE clause is added per scope.
+EXPORT_QUERY = """
+SELECT e.gameid, e.movenum, g.hometeam, g.awayteam, CASE WHEN e.home THEN g.hometeam ELSE g.awayteam END AS offenseteam,
+       e.playerid, e.goalieid, e.archetype, e.action, e.offensenumber, e.defensenumber, e.cleanpasses, e.outcome,
+       e.homescore, e.awayscore, e.resolvedat
+FROM game_events e JOIN games g USING (gameid)
+"""
+EXPORT_FILTERS = {
+    "game": "e.gameid = $1",
+    "team": "(g.hometeam = $1 OR g.awayteam = $1)",
+    "all": "TRUE",
+}
+EXPORT_COLUMNS = ("gameid", "movenum", "hometeam", "awayteam", "offenseteam", "playerid", "goalieid", "archetype", "action",
+                  "offensenumber", "defensenumber", "cleanpasses", "outcome", "homescore", "awayscore", "resolvedat")
+ENUM_COLUMNS = {"archetype": Archetype, "action": Action, "outcome": Outcome}  # Exported by name rather than SMALLINT value
+
+
+def export_query(scope: str, key=None, since: Optional[datetime.datetime] = None) -> Tuple[str, list]:
+    """The query and arguments that select the events of a game (key is its ID), a team (key is its team ID), or everything."""
+    if scope not in SCOPES:
+        raise ValueError(f"Unknown scope {scope}. Use one of {', '.join(SCOPES)}")
+    args = [] if scope == "all" else [key]
+    where = EXPORT_FILTERS[scope]
+    if since is not None:
+        args.append(since)
+        where += f" AND e.resolvedat >= ${len(args)}"
+    return f"{EXPORT_QUERY} WHERE {where} ORDER BY e.gameid, e.movenum", args
+
+
+async def stream_events(connection, query: str, args: list, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[tuple]]:
+    """Yields the export rows in batches from a server-side cursor, with enums replaced by their names."""
+    enum_positions = [(EXPORT_COLUMNS.index(column), enum) for column, enum in ENUM_COLUMNS.items()]
+    async with connection.transaction():  # Cursors only live inside a transaction
+        cursor = await connection.cursor(query, *args)
+        while True:
+            records = await cursor.fetch(batch_size)
+            if not records:
+                return
+            rows = []
+            for record in records:
+                row = list(record)
+                for position, enum in enum_positions:
+                    row[position] = enum(row[position]).name
+                rows.append(tuple(row))
+            yield rows
+
+
+class CsvWriter:
+    def __init__(self, output: BinaryIO):
+        self.text = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(row[:-1] + (row[-1].isoformat(),) for row in rows)
+
+    def close(self):
+        self.text.detach()  # Leave the underlying file open for the caller
+
+
+class ParquetWriter:
+    def __init__(self, output: BinaryIO):
+        if pq is None:
+            raise RuntimeError("Parquet export needs pyarrow. Install it with pip install pyarrow, or export as CSV.")
+        self.schema = pa.schema([("gameid", pa.int32()), ("movenum", pa.int16()), ("hometeam", pa.string()), ("awayteam", pa.string()),
+                                 ("offenseteam", pa.string()), ("playerid", pa.int64()), ("goalieid", pa.int64()), ("archetype", pa.dictionary(pa.int32(), pa.string())),
+                                 ("action", pa.dictionary(pa.int32(), pa.string())), ("offensenumber", pa.int16()), ("defensenumber", pa.int16()),
+                                 ("cleanpasses", pa.int16()), ("outcome", pa.dictionary(pa.int32(), pa.string())), ("homescore", pa.int16()),
+                                 ("awayscore", pa.int16()), ("resolvedat", pa.timestamp("us", tz="UTC"))])
+        self.writer = pq.ParquetWriter(output, self.schema, compression="zstd")
+
+    def write(self, rows: List[tuple]):
+        arrays = [pa.array(column, pa.string()).dictionary_encode() if pa.types.is_dictionary(field.type) else pa.array(column, field.type)
+                  for column, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+async def export_events(connection, output: BinaryIO, file_format: str, scope: str, key=None, since: Optional[datetime.datetime] = None,
+                        batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Writes the events of a scope (see export_query) to a binary file as CSV or Parquet, one batch at a time. Returns the number of events written."""
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format}. Use one of {', '.join(FORMATS)}")
+    query, args = export_query(scope, key, since)
+    writer = ParquetWriter(output) if file_format == "parquet" else CsvWriter(output)
+    written = 0
+    try:
+        async for rows in stream_events(connection, query, args, batch_size):
+            writer.write(rows)
+            written += len(rows)
+    finally:
+        writer.close()
+    return written
+
+
+async def main():
+    """Exports or replays events from the database in configuration.json."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write events to a CSV or Parquet file")
+    export.add_argument("scope", help="a game ID, a team ID, or all")
+    export.add_argument("--since", type=datetime.date.fromisoformat, help="only events from this date on, e.g. the start of the season")
+    export.add_argument("--format", choices=FORMATS, default="csv")
+    export.add_argument("--output", help="defaults to events-SCOPE.FORMAT")
+    replay_parser = commands.add_parser("replay", help="rebuild a game move by move from its events and check it against the games table")
+    replay_parser.add_argument("game_id", type=int)
+    args = parser.parse_args()
+
+    with open("configuration.json", "r") as configuration_file:
+        configuration = json.load(configuration_file)
+    connection = await asyncpg.connect(**configuration["postgresql_creds"])
+    try:
+        if args.command == "replay":
+            events = [GameEvent.from_record(record) for record in await connection.fetch(Statements.game_events.query, args.game_id)]
+            state = GameState()
+            try:
+                for event, state in replay(events):
+                    print(f"{event.movenum + 1:>3} {'HOME' if event.home else 'AWAY'} {event.action.name.lower():<5} {event.offensenumber:>4} vs. "
+                          f"{event.defensenumber:>4} {event.outcome.name:<13} {state.awayscore}-{state.homescore}")
+            except ReplayError as error:
+                sys.exit(f"Replay failed: {error}")
+            row = await connection.fetchrow("""SELECT homescore, awayscore, movenum, cleanpasses, possession, waitingon_pos FROM games WHERE gameid = $1""", args.game_id)
+            if row is None:
+                sys.exit(f"Game {args.game_id} does not exist")
+            stored = GameState(*row)
+            print(f"Replayed {len(events)} moves to {state}")
+            if stored != state:
+                sys.exit(f"The games table has {stored}")
+            print("Matches the games table.")
+            return
+
+        since = datetime.datetime.combine(args.since, datetime.time(), datetime.timezone.utc) if args.since else None
+        if args.scope.lower() == "all":
+            scope, key = "all", None
+        elif args.scope.isdigit():
+            scope, key = "game", int(args.scope)
+        else:
+            scope, key = "team", args.scope.upper()
+        path = args.output or f"events-{args.scope.lower()}.{args.format}"
+        with open(path, "wb") as output:
+            written = await export_events(connection, output, args.format, scope, key, since)
+        print(f"Wrote {written} events to {path}")
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
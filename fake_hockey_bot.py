@@ -22,11 +22,11 @@ import logging
 import sys
 import traceback
 
-import asyncpg
 import nextcord
 from nextcord.ext import commands
 
-from discord_db_client import create_bot
+from bot_logging import setup_logging
+from discord_db_client import create_bot, create_db_pool
 
 
 async def login():
@@ -36,10 +36,7 @@ async def login():
     logger.setLevel(logging.INFO)
     nextcord_logger = logging.getLogger("nextcord")
     nextcord_logger.setLevel(logging.INFO)
-    handler = logging.FileHandler(filename="bot.log", encoding="utf-8", mode="w")
-    handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
-    logger.addHandler(handler)
-    nextcord_logger.addHandler(handler)
+    log_listener = setup_logging([logger, nextcord_logger])  # Writes logs/bot.log from a background thread
 
     def excepthook(e_type, e_value, e_traceback):
         if issubclass(e_type, KeyboardInterrupt):
@@ -64,17 +61,25 @@ async def login():
     # Initializes some configuration objects
     activity = nextcord.Activity(type=nextcord.ActivityType[configuration["status"]["type"]], name=configuration["status"]["name"])
     logger.info("Connecting to database...")
-    db = await asyncpg.connect(**configuration["postgresql_creds"], server_settings={"application_name": configuration["app_name"]})
-    logger.info(f"Connection successful as user {configuration['postgresql_creds']['user']} "
+    pool_configuration = configuration.get("postgresql_pool", {})
+    db = await create_db_pool(configuration["postgresql_creds"], configuration["app_name"],
+                              min_size=pool_configuration.get("min_size", 2),
+                              max_size=pool_configuration.get("max_size", 10),
+                              acquire_timeout=pool_configuration.get("acquire_timeout", 10.0))
+    logger.info(f"Connection pool ({db.pool.get_min_size()}-{db.pool.get_max_size()} connections) opened successfully as user {configuration['postgresql_creds']['user']} "
                 f"to database {configuration['postgresql_creds']['database']} "
                 f"at server {configuration['postgresql_creds']['host']}:{configuration['postgresql_creds']['port']}")
 
     # Initializes client object
+    metrics_configuration = configuration.get("metrics", {})
     client = await create_bot(command_prefix=configuration["command_prefix"],
                               activity=activity,
                               help_command=commands.MinimalHelpCommand(),
                               db=db,
-                              logger=logger)
+                              logger=logger,
+                              metrics_enabled=metrics_configuration.get("enabled", True))
+    if metrics_configuration.get("prometheus_file"):
+        client.metrics.start_dump(metrics_configuration["prometheus_file"], metrics_configuration.get("dump_interval", 60.0))
 
     @client.event
     async def on_ready():
@@ -91,22 +96,32 @@ async def login():
         logging.error(exception)
         if event == "on_message":
             message = args[0]
-            log_channel = nextcord.utils.get(message.guild.channels, name="logs")
+            guild, where = message.guild, f"channel {message.channel.mention}" if message.guild else None
+            if guild is None:  # A goalie's DM, so report it in the server of their game
+                game = next((game for game in client.games if game.side_of_goalie(message.author.id)), None)
+                stadium = client.get_channel(game.stadium) if game else None
+                guild, where = (stadium.guild if stadium else None), f"DM from {message.author}"
+            if guild is None:
+                return
+            log_channel = client.guild_indexes.get(guild).channel_named("logs")
             errordesc = f"```py\n{exception}\n```"
             embed = nextcord.Embed(color=0xff0000, title="Error", description=errordesc)
-            await log_channel.send(content=f"Game error in channel {message.channel.mention}", embed=embed)
+            await log_channel.send(content=f"Game error in {where}", embed=embed)
 
     @client.event
     async def on_command(ctx):
+        client.metrics.command_started(ctx)
         logger.debug(f"{ctx.author} called command {ctx.command.name} with args {ctx.args} in channel {ctx.message.channel.id}")
 
     @client.event
     async def on_command_completion(ctx):
+        client.metrics.command_finished(ctx)
         logger.debug(f"Command {ctx.command.name} called by {ctx.author} completed without uncaught errors")
 
     @client.event
     async def on_command_error(ctx, error):
         """Basic error handling, including generic messages to send for common errors."""
+        client.metrics.command_finished(ctx, failed=True)
         error: Exception = getattr(error, "original", error)
         if ctx.command and ctx.command.has_error_handler():  # See TeamManagement.roster_error in cogs.py
             return
@@ -145,8 +160,10 @@ async def login():
     try:
         await client.start(token)
     except KeyboardInterrupt:
+        await client.close()  # Flushes queued webhook posts, so it has to happen before the pool closes
         await db.close()
-        await client.close()
+    finally:
+        log_listener.stop()  # Writes out whatever is still queued
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+Message routing index for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import enum
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class Route(enum.Enum):
+    IGNORE = "ignore"
+    STADIUM_MOVE = "stadium move"
+    GOALIE_LIST = "goalie list"
+
+
+class GameRouter:
+    """
+    Classifies every message the bot sees with dictionary lookups only, so that messages that have nothing to do with
+    a game are dropped without touching the database. Kept current by the game lifecycle (creategame, abandongame and
+    goalie list submissions) and rebuilt from the active games at startup.
+    """
+    def __init__(self, statements):
+        self.statements = statements
+        self.stadiums: Dict[int, int] = {}  # Stadium channel ID -> game ID
+        self.owed_lists: Dict[int, int] = {}  # Goalie user ID -> game ID
+        self._games: Dict[int, Tuple[int, Tuple[int, ...]]] = {}  # Game ID -> (stadium channel ID, goalie IDs)
+        self.routed = Counter()
+
+    async def load(self):
+        """Rebuilds the index from every active game."""
+        self.stadiums.clear()
+        self.owed_lists.clear()
+        self._games.clear()
+        for game in await self.statements.active_game_routes():
+            self.add_game(game["gameid"], game["stadium"], (game["homegoalie"], game["awaygoalie"]))
+
+    def add_game(self, game_id: int, stadium_id: int, goalie_ids: Iterable[Optional[int]]):
+        """Starts routing a game's stadium, and DMs from whichever of its goalies (skipping None) still owe a list."""
+        goalie_ids = tuple(goalie_id for goalie_id in goalie_ids if goalie_id is not None)
+        self._games[game_id] = (stadium_id, goalie_ids)
+        self.stadiums[stadium_id] = game_id
+        for goalie_id in goalie_ids:
+            self.owed_lists[goalie_id] = game_id
+
+    def remove_game(self, game_id: int):
+        stadium_id, goalie_ids = self._games.pop(game_id, (None, ()))
+        self.stadiums.pop(stadium_id, None)
+        for goalie_id in goalie_ids:
+            if self.owed_lists.get(goalie_id) == game_id:
+                del self.owed_lists[goalie_id]
+
+    def list_received(self, goalie_id: int):
+        """Stops routing a goalie's DMs once their number list has been accepted."""
+        self.owed_lists.pop(goalie_id, None)
+
+    def classify(self, message, own_id: int, command_prefix: str) -> Tuple[Route, Optional[int]]:
+        """
+        Returns what kind of message this is, and the ID of the game it belongs to (if any). The bot's own messages and
+        commands are ignored, so the counts only include messages the listener actually handles.
+        """
+        if message.author.id == own_id or message.content.startswith(command_prefix):
+            game_id, route = None, Route.IGNORE
+        elif message.guild is None:
+            game_id = self.owed_lists.get(message.author.id)
+            route = Route.GOALIE_LIST if game_id is not None else Route.IGNORE
+        else:
+            game_id = self.stadiums.get(message.channel.id)
+            route = Route.STADIUM_MOVE if game_id is not None else Route.IGNORE
+        self.routed[route] += 1
+        return route, game_id
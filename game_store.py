@@ -0,0 +1,244 @@
+"""
+In-memory active game state for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import contextlib
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from engine import Archetype, GameState
+from number_list import NumberList
+from statements import Statements
+
+
+class Roster(NamedTuple):
+    """A roster composite value (see schema.ROSTER_TYPES)."""
+    forward: int
+    forward_type: Archetype
+    defenseman: int
+    defenseman_type: Archetype
+    goalie: int
+
+    @classmethod
+    def from_db(cls, roster) -> "Roster":
+        return cls(roster["forward"]["playerid"], Archetype.from_db(roster["forward"]["playertype"]),
+                   roster["defenseman"]["playerid"], Archetype.from_db(roster["defenseman"]["playertype"]), roster["goalie"])
+
+    def skater(self, position: str) -> Tuple[int, Archetype]:
+        """Returns the player ID and archetype of the FORWARD or DEFENSEMAN."""
+        return (self.forward, self.forward_type) if position == "FORWARD" else (self.defenseman, self.defenseman_type)
+
+
+@dataclass
+class ActiveGame:
+    """An active game. Fixed details never change after creation; state, deadline, delays and numbers change per move."""
+    __slots__ = ("game_id", "home_team", "away_team", "stadium", "home_roster", "away_roster", "state", "deadline",
+                 "home_delays", "away_delays", "home_numbers", "away_numbers", "game_active")
+    game_id: int
+    home_team: str
+    away_team: str
+    stadium: int
+    home_roster: Roster
+    away_roster: Roster
+    state: GameState
+    deadline: datetime.datetime
+    home_delays: int
+    away_delays: int
+    home_numbers: Optional[NumberList]
+    away_numbers: Optional[NumberList]
+    game_active: bool
+
+    @classmethod
+    def from_record(cls, record) -> "ActiveGame":
+        state = GameState(record["homescore"], record["awayscore"], record["movenum"], record["cleanpasses"], record["possession"], record["waitingon_pos"])
+        numbers = [NumberList.from_bytes(record[column]) if record[column] is not None else None for column in ("homenumbers", "awaynumbers")]
+        return cls(record["gameid"], record["hometeam"], record["awayteam"], record["stadium"], Roster.from_db(record["homeroster"]),
+                   Roster.from_db(record["awayroster"]), state, record["deadline"], record["homedelays"], record["awaydelays"],
+                   numbers[0], numbers[1], record["game_active"])
+
+    @property
+    def waitingon_side(self) -> str:
+        return self.state.possession  # The team with the puck is always the one waited on
+
+    def team(self, side: str) -> str:
+        return self.home_team if side == "HOME" else self.away_team
+
+    def roster(self, side: str) -> Roster:
+        return self.home_roster if side == "HOME" else self.away_roster
+
+    def numbers(self, side: str) -> Optional[NumberList]:
+        return self.home_numbers if side == "HOME" else self.away_numbers
+
+    def side_of_goalie(self, goalie_id: int) -> Optional[str]:
+        if goalie_id == self.home_roster.goalie:
+            return "HOME"
+        if goalie_id == self.away_roster.goalie:
+            return "AWAY"
+        return None
+
+    def save_args(self) -> tuple:
+        """The arguments of Statements.save_game_state."""
+        state = self.state
+        return (self.game_id, state.homescore, state.awayscore, state.movenum, state.cleanpasses, state.possession, state.waitingon_pos,
+                self.deadline, self.game_active)
+
+
+class ActiveGameStore:
+    """
+    Holds every active game in memory, so commands and the move processor never wait on a database read. Loaded in one
+    query at startup. Changes are applied in memory first and then written behind: save() queues the game and one
+    flusher task writes everything queued so far in a single transaction (group commit), resolving each caller's
+    future once its write is durable. There is only ever one flush in flight, so writes land in the order they were
+    made, and a game changed several times while a flush was running is written once, with its latest state. The
+    statistics and play-by-play events of the moves being saved are written in the same transaction (see
+    stats.StatsEngine and events.EventLog). If a write fails, its games go back to their last committed state, along
+    with any change made to them while the write was in flight, so memory never gets ahead of the database.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.games: Dict[int, ActiveGame] = {}
+        self._pending: Dict[int, Tuple[ActiveGame, List[asyncio.Future]]] = {}  # Game ID -> (game, callers waiting for its write)
+        self._committed: Dict[int, tuple] = {}  # Game ID -> save_args() of the last state known to be in the database
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.writes = 0
+
+    def __len__(self):
+        return len(self.games)
+
+    def __iter__(self) -> Iterator[ActiveGame]:
+        return iter(sorted(self.games.values(), key=lambda game: game.game_id))
+
+    def get(self, game_id: int) -> Optional[ActiveGame]:
+        return self.games.get(game_id)
+
+    async def load(self):
+        """Rebuilds the store from every active game. Only needs to run once, at startup."""
+        self.games = {record["gameid"]: ActiveGame.from_record(record) for record in await self.bot.statements.active_game_states()}
+        self._committed = {game_id: game.save_args() for game_id, game in self.games.items()}
+
+    async def add(self, game_id: int) -> Optional[ActiveGame]:
+        """Starts holding a newly created game. This is the only read of a game's row while it is active."""
+        record = await self.bot.statements.game_state(game_id)
+        if record is None:
+            return None
+        game = self.games[game_id] = ActiveGame.from_record(record)
+        self._committed[game_id] = game.save_args()
+        return game
+
+    def deadline_changed(self, game_id: int, deadline: datetime.datetime):
+        """Records a deadline written outside the store (see Statements.charge_delay), so a failed write never rolls it back."""
+        committed = self._committed.get(game_id)
+        if committed is not None:
+            self._committed[game_id] = (*committed[:7], deadline, committed[8])
+
+    def remove(self, game_id: int):
+        self.games.pop(game_id, None)
+
+    def save(self, game: ActiveGame) -> asyncio.Future:
+        """Queues a changed game to be written. The returned future resolves once the write has been committed."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(game.game_id, (game, []))[1].append(future)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_forever())
+        self._wakeup.set()
+        return future
+
+    async def _flush_forever(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Writes every queued game in one transaction."""
+        async with self._flush_lock:
+            await self._flush()
+
+    @contextlib.asynccontextmanager
+    async def writes_held(self):
+        """Writes everything queued, then holds off further writes until the block exits."""
+        async with self._flush_lock:
+            await self._flush()
+            yield
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        args = [game.save_args() for game, _ in pending.values()]  # Includes games that ended and were removed since
+        deltas = None
+        try:
+            async with self.bot.unit_of_work() as work:
+                work.add_many(Statements.save_game_state, args)
+                deltas = self.bot.stats.drain(work)  # Stats and events cover exactly the moves being saved, in the same transaction
+                self.bot.events.drain(work)
+        except Exception as error:
+            if deltas is not None:
+                self.bot.stats.revert(deltas)
+            self.bot.logger.error(f"Failed to write {len(args)} game(s) to the database: {error!r}")
+            for game_id, (game, waiters) in pending.items():
+                newer = self._pending.pop(game_id, None)
+                if newer is not None:  # Changes made while this write was in flight build on the state that failed, so they go too
+                    self.bot.stats.forget(newer[0], self.bot.events.discard(game_id))
+                    waiters = waiters + newer[1]
+                self._fail(waiters, error)
+                self._restore(game)
+            return
+        self.flushes += 1
+        self.writes += len(args)
+        for saved in args:
+            if saved[-1]:
+                self._committed[saved[0]] = saved
+            else:
+                self._committed.pop(saved[0], None)
+        for _, waiters in pending.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+
+    @staticmethod
+    def _fail(waiters: List[asyncio.Future], error: Exception):
+        for future in waiters:
+            if not future.done():
+                future.set_exception(error)
+
+    def _restore(self, game: ActiveGame):
+        """
+        Puts a game whose write failed back in its last committed state, in place, so anything still holding it sees the
+        same state as the store. If the failed change ended the game, it is put back in the store, on the router and on
+        the deadline timers too.
+        """
+        committed = self._committed.get(game.game_id)
+        if committed is None:
+            return
+        game.state, game.deadline, game.game_active = GameState(*committed[1:7]), committed[7], committed[8]
+        if not game.game_active:
+            return
+        self.games[game.game_id] = game
+        self.bot.router.add_game(game.game_id, game.stadium, (game.roster(side).goalie for side in ("HOME", "AWAY") if game.numbers(side) is None))
+        self.bot.deadlines.track(game.game_id, game.deadline)
+
+    async def close(self):
+        """Writes whatever is still queued, then stops the flusher."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,112 @@
+"""
+Guild lookup indexes for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Dict, Iterable, Optional, Union
+
+import nextcord
+
+
+def _by_name(items: Iterable) -> Dict[str, object]:
+    """Maps names to items, keeping the first item with each name so lookups agree with nextcord.utils.get."""
+    index = {}
+    for item in items:
+        index.setdefault(item.name, item)
+    return index
+
+
+class GuildIndex:
+    """
+    Name lookups for one guild's roles, emojis, channels and categories. Lookups by ID need no index, since the guild
+    already keeps its roles, members and channels in dictionaries (Guild.get_role, get_member and get_channel).
+    """
+    def __init__(self, guild: nextcord.Guild):
+        self.guild = guild
+        self.index_roles()
+        self.index_emojis()
+        self.index_channels()
+
+    # Renames, creations and deletions are rare, so each event just rebuilds the affected index
+    def index_roles(self):
+        self.roles = _by_name(self.guild.roles)
+
+    def index_emojis(self):
+        self.emojis = _by_name(self.guild.emojis)
+
+    def index_channels(self):
+        self.channels = _by_name(self.guild.channels)
+        self.categories = _by_name(self.guild.categories)
+
+    def role_named(self, name: str) -> Optional[nextcord.Role]:
+        return self.roles.get(name)
+
+    def emoji_named(self, name: str) -> Optional[nextcord.Emoji]:
+        return self.emojis.get(name)
+
+    def channel_named(self, name: str) -> Optional[nextcord.abc.GuildChannel]:
+        return self.channels.get(name)
+
+    def category_named(self, name: str) -> Optional[nextcord.CategoryChannel]:
+        return self.categories.get(name)
+
+
+class GuildIndexes:
+    """Keeps a GuildIndex per guild, built on first use and kept current from gateway events."""
+    def __init__(self, bot):
+        self.bot = bot
+        self._indexes: Dict[int, GuildIndex] = {}
+        for listener in (self.on_guild_role_create, self.on_guild_role_delete, self.on_guild_role_update, self.on_guild_emojis_update,
+                         self.on_guild_channel_create, self.on_guild_channel_delete, self.on_guild_channel_update, self.on_guild_remove):
+            bot.add_listener(listener)
+
+    def get(self, guild: Union[nextcord.Guild, int]) -> GuildIndex:
+        guild_id = guild if isinstance(guild, int) else guild.id
+        index = self._indexes.get(guild_id)
+        if index is None:
+            index = self._indexes[guild_id] = GuildIndex(guild if not isinstance(guild, int) else self.bot.get_guild(guild_id))
+        return index
+
+    def _refresh(self, guild: nextcord.Guild, attribute: str):
+        index = self._indexes.get(guild.id)
+        if index is not None:
+            getattr(index, attribute)()
+
+    async def on_guild_role_create(self, role: nextcord.Role):
+        self._refresh(role.guild, "index_roles")
+
+    async def on_guild_role_delete(self, role: nextcord.Role):
+        self._refresh(role.guild, "index_roles")
+
+    async def on_guild_role_update(self, before: nextcord.Role, after: nextcord.Role):
+        if before.name != after.name or before.position != after.position:
+            self._refresh(after.guild, "index_roles")
+
+    async def on_guild_emojis_update(self, guild: nextcord.Guild, before, after):
+        self._refresh(guild, "index_emojis")
+
+    async def on_guild_channel_create(self, channel: nextcord.abc.GuildChannel):
+        self._refresh(channel.guild, "index_channels")
+
+    async def on_guild_channel_delete(self, channel: nextcord.abc.GuildChannel):
+        self._refresh(channel.guild, "index_channels")
+
+    async def on_guild_channel_update(self, before: nextcord.abc.GuildChannel, after: nextcord.abc.GuildChannel):
+        if before.name != after.name or before.position != after.position:
+            self._refresh(after.guild, "index_channels")
+
+    async def on_guild_remove(self, guild: nextcord.Guild):
+        self._indexes.pop(guild.id, None)
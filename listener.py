@@ -16,48 +16,172 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import datetime
+import re
+from typing import Optional, Tuple
 
 import nextcord
-from nextcord.ext import commands, tasks
+from nextcord.ext import commands
 
 from discord_db_client import Bot
-from util import home_away_opposite
+from engine import Action, Outcome, apply_outcome, resolve_move
+from events import GameEvent
+from game_router import Route
+from game_store import ActiveGame
+from number_list import NumberList, NumberListError
+from util import DEADLINE_LENGTH, MOVES_PER_PERIOD, home_away_opposite
+
+MOVE = re.compile(r"^\s*(pass|shoot|deke)\s+(\d{1,4})\s*$", re.IGNORECASE)
+OUTCOME_MESSAGES = {
+    Outcome.PASS_COMPLETE: "Pass completed!",
+    Outcome.DEKE_COMPLETE: "Deke successful!",
+    Outcome.TURNOVER: "Turnover!",
+    Outcome.GOAL: "GOAL!",
+    Outcome.SAVE: "Save!",
+    Outcome.MISS: "Shot missed the net!",
+}
+
+
+def parse_move(content: str) -> Optional[Tuple[Action, int]]:
+    """Parses a move message such as "pass 512". Returns None if the message is not a move."""
+    match = MOVE.match(content)
+    if match is None:
+        return None
+    return Action[match.group(1).upper()], int(match.group(2))
 
 
 class Listener(commands.Cog):
     """Handles game-related functions, and manages game-related tasks and caches."""
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.check_for_deadline.start()
-
-    @tasks.loop(hours=1)
-    async def check_for_deadline(self):
-        deadlines = await self.bot.db.fetch("""SELECT stadium, deadline, hometeam, awayteam, homedelays, awaydelays,
-                                               waitingon_side, waitingon_pos FROM games WHERE game_active IS FALSE""")
-        for game in deadlines:
-            erring_team = game["hometeam"] if game["waitingon_side"] == "HOME" else game["awayteam"]
-            other_team = home_away_opposite(game["waitingon_side"])
-            if game["deadline"] - datetime.timedelta(hours=7) < nextcord.utils.utcnow() < game["deadline"] - datetime.timedelta(hours=6):
-                stadium = self.bot.get_channel(game["stadium"])
-                await stadium.send(f"Warning: ")
-
-    @check_for_deadline.before_loop
-    async def before_deadline_check(self):
-        """Don't start deadline checks until fully logged into the API"""
-        await self.bot.wait_until_ready()
 
-    def cog_unload(self):
-        self.check_for_deadline.cancel()
+    @commands.Cog.listener()
+    async def on_deadline_warning(self, game_id: int):
+        """Fired by bot.deadlines DEADLINE_WARNING before a game's deadline."""
+        await self.bot.wait_until_ready()
+        game = self.bot.games.get(game_id)
+        if game is None:
+            return
+        stadium = self.bot.get_channel(game.stadium)
+        erring_team = self.bot.role_from_id(stadium.guild.id, game.team(game.waitingon_side))
+        await stadium.send(f"Warning: {erring_team.mention} {game.state.waitingon_pos.lower()} has until "
+                           f"<t:{int(game.deadline.timestamp())}:f> (<t:{int(game.deadline.timestamp())}:R>) to submit a number.")
+
+    @commands.Cog.listener()
+    async def on_deadline_expired(self, game_id: int):
+        """Fired by bot.deadlines when a game's deadline passes. Charges the team being waited on a delay and resets the deadline."""
+        await self.bot.wait_until_ready()
+        game = self.bot.games.get(game_id)
+        if game is None:
+            return
+        await self.bot.games.flush()  # charge_delay reads waitingon_side from the row, so it has to be current
+        delay = await self.bot.statements.charge_delay(game_id, DEADLINE_LENGTH)
+        if delay is None:
+            return
+        game.deadline, game.home_delays, game.away_delays = delay["deadline"], delay["homedelays"], delay["awaydelays"]
+        self.bot.games.deadline_changed(game_id, game.deadline)
+        self.bot.deadlines.track(game_id, game.deadline)
+        self.bot.scoreboards.game_changed(game)
+        stadium = self.bot.get_channel(game.stadium)
+        erring_side = game.waitingon_side.lower()
+        erring_team = self.bot.role_from_id(stadium.guild.id, game.team(game.waitingon_side))
+        await stadium.send(f"Deadline passed: {erring_team.mention} has been charged a delay "
+                           f"({delay[f'{erring_side}delays']} total). New deadline: <t:{int(delay['deadline'].timestamp())}:f>")
 
     @commands.Cog.listener(name="on_message")
     async def process_game(self, message):
-        # Do not listen to messages that are sent by the bot itself or commands
-        if message.content.startswith(self.bot.command_prefix) or message.author.id == self.bot.user.id:
+        # Drop the bot's own messages, commands, and everything outside active stadiums and goalie DMs before doing any other work
+        route, game_id = self.bot.router.classify(message, self.bot.user.id, self.bot.command_prefix)
+        if route is Route.IGNORE:
             return
 
+        if route is Route.GOALIE_LIST:
+            return await self.process_goalie_list(message, game_id)
+        return await self.process_move(message, game_id)
+
+    async def process_move(self, message, game_id: int):
+        """
+        Handles a message sent in an active game's stadium. Reads and updates the game in memory only. Nothing is awaited
+        between reading the game and updating it, so moves of one game cannot interleave, and a game abandoned meanwhile
+        is never moved.
+        """
         if "cookie" in message.content.lower():
             await message.channel.send("🍪")
+        game = self.bot.games.get(game_id)
+        if game is None:
+            return
+        offense_side = game.waitingon_side
+        player_id, archetype = game.roster(offense_side).skater(game.state.waitingon_pos)
+        move = parse_move(message.content)
+        if message.author.id != player_id or move is None:
+            return
+        action, number = move
+        if not 1 <= number <= 1000:
+            return await message.reply("Error: Your number must be between 1 and 1000.")
+        defense_numbers = game.numbers(home_away_opposite(offense_side))
+        if defense_numbers is None:
+            return await message.reply("Error: The defending goalie has not sent their number list yet. Please wait for it before moving.")
+
+        defense_number = defense_numbers.number_for_move(game.state.movenum)
+        outcome = resolve_move(action, number, defense_number, archetype, game.state.cleanpasses)
+        self.bot.stats.move_resolved(game, offense_side, player_id, action, archetype, outcome)
+        before, now = game.state, nextcord.utils.utcnow()
+        game.state = apply_outcome(before, outcome)
+        game.deadline = now + DEADLINE_LENGTH
+        self.bot.events.record(GameEvent.of_move(game, before, player_id, archetype, action, number, defense_number, outcome, now))
+        if game.state.is_over:
+            self.bot.stats.game_finished(game)
+            game.game_active = False
+            self.bot.games.remove(game_id)
+            self.bot.deadlines.untrack(game_id)
+            self.bot.router.remove_game(game_id)
+        else:
+            self.bot.deadlines.track(game_id, game.deadline)
+        try:
+            await self.bot.games.save(game)  # Only announce the result once it is durable
+        except Exception:  # Already logged; the store has gone back to the last saved state of the game
+            return await message.reply("Error: Your move could not be saved. Please send it again.")
+
+        await message.reply(f"{OUTCOME_MESSAGES[outcome]} ({action.name.lower()} {number} vs. {defense_number})\n"
+                            f"{self.scoreline(game)}")
+        if not game.game_active:
+            await self.finish_game(message.channel, game)
+        else:
+            self.bot.scoreboards.game_changed(game)
+            waiting_role = self.bot.role_from_id(message.guild.id, game.team(game.waitingon_side))
+            await message.channel.send(f"Waiting on {waiting_role.mention} {game.state.waitingon_pos.lower()}. "
+                                       f"Deadline: <t:{int(game.deadline.timestamp())}:f>")
+
+    def scoreline(self, game: ActiveGame) -> str:
+        state = game.state
+        period, moves_left = min(state.movenum // MOVES_PER_PERIOD + 1, 3), MOVES_PER_PERIOD - state.movenum % MOVES_PER_PERIOD
+        if not game.game_active:
+            return f"{game.away_team} {state.awayscore} - {state.homescore} {game.home_team} (FINAL)"
+        return (f"{game.away_team} {state.awayscore} - {state.homescore} {game.home_team} "
+                f"({state.cleanpasses} CP | {moves_left} moves left | {['x', '1st', '2nd', '3rd'][period]})")
+
+    async def finish_game(self, stadium, game: ActiveGame):
+        scores_channel = self.bot.guild_indexes.get(stadium.guild).channel_named("scores")
+        await scores_channel.send(f"{self.bot.emoji_from_id(stadium.guild.id, game.away_team)} {game.state.awayscore} - "
+                                  f"{game.state.homescore} {self.bot.emoji_from_id(stadium.guild.id, game.home_team)} (FINAL)")
+        vacant_category = self.bot.guild_indexes.get(stadium.guild).category_named("Vacant Stadiums")
+        await stadium.send("Game over!")
+        self.bot.scoreboards.game_ended(game, vacant_category)
+
+    async def process_goalie_list(self, message, game_id: int):
+        """Handles a DM from a goalie who still owes their number list."""
+        try:
+            numbers = NumberList.parse(message.content)
+        except NumberListError as error:
+            return await message.reply(f"Error: Your list could not be accepted. Please fix the following and send the whole list again:\n{error}")
+        await self.bot.statements.set_goalie_numbers(game_id, message.author.id, numbers.to_bytes())
+        game = self.bot.games.get(game_id)
+        side = game.side_of_goalie(message.author.id) if game else None
+        if side == "HOME":
+            game.home_numbers = numbers
+        elif side == "AWAY":
+            game.away_numbers = numbers
+        self.bot.router.list_received(message.author.id)
+        return await message.reply(f"Success: Your list of {len(numbers)} numbers has been received.")
 
 
 def setup(bot: Bot):
@@ -0,0 +1,224 @@
+"""
+Latency instrumentation for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import bisect
+import os
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets, in seconds. Anything slower lands in the overflow bucket.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COMMAND = "command"
+STATEMENT = "statement"
+DISCORD = "discord"
+KINDS = (COMMAND, STATEMENT, DISCORD)
+
+
+class Histogram:
+    """A fixed-bucket latency histogram. Cheap to update; percentiles are estimated from the buckets."""
+    __slots__ = ("counts", "count", "errors", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, failed: bool = False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if failed:
+            self.errors += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the upper bound of the bucket holding the given fraction of observations (the max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class _Measurement:
+    """Times one operation and records it when the with block exits."""
+    __slots__ = ("metrics", "kind", "name", "start")
+
+    def __init__(self, metrics: "Metrics", kind: str, name: str):
+        self.metrics = metrics
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.metrics.in_flight[self.kind] += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.in_flight[self.kind] -= 1
+        self.metrics.observe(self.kind, self.name, time.perf_counter() - self.start, failed=exc_type is not None)
+
+
+class _NotMeasured:
+    """Stands in for _Measurement while metrics are disabled, so the hot paths only pay for one attribute check."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NOT_MEASURED = _NotMeasured()
+
+
+class Metrics:
+    """
+    Collects latency histograms and in-flight counts for commands, prepared statements and Discord REST calls. Read by
+    the metrics owner command and optionally dumped to a file in the Prometheus text format.
+    """
+    def __init__(self, logger, enabled: bool = True):
+        self.logger = logger
+        self.enabled = enabled
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.in_flight = Counter()
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.started = time.time()
+        self._dump_task: Optional[asyncio.Task] = None
+
+    def measure(self, kind: str, name: str):
+        """Returns a context manager that records how long its block takes."""
+        return _Measurement(self, kind, name) if self.enabled else _NOT_MEASURED
+
+    def observe(self, kind: str, name: str, seconds: float, failed: bool = False):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get((kind, name))
+        if histogram is None:
+            histogram = self.histograms[(kind, name)] = Histogram()
+        histogram.observe(seconds, failed)
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Registers a value read whenever metrics are rendered, such as a queue's depth. Names ending in _total are counters."""
+        self.gauges[name] = read
+
+    def of_kind(self, kind: str) -> List[Tuple[str, Histogram]]:
+        """Returns every (name, histogram) pair of one kind, slowest total time first."""
+        return sorted(((name, histogram) for (histogram_kind, name), histogram in self.histograms.items() if histogram_kind == kind),
+                      key=lambda item: item[1].total, reverse=True)
+
+    def reset(self):
+        self.histograms.clear()
+        self.started = time.time()
+
+    # Commands start and finish in separate events, so the start time rides along on the context
+    def command_started(self, ctx):
+        if self.enabled:
+            self.in_flight[COMMAND] += 1
+            ctx.metrics_start = time.perf_counter()
+
+    def command_finished(self, ctx, failed: bool = False):
+        start = getattr(ctx, "metrics_start", None)
+        if start is None or ctx.command is None:  # Metrics were disabled when it started, or the command was not found
+            return
+        del ctx.metrics_start
+        self.in_flight[COMMAND] -= 1
+        self.observe(COMMAND, ctx.command.qualified_name, time.perf_counter() - start, failed)
+
+    def instrument_http(self, http):
+        """Wraps a nextcord HTTPClient so that every REST call is timed under its method and unformatted route path."""
+        request = http.request
+
+        async def timed_request(route, **kwargs):
+            if not self.enabled:
+                return await request(route, **kwargs)
+            with self.measure(DISCORD, f"{route.method} {route.path}"):
+                return await request(route, **kwargs)
+        http.request = timed_request
+
+    def prometheus(self) -> str:
+        """Renders every histogram, in-flight count and gauge in the Prometheus text exposition format."""
+        lines = []
+        for kind in KINDS:
+            metric = f"fake_hockey_bot_{kind}_duration_seconds"
+            lines.append(f"# HELP {metric} Latency of {kind}s.")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in self.of_kind(kind):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{name="{label}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{name="{label}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{name="{label}"}} {histogram.count}')
+            errors = f"fake_hockey_bot_{kind}_errors_total"
+            lines.append(f"# TYPE {errors} counter")
+            for name, histogram in self.of_kind(kind):
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{errors}{{name="{label}"}} {histogram.errors}')
+        lines.append("# TYPE fake_hockey_bot_in_flight gauge")
+        for kind in KINDS:
+            lines.append(f'fake_hockey_bot_in_flight{{kind="{kind}"}} {self.in_flight[kind]}')
+        for name, read in self.gauges.items():
+            lines.append(f"# TYPE fake_hockey_bot_{name} {'counter' if name.endswith('_total') else 'gauge'}")
+            lines.append(f"fake_hockey_bot_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write(path: str, text: str):
+        # Written next to the target and renamed over it, so a scraper never reads a half-written file
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temporary_path, path)
+
+    async def dump(self, path: str):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, path, self.prometheus())
+
+    def start_dump(self, path: str, interval: float = 60.0):
+        """Rewrites the Prometheus text file every interval seconds, for node_exporter's textfile collector or similar."""
+        async def dump_forever():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.dump(path)
+                except OSError as error:
+                    self.logger.warning(f"Could not write metrics to {path}: {error}")
+        if self._dump_task is None or self._dump_task.done():
+            self._dump_task = asyncio.get_running_loop().create_task(dump_forever())
+
+    def stop(self):
+        if self._dump_task is not None:
+            self._dump_task.cancel()
+            self._dump_task = None
@@ -0,0 +1,117 @@
+"""
+Parsing and storage of goalie number lists for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+from array import array
+from typing import List, Tuple
+
+from engine import MAX_NUMBER, MIN_NUMBER
+from util import MOVES_PER_GAME
+
+
+MAX_REPORTED_ERRORS = 10
+
+
+class NumberListError(ValueError):
+    """
+    Raised when a pasted number list is invalid. errors holds (entry number, entry, reason) for every problem, with
+    entry number 0 for problems with the list as a whole.
+    """
+    def __init__(self, errors: List[Tuple[int, str, str]]):
+        self.errors = errors
+        lines = [self._describe(*error) for error in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            lines.append(f"...and {len(errors) - MAX_REPORTED_ERRORS} more")
+        super().__init__("\n".join(lines))
+
+    @staticmethod
+    def _describe(position: int, entry: str, reason: str) -> str:
+        if position == 0:  # Problems with the list as a whole
+            return f"The {reason}"
+        return f"Entry {position} (`{entry}`): {reason}" if entry else f"Entry {position}: {reason}"
+
+
+class NumberList:
+    """
+    A goalie's list of numbers, one per move. Stored as an array of unsigned shorts (two bytes per number) both in
+    memory and in the database, where it is kept as little-endian bytea.
+    """
+    __slots__ = ("_numbers",)
+
+    def __init__(self, numbers: array):
+        self._numbers = numbers
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __getitem__(self, index: int) -> int:
+        return self._numbers[index]
+
+    def __iter__(self):
+        return iter(self._numbers)
+
+    def __eq__(self, other):
+        return isinstance(other, NumberList) and self._numbers == other._numbers
+
+    def number_for_move(self, movenum: int) -> int:
+        """The number to use on the given move (games.movenum, starting at 0)."""
+        return self._numbers[movenum]
+
+    @classmethod
+    def parse(cls, text: str, minimum: int = MOVES_PER_GAME) -> "NumberList":
+        """
+        Validates and converts a comma separated list in a single pass. Whitespace around entries and one trailing
+        comma are allowed. Raises NumberListError listing every bad entry.
+        """
+        entries = text.split(",")
+        if entries and not entries[-1].strip():
+            entries.pop()
+        numbers = array("H")
+        errors = []
+        for position, entry in enumerate(entries, start=1):
+            entry = entry.strip()
+            if not entry:
+                errors.append((position, entry, "empty entry"))
+            elif not (entry.isascii() and entry.isdigit()):
+                errors.append((position, entry, "not a whole number"))
+            else:
+                number = int(entry)
+                if MIN_NUMBER <= number <= MAX_NUMBER:
+                    numbers.append(number)
+                else:
+                    errors.append((position, entry, f"not between {MIN_NUMBER} and {MAX_NUMBER}"))
+        if not errors and len(numbers) < minimum:
+            errors.append((0, "", f"list has {len(numbers)} numbers, but at least {minimum} are needed"))
+        if errors:
+            raise NumberListError(errors)
+        return cls(numbers)
+
+    def to_bytes(self) -> bytes:
+        if sys.byteorder == "little":
+            return self._numbers.tobytes()
+        swapped = array("H", self._numbers)
+        swapped.byteswap()
+        return swapped.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "NumberList":
+        numbers = array("H")
+        numbers.frombytes(data)
+        if sys.byteorder != "little":
+            numbers.byteswap()
+        return cls(numbers)
@@ -0,0 +1,163 @@
+"""
+In-memory player name search for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+WORD = re.compile(r"\w+")
+
+APOSTROPHES = str.maketrans("", "", "'\u2019")  # Removed rather than split on, so "O'Brien" is one word
+
+# Scores for how well one query word matched one name word
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.75
+TYPO_SCORE = 0.5
+MIN_TYPO_LENGTH = 4  # Shorter words have too many neighbours one edit away to be useful
+MAX_PREFIX_MATCHES = 200  # Words checked per query word, so a one-letter prefix cannot walk the whole index
+
+
+def normalize(text: str) -> List[str]:
+    """Splits a name or query into lowercase, accent-free words. Punctuation is dropped, so any input is safe to search."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold().translate(APOSTROPHES))
+    return WORD.findall("".join(character for character in decomposed if not unicodedata.combining(character)))
+
+
+def deletions(word: str) -> Set[str]:
+    """Every string one deleted character away from a word. Two words within one edit of each other share one of these."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class SearchResult(NamedTuple):
+    player_id: int
+    score: float
+    exact: bool  # Every query word matched a name word exactly, and the name has no words the query left out
+
+
+class PlayerSearch:
+    """
+    Indexes every player's first and last name in memory. Supports exact, prefix and typo-tolerant (one insertion,
+    deletion, substitution or transposition, found through an index of single-character deletions) matching of each
+    query word; a player matches when every query word matches one of their name words. Loaded at startup and
+    kept in sync by the commands that register, rename and delete players.
+    """
+    def __init__(self, statements):
+        self.statements = statements
+        self.names: Dict[int, Tuple[str, str]] = {}  # Player ID -> (first name, last name)
+        self.words: Dict[int, Tuple[str, ...]] = {}  # Player ID -> normalized name words
+        self.players_by_word: Dict[str, Set[int]] = defaultdict(set)
+        self.words_by_deletion: Dict[str, Set[str]] = defaultdict(set)
+        self.sorted_words: List[str] = []
+
+    def __len__(self):
+        return len(self.names)
+
+    async def load(self):
+        self.names.clear()
+        self.words.clear()
+        self.players_by_word.clear()
+        self.words_by_deletion.clear()
+        self.sorted_words.clear()
+        for player in await self.statements.player_names():
+            self.add(player["playerid"], player["firstname"], player["lastname"], keep_sorted=False)
+        self.sorted_words = sorted(self.players_by_word)  # One sort instead of an insort per new word
+
+    def add(self, player_id: int, first_name: str, last_name: str, keep_sorted: bool = True):
+        """Indexes a player, replacing their previous name if they were already indexed."""
+        self.remove(player_id)
+        words = tuple(normalize(f"{first_name} {last_name}"))
+        self.names[player_id] = (first_name, last_name)
+        self.words[player_id] = words
+        for word in words:
+            players = self.players_by_word[word]
+            if not players:
+                if keep_sorted:
+                    bisect.insort(self.sorted_words, word)
+                if len(word) >= MIN_TYPO_LENGTH:
+                    for deletion in deletions(word) | {word}:
+                        self.words_by_deletion[deletion].add(word)
+            players.add(player_id)
+
+    def remove(self, player_id: int):
+        self.names.pop(player_id, None)
+        for word in self.words.pop(player_id, ()):
+            players = self.players_by_word.get(word)
+            if players is None:
+                continue
+            players.discard(player_id)
+            if not players:
+                del self.players_by_word[word]
+                del self.sorted_words[bisect.bisect_left(self.sorted_words, word)]
+                if len(word) >= MIN_TYPO_LENGTH:
+                    for deletion in deletions(word) | {word}:
+                        self.words_by_deletion[deletion].discard(word)
+                        if not self.words_by_deletion[deletion]:
+                            del self.words_by_deletion[deletion]
+
+    def rename(self, player_id: int, first_name: Optional[str] = None, last_name: Optional[str] = None):
+        """Re-indexes a player after a name change. Pass only the part that changed; the other is kept."""
+        if player_id not in self.names:
+            return
+        old_first_name, old_last_name = self.names[player_id]
+        self.add(player_id, old_first_name if first_name is None else first_name, old_last_name if last_name is None else last_name)
+
+    def _word_matches(self, query_word: str) -> Dict[str, float]:
+        """Returns each indexed word that matches one query word, with its score."""
+        matches = {}
+        start = bisect.bisect_left(self.sorted_words, query_word)
+        for word in self.sorted_words[start:start + MAX_PREFIX_MATCHES]:
+            if not word.startswith(query_word):
+                break
+            matches[word] = EXACT_SCORE if word == query_word else PREFIX_SCORE
+        if query_word in matches or len(query_word) < MIN_TYPO_LENGTH:
+            return matches
+
+        # No exact match, so also look for words one edit away
+        for deletion in deletions(query_word) | {query_word}:
+            for word in self.words_by_deletion.get(deletion, ()):
+                matches.setdefault(word, TYPO_SCORE)
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """Returns up to limit players matching every word of the query, best first."""
+        query_words = normalize(query)
+        if not query_words:
+            return []
+        scores: Dict[int, float] = {}
+        exact_words: Dict[int, int] = defaultdict(int)
+        for position, query_word in enumerate(query_words):
+            best: Dict[int, float] = {}
+            for word, score in self._word_matches(query_word).items():
+                for player_id in self.players_by_word[word]:
+                    if score > best.get(player_id, 0.0):
+                        best[player_id] = score
+            if position == 0:
+                scores = best
+            else:
+                scores = {player_id: scores[player_id] + score for player_id, score in best.items() if player_id in scores}
+            for player_id, score in best.items():
+                if score == EXACT_SCORE:
+                    exact_words[player_id] += 1
+            if not scores:
+                return []
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.words[item[0]]))
+        return [SearchResult(player_id, score, exact_words[player_id] == len(query_words) == len(self.words[player_id]))
+                for player_id, score in ranked]
@@ -0,0 +1,260 @@
+"""
+Player registration for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import enum
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import nextcord
+
+from statements import Statements
+
+REGISTRATION_TIMEOUT = datetime.timedelta(minutes=10)
+POSITIONS = ("FORWARD", "DEFENSEMAN", "GOALIE")
+ARCHETYPES = {  # What the player types -> what is stored in the database
+    "PLAYMAKER": "PASSER",
+    "ENFORCER": "PASSER",
+    "SNIPER": "SHOOTER",
+    "OFFENSIVE DEFENSEMAN": "SHOOTER",
+    "DANGLER": "DEKER",
+    "FINESSER": "DEKER",
+}
+CONFIRM, CANCEL = "✅", "❌"
+
+POSITION_PROMPT = ("Please reply to this message with what you want your `Position` to be. You can choose from:\n"
+                   "Forward (offense)\n"
+                   "Defenseman (defense)\n"
+                   "Goalie")
+ARCHETYPE_PROMPTS = {
+    "FORWARD": "Please reply to this message with what you want your `Archetype` to be. You can choose from:\n"
+               "Playmaker (bonus to passing ranges)\n"
+               "Sniper (bonus to shooting ranges)\n"
+               "Dangler (bonus to deking ranges)",
+    "DEFENSEMAN": "Please reply to this message with what you want your `Archetype` to be. You can choose from:\n"
+                  "Enforcer (bonus to passing ranges)\n"
+                  "Offensive Defenseman (bonus to shooting ranges)\n"
+                  "Finesser (bonus to deking ranges)",
+}
+
+
+class Step(enum.Enum):
+    FIRST_NAME = "first_name"
+    LAST_NAME = "last_name"
+    POSITION = "position"
+    ARCHETYPE = "archetype"
+    CONFIRM = "confirm"
+
+
+@dataclass
+class Registration:
+    """A row of the registrations table: one player's progress through registration, keyed by their DM channel."""
+    channel_id: int
+    player_id: int
+    guild_id: int
+    message_id: int  # The DM message that is edited as the registration progresses
+    step: Step
+    expires: datetime.datetime
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    position: Optional[str] = None
+    archetype: Optional[str] = None  # As typed (e.g. SNIPER); ARCHETYPES maps it to what the players table stores
+
+    @classmethod
+    def from_record(cls, record) -> "Registration":
+        return cls(record["channelid"], record["playerid"], record["guildid"], record["messageid"], Step(record["step"]), record["expires"],
+                   record["firstname"], record["lastname"], record["playerposition"], record["archetype"])
+
+    def as_args(self) -> tuple:
+        """The arguments of Statements.save_registration."""
+        return (self.channel_id, self.player_id, self.guild_id, self.message_id, self.step.value, self.expires,
+                self.first_name, self.last_name, self.position, self.archetype)
+
+    def embed(self, avatar_url: Optional[str]) -> nextcord.Embed:
+        embed = nextcord.Embed(color=0, title="New Player Registration")
+        if avatar_url:
+            embed.set_thumbnail(url=avatar_url)
+        embed.set_footer(text="Reply with \"ABORT\" at any time to cancel registration or start over.")
+        embed.add_field(name="First Name", value=self.first_name or "*None*")
+        embed.add_field(name="Last Name", value=self.last_name or "*None*")
+        embed.add_field(name="Position", value=self.position.title() if self.position else "*None*")
+        if self.position in ARCHETYPE_PROMPTS and self.step in (Step.ARCHETYPE, Step.CONFIRM):
+            embed.add_field(name="Archetype", value=self.archetype.title() if self.archetype else "*None*")
+        return embed
+
+
+class RegistrationManager:
+    """
+    Runs every in-progress registration as a state machine. Registrations are keyed by DM channel, so one message
+    listener finds the right one with a single dictionary lookup; each step is saved to the registrations table, so a
+    reload or restart picks up where the player left off; and timeouts are timers on the bot's shared scheduler.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.active: Dict[int, Registration] = {}  # DM channel ID -> registration
+        self.channels_by_player: Dict[int, int] = {}  # Player ID -> DM channel ID
+        bot.add_listener(self.on_message)
+        bot.add_listener(self.on_raw_reaction_add)
+        bot.add_listener(self.on_registration_expired)
+
+    def in_progress(self, player_id: int) -> bool:
+        return player_id in self.channels_by_player
+
+    async def load(self):
+        """Restores every saved registration and its timeout. Ones that expired while the bot was down time out right away."""
+        for record in await self.bot.statements.registrations():
+            self._track(Registration.from_record(record))
+
+    def _track(self, registration: Registration):
+        self.active[registration.channel_id] = registration
+        self.channels_by_player[registration.player_id] = registration.channel_id
+        channel_id = registration.channel_id
+        self.bot.deadlines.schedule(("registration", channel_id), registration.expires,
+                                    lambda: self.bot.dispatch("registration_expired", channel_id))
+
+    def _untrack(self, registration: Registration):
+        self.active.pop(registration.channel_id, None)
+        self.channels_by_player.pop(registration.player_id, None)
+        self.bot.deadlines.cancel(("registration", registration.channel_id))
+
+    async def _save(self, registration: Registration):
+        registration.expires = nextcord.utils.utcnow() + REGISTRATION_TIMEOUT
+        await self.bot.statements.save_registration(*registration.as_args())
+        self._track(registration)
+
+    async def _end(self, registration: Registration):
+        self._untrack(registration)
+        await self.bot.statements.delete_registration(registration.channel_id)
+
+    async def _edit(self, registration: Registration, content: str, embed: Optional[nextcord.Embed] = None):
+        """Edits the registration's DM message, which may not be in the message cache (e.g. after a restart)."""
+        channel = self.bot.get_channel(registration.channel_id) or await self.bot.fetch_channel(registration.channel_id)
+        user = self.bot.get_user(registration.player_id)
+        embed = embed or registration.embed(user.avatar.url if user and user.avatar else None)
+        message = channel.get_partial_message(registration.message_id)
+        await message.edit(content=content, embed=embed)
+        return message
+
+    async def start(self, ctx):
+        """Starts a registration for the command's author and DMs them the first question."""
+        registration = Registration(channel_id=0, player_id=ctx.author.id, guild_id=ctx.guild.id, message_id=0, step=Step.FIRST_NAME,
+                                    expires=nextcord.utils.utcnow() + REGISTRATION_TIMEOUT)
+        message = await ctx.author.send(content="Player registration has started."
+                                        "Please reply to this message with what you want your `First Name` to be.",
+                                        embed=registration.embed(ctx.author.avatar.url if ctx.author.avatar else None))
+        registration.channel_id, registration.message_id = message.channel.id, message.id
+        await self._save(registration)
+        self.bot.logger.info(f"Registration process has started for {ctx.author}")
+
+    async def on_message(self, message: nextcord.Message):
+        registration = self.active.get(message.channel.id)
+        if registration is None or message.author.id != registration.player_id or registration.step is Step.CONFIRM:
+            return
+        reply = message.content.strip()
+        if reply.upper() == "ABORT":
+            return await self.abort(registration, message)
+
+        if registration.step is Step.FIRST_NAME:
+            registration.first_name = reply
+            registration.step = Step.LAST_NAME
+            prompt = "Please reply to this message with what you want your `Last Name` to be."
+        elif registration.step is Step.LAST_NAME:
+            registration.last_name = reply
+            registration.step = Step.POSITION
+            prompt = POSITION_PROMPT
+        elif registration.step is Step.POSITION:
+            if reply.upper() not in POSITIONS:
+                return await message.reply("Error: Please type a valid position in your message. Positions include:\n"
+                                           "Forward (offense)\n"
+                                           "Defenseman (defense)\n"
+                                           "Goalie")
+            registration.position = reply.upper()
+            if registration.position in ARCHETYPE_PROMPTS:
+                registration.step = Step.ARCHETYPE
+                prompt = ARCHETYPE_PROMPTS[registration.position]
+            else:
+                registration.step = Step.CONFIRM
+        else:  # Step.ARCHETYPE
+            if reply.upper() not in ARCHETYPES:
+                return await message.reply(f"Error: Please type a valid archetype in your message. Archetypes include:\n"
+                                           f"{ARCHETYPE_PROMPTS[registration.position].split(':', 1)[1].strip()}")
+            registration.archetype = reply.upper()
+            registration.step = Step.CONFIRM
+
+        await self._save(registration)
+        if registration.step is Step.CONFIRM:
+            prompt_message = await self._edit(registration, "Your application has finished. Send it to the Commissioners' Office for approval?")
+            await prompt_message.add_reaction(CONFIRM)
+            await prompt_message.add_reaction(CANCEL)
+        else:
+            await self._edit(registration, prompt)
+
+    async def on_raw_reaction_add(self, payload: nextcord.RawReactionActionEvent):
+        registration = self.active.get(payload.channel_id)
+        if (registration is None or registration.step is not Step.CONFIRM or payload.message_id != registration.message_id
+                or payload.user_id != registration.player_id):
+            return
+        if str(payload.emoji) == CANCEL:
+            return await self.abort(registration)
+        if str(payload.emoji) == CONFIRM:
+            return await self.submit(registration)
+
+    async def abort(self, registration: Registration, message: Optional[nextcord.Message] = None):
+        await self._end(registration)
+        await self._edit(registration, "Registration aborted.", nextcord.Embed(color=0, title="New Player Registration", description="Registration aborted."))
+        self.bot.logger.info(f"{registration.player_id} aborted registration")
+        if message is not None:
+            await message.reply("Registration aborted successfully!")
+
+    async def submit(self, registration: Registration):
+        """Creates the player and sends the application to the Commissioners' Office."""
+        self._untrack(registration)
+        async with self.bot.unit_of_work() as work:
+            work.add(Statements.insert_player, registration.player_id, registration.position,
+                     ARCHETYPES.get(registration.archetype), registration.first_name, registration.last_name)
+            work.add(Statements.delete_registration, registration.channel_id)
+        self.bot.player_search.add(registration.player_id, registration.first_name, registration.last_name)
+        await self._edit(registration, "Registration finished. Sending to Commissioners' Office.")
+
+        user = self.bot.get_user(registration.player_id) or await self.bot.fetch_user(registration.player_id)
+        approval_channel = self.bot.guild_indexes.get(registration.guild_id).channel_named("new-player-approvals")
+        embed = nextcord.Embed(color=0, title="New Application")
+        if user.avatar:
+            embed.set_thumbnail(url=user.avatar.url)
+        embed.add_field(name="Name", value=f"{registration.first_name} {registration.last_name}")
+        embed.add_field(name="Position", value=registration.position.title())
+        if registration.archetype is not None:
+            embed.add_field(name="Archetype", value=registration.archetype.title())
+        embed.add_field(name="User", value=user.mention, inline=False)
+        await approval_channel.send(content=f"New application received. "
+                                            f"Issue command `{self.bot.command_prefix}approve {user.id}` to approve the application and "
+                                            f"`{self.bot.command_prefix}reject {user.id} [reason]` to reject.", embed=embed)
+
+    async def on_registration_expired(self, channel_id: int):
+        """Fired by the scheduler REGISTRATION_TIMEOUT after a registration's last step."""
+        await self.bot.wait_until_ready()
+        registration = self.active.get(channel_id)
+        if registration is None:
+            return
+        await self._end(registration)
+        await self._edit(registration, "Registration automatically abandoned.",
+                         nextcord.Embed(color=0, title="New Player Registration", description="Registration timed out."))
+        self.bot.logger.info(f"{registration.player_id}'s registration timed out")
+        channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        await channel.send("There have been 10 minutes since the last reply.\n"
+                           "Registration has automatically terminated. Please restart the registration process.")
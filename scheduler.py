@@ -0,0 +1,122 @@
+"""
+Timer scheduling for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import heapq
+import itertools
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import nextcord
+
+from util import DEADLINE_WARNING
+
+
+class Scheduler:
+    """
+    Calls functions at exact times. Every timer lives in one min-heap that is watched by one task, which sleeps until
+    the earliest timer is due. Rescheduling or cancelling a key leaves a stale heap entry behind that is skipped when
+    it reaches the top, so both are O(log n).
+    """
+    def __init__(self, logger):
+        self.logger = logger
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._timers: Dict[Hashable, Tuple[float, int, Callable[[], None]]] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable):
+        return key in self._timers
+
+    def schedule(self, key: Hashable, when: datetime.datetime, callback: Callable[[], None]):
+        """Calls callback at the given (timezone aware) time, replacing any timer already set under key."""
+        timestamp = when.timestamp()
+        sequence = next(self._counter)
+        self._timers[key] = (timestamp, sequence, callback)
+        heapq.heappush(self._heap, (timestamp, sequence, key))
+        if self._heap[0][1] == sequence:  # New earliest timer, so the sleeping task has to wake up earlier
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable):
+        self._timers.pop(key, None)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = nextcord.utils.utcnow().timestamp()
+            while self._heap:
+                timestamp, sequence, key = self._heap[0]
+                timer = self._timers.get(key)
+                if timer is None or timer[1] != sequence:  # Cancelled or rescheduled
+                    heapq.heappop(self._heap)
+                    continue
+                if timestamp > now:
+                    break
+                heapq.heappop(self._heap)
+                del self._timers[key]
+                try:
+                    timer[2]()
+                except Exception as error:
+                    self.logger.error(f"Timer {key} failed: {error!r}")
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class DeadlineScheduler(Scheduler):
+    """
+    Fires a deadline_warning event DEADLINE_WARNING before each active game's deadline and a deadline_expired event at
+    the deadline itself. Lives on the bot rather than a cog, so that timers survive the reload command; other timers
+    that need that too (such as registration timeouts) share it under their own keys.
+    """
+    def __init__(self, bot):
+        super().__init__(bot.logger)
+        self.bot = bot
+
+    async def load(self):
+        """Schedules every active game's deadline. Only needs to run once, at startup."""
+        for game in self.bot.games:  # Loaded first, in create_bot()
+            self.track(game.game_id, game.deadline)
+
+    def track(self, game_id: int, deadline: datetime.datetime):
+        """Sets (or moves) the timers for a game's deadline. Call whenever a game is created or its deadline changes."""
+        warning_at = deadline - DEADLINE_WARNING
+        if warning_at > nextcord.utils.utcnow():
+            self.schedule(("warning", game_id), warning_at, lambda: self.bot.dispatch("deadline_warning", game_id))
+        else:
+            self.cancel(("warning", game_id))
+        self.schedule(("expired", game_id), deadline, lambda: self.bot.dispatch("deadline_expired", game_id))
+
+    def untrack(self, game_id: int):
+        """Clears the timers for a game that has ended."""
+        self.cancel(("warning", game_id))
+        self.cancel(("expired", game_id))
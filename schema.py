@@ -0,0 +1,440 @@
+"""
+Database schema and migrations for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import json
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import asyncpg
+
+# Baseline schema. Existing databases created before migrations existed already have these objects, so every statement
+# here is idempotent and the first migration just records them.
+ROSTER_TYPES = """
+DO $$
+BEGIN
+    IF to_regtype('skater') IS NULL THEN
+        CREATE TYPE skater AS (playerid BIGINT, playertype TEXT);
+    END IF;
+    IF to_regtype('roster') IS NULL THEN
+        CREATE TYPE roster AS (forward skater, defenseman skater, goalie BIGINT);
+    END IF;
+END
+$$
+"""
+
+TEAMS_TABLE = """
+CREATE TABLE IF NOT EXISTS teams (
+    teamid TEXT PRIMARY KEY,
+    roleid BIGINT NOT NULL,
+    city TEXT,
+    name TEXT,
+    logourl TEXT,
+    channelid BIGINT
+)
+"""
+
+PLAYERS_TABLE = """
+CREATE TABLE IF NOT EXISTS players (
+    playerid BIGINT PRIMARY KEY,
+    firstname TEXT NOT NULL,
+    lastname TEXT NOT NULL,
+    playerposition TEXT NOT NULL CHECK (playerposition IN ('FORWARD', 'DEFENSEMAN', 'GOALIE')),
+    playertype TEXT CHECK (playertype IN ('PASSER', 'SHOOTER', 'DEKER')),
+    playerteam TEXT REFERENCES teams (teamid) ON UPDATE CASCADE ON DELETE SET NULL,
+    approved BOOLEAN NOT NULL DEFAULT FALSE
+)
+"""
+
+GAMES_TABLE = """
+CREATE TABLE IF NOT EXISTS games (
+    gameid SERIAL PRIMARY KEY,
+    hometeam TEXT NOT NULL REFERENCES teams (teamid) ON UPDATE CASCADE,
+    awayteam TEXT NOT NULL REFERENCES teams (teamid) ON UPDATE CASCADE,
+    homescore INTEGER NOT NULL DEFAULT 0,
+    awayscore INTEGER NOT NULL DEFAULT 0,
+    homeroster roster NOT NULL,
+    awayroster roster NOT NULL,
+    movenum INTEGER NOT NULL DEFAULT 0,
+    stadium BIGINT NOT NULL,
+    cleanpasses INTEGER NOT NULL DEFAULT 0,
+    waitingon_side TEXT NOT NULL DEFAULT 'AWAY' CHECK (waitingon_side IN ('HOME', 'AWAY')),
+    possession TEXT NOT NULL DEFAULT 'AWAY' CHECK (possession IN ('HOME', 'AWAY')),
+    waitingon_pos TEXT NOT NULL DEFAULT 'FORWARD' CHECK (waitingon_pos IN ('FORWARD', 'DEFENSEMAN')),
+    game_active BOOLEAN NOT NULL DEFAULT TRUE,
+    homedelays INTEGER NOT NULL DEFAULT 0,
+    awaydelays INTEGER NOT NULL DEFAULT 0,
+    deadline TIMESTAMPTZ NOT NULL DEFAULT NOW() + INTERVAL '24 hours'
+)
+"""
+
+WEBHOOKS_TABLE = """
+CREATE TABLE IF NOT EXISTS webhooks (
+    webhookname TEXT PRIMARY KEY,
+    webhookurl TEXT NOT NULL,
+    twitter_handle TEXT,
+    twittername TEXT,
+    avatar TEXT,
+    templates JSON NOT NULL DEFAULT '{}'
+)
+"""
+
+# Goalie number lists, stored as little-endian unsigned shorts (see number_list.NumberList)
+GOALIE_NUMBERS_COLUMNS = """
+ALTER TABLE games ADD COLUMN IF NOT EXISTS homenumbers BYTEA, ADD COLUMN IF NOT EXISTS awaynumbers BYTEA
+"""
+
+# In-progress player registrations (see registration.RegistrationManager), keyed by the player's DM channel
+REGISTRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS registrations (
+    channelid BIGINT PRIMARY KEY,
+    playerid BIGINT NOT NULL UNIQUE,
+    guildid BIGINT NOT NULL,
+    messageid BIGINT NOT NULL,
+    step TEXT NOT NULL,
+    expires TIMESTAMPTZ NOT NULL,
+    firstname TEXT,
+    lastname TEXT,
+    playerposition TEXT,
+    archetype TEXT
+)
+"""
+
+# Running totals kept by stats.StatsEngine, updated in the same transaction as the moves and results they count
+STATS_TABLES = """
+CREATE TABLE IF NOT EXISTS standings (
+    teamid TEXT PRIMARY KEY REFERENCES teams (teamid) ON UPDATE CASCADE ON DELETE CASCADE,
+    wins INTEGER NOT NULL DEFAULT 0,
+    losses INTEGER NOT NULL DEFAULT 0,
+    ties INTEGER NOT NULL DEFAULT 0,
+    goalsfor INTEGER NOT NULL DEFAULT 0,
+    goalsagainst INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS player_stats (
+    playerid BIGINT PRIMARY KEY REFERENCES players (playerid) ON DELETE CASCADE,
+    moves INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    completedpasses INTEGER NOT NULL DEFAULT 0,
+    dekes INTEGER NOT NULL DEFAULT 0,
+    completeddekes INTEGER NOT NULL DEFAULT 0,
+    shots INTEGER NOT NULL DEFAULT 0,
+    goals INTEGER NOT NULL DEFAULT 0,
+    turnovers INTEGER NOT NULL DEFAULT 0,
+    shotsfaced INTEGER NOT NULL DEFAULT 0,
+    saves INTEGER NOT NULL DEFAULT 0,
+    goalsagainst INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS archetype_stats (
+    archetype TEXT NOT NULL,
+    action TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (archetype, action)
+)
+"""
+
+# One row per resolved move (see events.GameEvent), written with COPY alongside the game state it produced. Enums are
+# stored as the SMALLINT values of engine.Action, Archetype and Outcome. Rows are never changed after they are written.
+GAME_EVENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS game_events (
+    gameid INTEGER NOT NULL REFERENCES games (gameid),
+    movenum SMALLINT NOT NULL,
+    home BOOLEAN NOT NULL,
+    playerid BIGINT NOT NULL,
+    goalieid BIGINT NOT NULL,
+    archetype SMALLINT NOT NULL,
+    action SMALLINT NOT NULL,
+    offensenumber SMALLINT NOT NULL,
+    defensenumber SMALLINT NOT NULL,
+    cleanpasses SMALLINT NOT NULL,
+    outcome SMALLINT NOT NULL,
+    homescore SMALLINT NOT NULL,
+    awayscore SMALLINT NOT NULL,
+    resolvedat TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (gameid, movenum)
+);
+CREATE INDEX IF NOT EXISTS game_events_resolvedat ON game_events (resolvedat);
+CREATE OR REPLACE FUNCTION game_events_append_only() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    RAISE EXCEPTION 'game_events is append-only';
+END
+$$;
+DROP TRIGGER IF EXISTS game_events_append_only ON game_events;
+CREATE TRIGGER game_events_append_only BEFORE UPDATE OR DELETE ON game_events FOR EACH ROW EXECUTE FUNCTION game_events_append_only()
+"""
+
+# Indexes for the hot queries in statements.Statements and schema.CREATE_GAME_FUNCTION. Most filters only ever look at
+# active games, which are a small and shrinking fraction of the table, hence the partial indexes.
+HOT_QUERY_INDEXES = """
+CREATE INDEX IF NOT EXISTS players_team_position ON players (playerteam, playerposition);
+CREATE INDEX IF NOT EXISTS games_active ON games (gameid) WHERE game_active;
+CREATE INDEX IF NOT EXISTS games_active_stadium ON games (stadium) WHERE game_active;
+CREATE INDEX IF NOT EXISTS games_active_hometeam ON games (hometeam) WHERE game_active;
+CREATE INDEX IF NOT EXISTS games_active_awayteam ON games (awayteam) WHERE game_active
+"""
+
+# Validates both teams, checks for stadium and team conflicts, gathers both rosters and inserts the game in one call.
+# The advisory lock serializes concurrent calls, so two operators cannot start overlapping games.
+CREATE_GAME_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_game(home_team teams.teamid%TYPE, away_team teams.teamid%TYPE, stadium_id games.stadium%TYPE)
+RETURNS TABLE (result TEXT, new_game_id games.gameid%TYPE, game_stadium games.stadium%TYPE, game_deadline games.deadline%TYPE,
+               home_goalie_id players.playerid%TYPE, away_goalie_id players.playerid%TYPE)
+LANGUAGE plpgsql AS $$
+DECLARE
+    home_forward_id players.playerid%TYPE;
+    home_forward_type players.playertype%TYPE;
+    home_defenseman_id players.playerid%TYPE;
+    home_defenseman_type players.playertype%TYPE;
+    away_forward_id players.playerid%TYPE;
+    away_forward_type players.playertype%TYPE;
+    away_defenseman_id players.playerid%TYPE;
+    away_defenseman_type players.playertype%TYPE;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('create_game'));
+
+    IF home_team = away_team THEN
+        result := 'same_team';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    IF (SELECT COUNT(*) FROM teams WHERE teamid IN (home_team, away_team)) < 2 THEN
+        result := 'team_not_found';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    game_stadium := COALESCE(stadium_id, (SELECT channelid FROM teams WHERE teamid = home_team));
+    IF game_stadium IS NULL THEN
+        result := 'no_stadium';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    IF EXISTS(SELECT 1 FROM games WHERE stadium = game_stadium AND game_active) THEN
+        result := 'stadium_in_use';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    IF EXISTS(SELECT 1 FROM games WHERE game_active AND (hometeam IN (home_team, away_team) OR awayteam IN (home_team, away_team))) THEN
+        result := 'team_in_game';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    SELECT MAX(playerid) FILTER (WHERE playerteam = home_team AND playerposition = 'FORWARD'),
+           MAX(playertype) FILTER (WHERE playerteam = home_team AND playerposition = 'FORWARD'),
+           MAX(playerid) FILTER (WHERE playerteam = home_team AND playerposition = 'DEFENSEMAN'),
+           MAX(playertype) FILTER (WHERE playerteam = home_team AND playerposition = 'DEFENSEMAN'),
+           MAX(playerid) FILTER (WHERE playerteam = home_team AND playerposition = 'GOALIE'),
+           MAX(playerid) FILTER (WHERE playerteam = away_team AND playerposition = 'FORWARD'),
+           MAX(playertype) FILTER (WHERE playerteam = away_team AND playerposition = 'FORWARD'),
+           MAX(playerid) FILTER (WHERE playerteam = away_team AND playerposition = 'DEFENSEMAN'),
+           MAX(playertype) FILTER (WHERE playerteam = away_team AND playerposition = 'DEFENSEMAN'),
+           MAX(playerid) FILTER (WHERE playerteam = away_team AND playerposition = 'GOALIE')
+    INTO home_forward_id, home_forward_type, home_defenseman_id, home_defenseman_type, home_goalie_id,
+         away_forward_id, away_forward_type, away_defenseman_id, away_defenseman_type, away_goalie_id
+    FROM players WHERE playerteam IN (home_team, away_team);
+
+    IF home_forward_id IS NULL OR home_defenseman_id IS NULL OR home_goalie_id IS NULL
+       OR away_forward_id IS NULL OR away_defenseman_id IS NULL OR away_goalie_id IS NULL THEN
+        result := 'roster_incomplete';
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    INSERT INTO games (hometeam, awayteam, homeroster, awayroster, stadium) VALUES
+    (home_team, away_team,
+     ((home_forward_id, home_forward_type), (home_defenseman_id, home_defenseman_type), home_goalie_id),
+     ((away_forward_id, away_forward_type), (away_defenseman_id, away_defenseman_type), away_goalie_id),
+     game_stadium)
+    RETURNING gameid, deadline INTO new_game_id, game_deadline;
+    result := 'ok';
+    RETURN NEXT;
+END
+$$
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: Sequence[str]
+
+
+# Applied in order, each in its own transaction, and recorded in schema_migrations. Never edit a migration that has
+# shipped; add a new one instead.
+MIGRATIONS = [
+    Migration(1, "baseline tables", [ROSTER_TYPES, TEAMS_TABLE, PLAYERS_TABLE, GAMES_TABLE, WEBHOOKS_TABLE]),
+    Migration(2, "goalie number lists", [GOALIE_NUMBERS_COLUMNS]),
+    Migration(3, "registrations", [REGISTRATIONS_TABLE]),
+    Migration(4, "hot query indexes", [HOT_QUERY_INDEXES]),
+    Migration(5, "standings and player statistics", [STATS_TABLES]),
+    Migration(6, "play-by-play event log", [GAME_EVENTS_TABLE]),
+]
+
+# Replaced on every startup, since CREATE OR REPLACE is cheap and keeps them in step with the code
+REPEATABLE = [
+    CREATE_GAME_FUNCTION,
+]
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+# What verify() expects to find once every migration has run
+EXPECTED_TABLES = ("teams", "players", "games", "webhooks", "registrations", "standings", "player_stats", "archetype_stats", "game_events", "schema_migrations")
+EXPECTED_TYPES = ("skater", "roster")
+EXPECTED_INDEXES = ("players_team_position", "games_active", "games_active_stadium", "games_active_hometeam", "games_active_awayteam")
+EXPECTED_COLUMNS = {"games": ("homenumbers", "awaynumbers", "deadline", "homedelays", "awaydelays")}
+EXPECTED_FUNCTIONS = ("create_game",)
+
+
+class SchemaError(RuntimeError):
+    """The database is missing objects the bot depends on, or has migrations this version of the bot does not know."""
+
+
+async def migrate(connection) -> List[Migration]:
+    """Applies every migration the database has not seen yet, returning the ones applied."""
+    await connection.execute(MIGRATIONS_TABLE)
+    applied = []
+    for migration in MIGRATIONS:
+        async with connection.transaction():
+            # Held until the transaction ends, so two bots starting at once cannot apply the same migration twice
+            await connection.execute("""SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))""")
+            if await connection.fetchval("""SELECT EXISTS(SELECT 1 FROM schema_migrations WHERE version = $1)""", migration.version):
+                continue
+            for statement in migration.statements:
+                await connection.execute(statement)
+            await connection.execute("""INSERT INTO schema_migrations (version, name) VALUES ($1, $2)""", migration.version, migration.name)
+        applied.append(migration)
+    return applied
+
+
+async def verify(connection):
+    """Raises SchemaError listing everything that is missing, or if the database is ahead of the code."""
+    problems = []
+    latest = await connection.fetchval("""SELECT MAX(version) FROM schema_migrations""")
+    if latest is not None and latest > MIGRATIONS[-1].version:
+        problems.append(f"database is at migration {latest}, but this code only knows up to {MIGRATIONS[-1].version}")
+    for table in EXPECTED_TABLES:
+        if await connection.fetchval("""SELECT to_regclass($1)""", table) is None:
+            problems.append(f"table {table} is missing")
+    for index in EXPECTED_INDEXES:
+        if await connection.fetchval("""SELECT to_regclass($1)""", index) is None:
+            problems.append(f"index {index} is missing")
+    for type_name in EXPECTED_TYPES:
+        if await connection.fetchval("""SELECT to_regtype($1)""", type_name) is None:
+            problems.append(f"type {type_name} is missing")
+    for function in EXPECTED_FUNCTIONS:
+        if await connection.fetchval("""SELECT to_regproc($1)""", function) is None:
+            problems.append(f"function {function} is missing")
+    for table, columns in EXPECTED_COLUMNS.items():
+        present = {record["column_name"] for record in await connection.fetch(
+            """SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = $1""", table)}
+        problems.extend(f"column {table}.{column} is missing" for column in columns if column not in present)
+    if problems:
+        raise SchemaError("Database schema check failed: " + "; ".join(problems))
+
+
+async def apply(connection) -> List[Migration]:
+    """Brings the database up to date and checks the result. Runs before the connection pool prepares its statements."""
+    applied = await migrate(connection)
+    async with connection.transaction():
+        for ddl in REPEATABLE:
+            await connection.execute(ddl)
+    await verify(connection)
+    return applied
+
+
+# Hot queries and sample arguments for check_plans(). Statement names refer to statements.Statements; the rest are the
+# lookups inside CREATE_GAME_FUNCTION, which EXPLAIN cannot see into.
+HOT_QUERIES: Dict[str, Tuple[Optional[str], tuple]] = {
+    "team_members": (None, ("ABC",)),
+    "team_player_at_position": (None, ("ABC", "GOALIE")),
+    "team_position_filled": (None, ("ABC", "GOALIE")),
+    "player": (None, (1,)),
+    "players": (None, ([1, 2],)),
+    "player_team": (None, (1,)),
+    "active_game_routes": (None, ()),
+    "active_game_states": (None, ()),
+    "game_state": (None, (1,)),
+    "create_game: stadium in use": ("""SELECT 1 FROM games WHERE stadium = $1 AND game_active""", (1,)),
+    "create_game: team in game": ("""SELECT 1 FROM games WHERE game_active AND (hometeam IN ($1, $2) OR awayteam IN ($1, $2))""", ("ABC", "DEF")),
+    "create_game: rosters": ("""SELECT playerid FROM players WHERE playerteam IN ($1, $2)""", ("ABC", "DEF")),
+}
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _node_types(plan: dict) -> List[str]:
+    """Returns the node type of a plan and of every node under it."""
+    types = [plan["Node Type"]]
+    for child in plan.get("Plans", ()):
+        types.extend(_node_types(child))
+    return types
+
+
+async def explain(connection, name: str) -> List[str]:
+    """EXPLAINs one of HOT_QUERIES with its sample arguments and returns the node types of its plan."""
+    from statements import Statements  # Imported here so that the bot can import this module without a cycle
+
+    query, args = HOT_QUERIES[name]
+    plan = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query or getattr(Statements, name).query}", *args)
+    return _node_types((json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"])
+
+
+async def check_plans(connection) -> Dict[str, List[str]]:
+    """
+    EXPLAINs every hot query with the normal planner settings and returns the ones that use no index, with the nodes
+    they use instead. Only meaningful on tables of a realistic size with fresh statistics: on a near-empty table the
+    planner rightly prefers a sequential scan.
+    """
+    failures = {}
+    for name in HOT_QUERIES:
+        nodes = await explain(connection, name)
+        if not any(node in INDEX_SCANS for node in nodes):
+            failures[name] = nodes
+    return failures
+
+
+async def main():
+    """Migrates the database in configuration.json and checks the hot query plans. Exits non-zero on any failure."""
+    with open("configuration.json", "r") as configuration_file:
+        configuration = json.load(configuration_file)
+    connection = await asyncpg.connect(**configuration["postgresql_creds"])
+    try:
+        for migration in await apply(connection):
+            print(f"Applied migration {migration.version}: {migration.name}")
+        failures = await check_plans(connection)
+    finally:
+        await connection.close()
+    for name, nodes in failures.items():
+        print(f"{name}: no index scan ({', '.join(nodes)})", file=sys.stderr)
+    print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,279 @@
+"""
+Stadium scoreboards for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import datetime
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import nextcord
+
+from engine import GameState
+from game_store import ActiveGame
+from util import MOVES_PER_PERIOD
+
+# Discord allows two name or topic edits per channel every ten minutes; anything more is held back by a long rate limit
+TOPIC_EDITS_PER_WINDOW = 2
+TOPIC_WINDOW = 600.0
+SCOREBOARD_DELAY = 3.0  # Moves made within this long of each other share one edit of the pinned scoreboard
+SCOREBOARD_TITLE = "Scoreboard"
+PERIODS = ["x", "1st", "2nd", "3rd"]
+GAMES_PER_PAGE = 15
+PAGE_TIMEOUT = 180.0
+
+
+class Board:
+    """The scoreboard state of one stadium: what its topic should say, what it last said, and its pinned message."""
+    __slots__ = ("stadium_id", "game", "topic", "written_topic", "topic_edits", "message_id", "message_task", "changes")
+
+    def __init__(self, stadium_id: int, game: ActiveGame, written_topic: Optional[str]):
+        self.stadium_id = stadium_id
+        self.game = game
+        self.topic: Optional[str] = None
+        self.written_topic = written_topic
+        self.topic_edits: Deque[float] = deque(maxlen=TOPIC_EDITS_PER_WINDOW)  # When the last topic edits were sent
+        self.message_id: Optional[int] = None
+        self.message_task: Optional[asyncio.Task] = None
+        self.changes = 0  # Counts changes to the game, so a scoreboard edit can tell whether it is still current
+
+
+class Scoreboards:
+    """
+    Keeps each stadium's topic and pinned scoreboard message in step with its game. Topic edits are spent from each
+    channel's budget of two per ten minutes: while the budget is used up, changes only replace the pending topic, and
+    one timer writes the latest one as soon as the budget allows. The pinned scoreboard is a message edit, which has no
+    such limit, so it stays current to within a few seconds. Category moves at the start and end of a game never wait
+    on the topic budget, and go out in the same request as the topic when the budget allows.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.boards: Dict[int, Board] = {}  # Stadium ID -> board
+        self._lines: Dict[int, Tuple[GameState, str]] = {}  # Game ID -> (state it was rendered from, listgames line)
+        self.topic_edits = 0
+        self.topics_deferred = 0
+        self.scoreboard_edits = 0
+
+    def topic(self, game: ActiveGame) -> str:
+        if not game.game_active:
+            return ""
+        stadium = self.bot.get_channel(game.stadium)
+        home_role, away_role = self.bot.role_from_id(stadium.guild.id, game.home_team), self.bot.role_from_id(stadium.guild.id, game.away_team)
+        state = game.state
+        period, moves_left = state.movenum // MOVES_PER_PERIOD + 1, MOVES_PER_PERIOD - state.movenum % MOVES_PER_PERIOD
+        return (f"{away_role.mention} {state.awayscore} - {state.homescore} {home_role.mention} "
+                f"({state.cleanpasses} CP | {moves_left} moves left | {PERIODS[min(period, 3)]} | Deadline: <t:{int(game.deadline.timestamp())}:f>)")
+
+    def embed(self, game: ActiveGame) -> nextcord.Embed:
+        state = game.state
+        period, moves_left = state.movenum // MOVES_PER_PERIOD + 1, MOVES_PER_PERIOD - state.movenum % MOVES_PER_PERIOD
+        embed = nextcord.Embed(color=0xCC5500, title=SCOREBOARD_TITLE, timestamp=nextcord.utils.utcnow())
+        embed.add_field(name=game.away_team, value=state.awayscore)
+        embed.add_field(name=game.home_team, value=state.homescore)
+        if game.game_active:
+            embed.add_field(name="Period", value=f"{PERIODS[min(period, 3)]} ({moves_left} moves left)")
+            embed.add_field(name="Possession", value=f"{game.team(state.possession)} {state.waitingon_pos.title()}")
+            embed.add_field(name="Clean Passes", value=state.cleanpasses)
+            embed.add_field(name="Deadline", value=f"<t:{int(game.deadline.timestamp())}:R>")
+        else:
+            embed.add_field(name="Period", value="Final", inline=False)
+        embed.set_footer(text=f"Game ID: {game.game_id}")
+        return embed
+
+    def line(self, game: ActiveGame) -> str:
+        """The game's line in listgames. Rendered again only when the game's state has changed since it was last rendered."""
+        cached = self._lines.get(game.game_id)
+        if cached is not None and cached[0] is game.state:  # Moves replace the state tuple, so identity is enough
+            return cached[1]
+        state = game.state
+        period, moves_left = state.movenum // MOVES_PER_PERIOD + 1, MOVES_PER_PERIOD - state.movenum % MOVES_PER_PERIOD
+        line = (f"{game.away_team} {state.awayscore} - {state.homescore} {game.home_team} "
+                f"({PERIODS[min(period, 3)]} | {moves_left} moves left | ID: {game.game_id})")
+        self._lines[game.game_id] = (state, line)
+        return line
+
+    def listing(self, team_id: Optional[str] = None, period: Optional[int] = None) -> List[str]:
+        """Lines for every active game, in game ID order, optionally only those involving a team or in a period."""
+        return [self.line(game) for game in self.bot.games
+                if (team_id is None or team_id in (game.home_team, game.away_team))
+                and (period is None or min(game.state.movenum // MOVES_PER_PERIOD + 1, 3) == period)]
+
+    def pages(self, lines: List[str], title: str) -> List[nextcord.Embed]:
+        chunks = [lines[start:start + GAMES_PER_PAGE] for start in range(0, len(lines), GAMES_PER_PAGE)]
+        pages = []
+        for number, chunk in enumerate(chunks, 1):
+            embed = nextcord.Embed(color=0xCC5500, title=title, description="```\n" + "\n".join(chunk) + "\n```")
+            embed.set_footer(text=f"Page {number}/{len(chunks)} | {len(lines)} games")
+            pages.append(embed)
+        return pages
+
+    def _board(self, game: ActiveGame) -> Board:
+        board = self.boards.get(game.stadium)
+        if board is None or board.game.game_id != game.game_id:
+            stadium = self.bot.get_channel(game.stadium)
+            previous = board.topic_edits if board else ()  # The budget belongs to the channel, not the game
+            board = self.boards[game.stadium] = Board(game.stadium, game, stadium.topic if stadium else None)
+            board.topic_edits.extend(previous)
+        board.game = game
+        return board
+
+    def game_started(self, game: ActiveGame, category: Optional[nextcord.CategoryChannel] = None):
+        """Moves the stadium into category, sets its topic and posts and pins a new scoreboard."""
+        board = self._board(game)
+        self._set_topic(board, self.topic(game), category=category)
+        board.message_task = asyncio.create_task(self._post_scoreboard(board))
+
+    def game_changed(self, game: ActiveGame):
+        """Brings the topic and scoreboard up to date after a move or a new deadline."""
+        board = self._board(game)
+        self._set_topic(board, self.topic(game))
+        self._refresh_scoreboard(board)
+
+    def game_ended(self, game: ActiveGame, category: Optional[nextcord.CategoryChannel] = None):
+        """Moves the stadium into category, clears its topic and leaves the scoreboard showing the final score."""
+        self._lines.pop(game.game_id, None)
+        board = self._board(game)
+        self._set_topic(board, "", category=category)
+        self._refresh_scoreboard(board)
+
+    # Topic
+    def _set_topic(self, board: Board, topic: str, **fields):
+        board.topic = topic
+        stadium = self.bot.get_channel(board.stadium_id)
+        if stadium is None:
+            return
+        if topic == board.written_topic:
+            self.bot.deadlines.cancel(("topic", board.stadium_id))
+            if fields:
+                self.bot.mutations.edit_channel(stadium, **fields)
+            return
+        now = time.monotonic()
+        if len(board.topic_edits) < TOPIC_EDITS_PER_WINDOW or now - board.topic_edits[0] >= TOPIC_WINDOW:
+            self.bot.deadlines.cancel(("topic", board.stadium_id))
+            self._write_topic(board, stadium, fields)
+            return
+        # Out of budget: anything else goes now, and the topic follows once the oldest edit leaves the window
+        if fields:
+            self.bot.mutations.edit_channel(stadium, **fields)
+        if ("topic", board.stadium_id) not in self.bot.deadlines:
+            self.topics_deferred += 1
+            ready_at = nextcord.utils.utcnow() + datetime.timedelta(seconds=board.topic_edits[0] + TOPIC_WINDOW - now)
+            self.bot.deadlines.schedule(("topic", board.stadium_id), ready_at, lambda: self._deferred_topic(board.stadium_id))
+
+    def _write_topic(self, board: Board, stadium, fields: dict):
+        board.topic_edits.append(time.monotonic())
+        board.written_topic = board.topic
+        self.topic_edits += 1
+        self.bot.mutations.edit_channel(stadium, topic=board.topic, **fields)
+
+    def _deferred_topic(self, stadium_id: int):
+        board = self.boards.get(stadium_id)
+        stadium = self.bot.get_channel(stadium_id)
+        if board is None or stadium is None or board.topic == board.written_topic:
+            return
+        self._write_topic(board, stadium, {})
+
+    # Pinned scoreboard
+    async def _find_scoreboard(self, board: Board, stadium) -> Optional[int]:
+        """Finds the game's pinned scoreboard after a restart, when only the channel remembers it."""
+        for message in await stadium.pins():
+            if message.author.id == self.bot.user.id and message.embeds and message.embeds[0].title == SCOREBOARD_TITLE \
+                    and message.embeds[0].footer.text == f"Game ID: {board.game.game_id}":
+                return message.id
+        return None
+
+    async def _post_scoreboard(self, board: Board):
+        stadium = self.bot.get_channel(board.stadium_id)
+        posted = board.changes
+        try:
+            message = await stadium.send(embed=self.embed(board.game))
+            board.message_id = message.id
+            await message.pin()
+        except nextcord.HTTPException as error:
+            self.bot.logger.error(f"Failed to post the scoreboard for game {board.game.game_id}: {error!r}")
+            return
+        if board.changes != posted:  # The game changed while the scoreboard was being posted
+            await self._edit_scoreboard(board)
+
+    def _refresh_scoreboard(self, board: Board):
+        board.changes += 1
+        if board.message_task is None or board.message_task.done():
+            board.message_task = asyncio.create_task(self._edit_scoreboard(board))
+
+    async def _edit_scoreboard(self, board: Board):
+        """
+        Edits the scoreboard until it shows the latest change, unpinning it once the game is over. Changes made while
+        an edit is in flight only bump board.changes, and are picked up by another pass.
+        """
+        stadium = self.bot.get_channel(board.stadium_id)
+        rendered = None
+        while rendered != board.changes:
+            await asyncio.sleep(SCOREBOARD_DELAY)  # Changes made in the meantime share this edit, since it renders board.game when it runs
+            rendered = board.changes
+            try:
+                if board.message_id is None:
+                    board.message_id = await self._find_scoreboard(board, stadium)
+                if board.message_id is None:
+                    return
+                message, over = stadium.get_partial_message(board.message_id), not board.game.game_active
+                await message.edit(embed=self.embed(board.game))
+                self.scoreboard_edits += 1
+                if over:  # Only once the final score is what this edit rendered
+                    await message.unpin()
+            except nextcord.HTTPException as error:
+                self.bot.logger.error(f"Failed to update the scoreboard for game {board.game.game_id}: {error!r}")
+
+
+class GamePages(nextcord.ui.View):
+    """Previous and next buttons for a paginated listgames reply. Only the member who ran the command can turn pages."""
+    def __init__(self, pages: List[nextcord.Embed], author_id: int):
+        super().__init__(timeout=PAGE_TIMEOUT)
+        self.pages = pages
+        self.author_id = author_id
+        self.page = 0
+        self.message: Optional[nextcord.Message] = None
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page == len(self.pages) - 1
+
+    async def interaction_check(self, interaction: nextcord.Interaction) -> bool:
+        return interaction.user is not None and interaction.user.id == self.author_id
+
+    async def _turn(self, interaction: nextcord.Interaction, step: int):
+        self.page = max(0, min(self.page + step, len(self.pages) - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.pages[self.page], view=self)
+
+    @nextcord.ui.button(label="Previous", style=nextcord.ButtonStyle.secondary)
+    async def previous(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        await self._turn(interaction, -1)
+
+    @nextcord.ui.button(label="Next", style=nextcord.ButtonStyle.secondary)
+    async def next(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        await self._turn(interaction, 1)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            for item in self.children:
+                item.disabled = True
+            try:
+                await self.message.edit(view=self)
+            except nextcord.HTTPException:
+                pass
@@ -0,0 +1,510 @@
+"""
+Bulk season setup for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Imports teams and rosters from CSV or JSON in three phases: Discord objects the database rows need (team roles and
+stadium channels) are created first, then every changed row is copied into Postgres in a single transaction, then
+role names, colors and member roles are brought in line. Every phase is computed as a diff, so an import can be
+previewed with a dry run and running the same file twice changes nothing.
+
+File formats:
+    JSON: {"teams": [{"team_id", "city", "name", "color", "stadium", "logo_url", "role_id"}, ...],
+           "players": [{"player_id", "first_name", "last_name", "position", "archetype", "team_id"}, ...]}
+    CSV: one file of teams and/or one file of players, with the same keys as column headers.
+Only team_id, player_id, first_name, last_name and position are required. color is a hex code (or a number, in JSON),
+stadium is a channel name or ID, and archetype may be either the rulebook name (Sniper) or the stored one (SHOOTER).
+
+Usage (from the repository root, database only; run the importseason command afterwards to sync Discord):
+    python season_import.py FILE [FILE ...] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import asyncpg
+import nextcord
+
+from discord_mutations import with_retries
+from registration import ARCHETYPES, POSITIONS
+from statements import Statements
+
+STORED_ARCHETYPES = ("PASSER", "SHOOTER", "DEKER")
+TEAM_COLUMNS = ("teamid", "roleid", "city", "name", "logourl", "channelid")
+PLAYER_COLUMNS = ("playerid", "firstname", "lastname", "playerposition", "playertype", "playerteam", "approved")
+DEFAULT_CONCURRENCY = 4  # Discord requests in flight at once; nextcord already waits out per-route rate limits
+STADIUM_CATEGORY = "Vacant Stadiums"
+
+IMPORT_TEAMS = """
+CREATE TEMPORARY TABLE teams_import (LIKE teams) ON COMMIT DROP;
+"""
+MERGE_TEAMS = """
+INSERT INTO teams (teamid, roleid, city, name, logourl, channelid)
+SELECT teamid, roleid, city, name, logourl, channelid FROM teams_import
+ON CONFLICT (teamid) DO UPDATE SET roleid = EXCLUDED.roleid, city = EXCLUDED.city, name = EXCLUDED.name,
+                                   logourl = EXCLUDED.logourl, channelid = EXCLUDED.channelid
+"""
+IMPORT_PLAYERS = """
+CREATE TEMPORARY TABLE players_import (LIKE players) ON COMMIT DROP;
+"""
+MERGE_PLAYERS = """
+INSERT INTO players (playerid, firstname, lastname, playerposition, playertype, playerteam, approved)
+SELECT playerid, firstname, lastname, playerposition, playertype, playerteam, approved FROM players_import
+ON CONFLICT (playerid) DO UPDATE SET firstname = EXCLUDED.firstname, lastname = EXCLUDED.lastname,
+                                     playerposition = EXCLUDED.playerposition, playertype = EXCLUDED.playertype,
+                                     playerteam = EXCLUDED.playerteam, approved = EXCLUDED.approved
+"""
+# Checked inside the import's transaction, so a file that would put two goalies on one team is rolled back
+DOUBLE_ROSTERED = """
+SELECT playerteam, playerposition FROM players WHERE playerteam IS NOT NULL GROUP BY playerteam, playerposition HAVING COUNT(*) > 1
+"""
+
+
+class SeasonFileError(ValueError):
+    """Raised when a season file cannot be imported. Lists every problem found, not just the first."""
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+
+@dataclass
+class TeamRow:
+    team_id: str
+    city: Optional[str] = None
+    name: Optional[str] = None
+    color: Optional[int] = None
+    stadium: Union[int, str, None] = None  # A channel ID, or a channel name to look up (and create if missing)
+    logo_url: Optional[str] = None
+    role_id: Optional[int] = None
+
+    def full_name(self, current=None) -> Optional[str]:
+        """
+        The name of the team's role. Like the database import, takes the city or name the file leaves out from the
+        team's current row (a team_registry.Team). None while either is still unknown.
+        """
+        city = self.city or (current.city if current else None)
+        name = self.name or (current.name if current else None)
+        return f"{city} {name}" if city and name else None
+
+
+@dataclass
+class PlayerRow:
+    player_id: int
+    first_name: str
+    last_name: str
+    position: str
+    archetype: Optional[str] = None  # As stored: PASSER, SHOOTER or DEKER
+    team_id: Optional[str] = None
+
+
+@dataclass
+class Season:
+    teams: Dict[str, TeamRow] = field(default_factory=dict)
+    players: Dict[int, PlayerRow] = field(default_factory=dict)
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _optional(value) -> Optional[str]:
+    return None if _blank(value) else str(value).strip()
+
+
+def _team_row(raw: dict, errors: List[str], where: str) -> Optional[TeamRow]:
+    team_id = (_optional(raw.get("team_id")) or "").upper()
+    if not team_id or len(team_id) > 3:
+        errors.append(f"{where}: team_id must be 1-3 characters")
+        return None
+    team = TeamRow(team_id, _optional(raw.get("city")), _optional(raw.get("name")), logo_url=_optional(raw.get("logo_url")))
+    color = raw.get("color")
+    if isinstance(color, int) and not isinstance(color, bool):  # JSON numbers are already the color's value
+        if 0 <= color <= 0xFFFFFF:
+            team.color = color
+        else:
+            errors.append(f"{where}: color {color} is out of range")
+    elif not _blank(color):
+        try:
+            team.color = int(str(color).strip().lstrip("#"), 16)
+        except ValueError:
+            errors.append(f"{where}: color {color!r} is not a hex code")
+    stadium = _optional(raw.get("stadium"))
+    if stadium is not None:
+        team.stadium = int(stadium) if stadium.isdigit() else stadium.lstrip("#")
+    role_id = _optional(raw.get("role_id"))
+    if role_id is not None:
+        if role_id.isdigit():
+            team.role_id = int(role_id)
+        else:
+            errors.append(f"{where}: role_id {role_id!r} is not an ID")
+    return team
+
+
+def _player_row(raw: dict, errors: List[str], where: str) -> Optional[PlayerRow]:
+    player_id, position = _optional(raw.get("player_id")), (_optional(raw.get("position")) or "").upper()
+    first_name, last_name = _optional(raw.get("first_name")), _optional(raw.get("last_name"))
+    archetype, team_id = (_optional(raw.get("archetype")) or "").upper() or None, (_optional(raw.get("team_id")) or "").upper() or None
+    problems = []
+    if player_id is None or not player_id.isdigit():
+        problems.append("player_id must be a Discord user ID")
+    if first_name is None or last_name is None:
+        problems.append("first_name and last_name are required")
+    if position not in POSITIONS:
+        problems.append(f"position must be one of {', '.join(POSITIONS)}")
+    elif position == "GOALIE":
+        archetype = None
+    elif archetype not in STORED_ARCHETYPES:
+        archetype = ARCHETYPES.get(archetype)
+        if archetype is None:
+            problems.append(f"{position.lower()}s need an archetype")
+    errors.extend(f"{where}: {problem}" for problem in problems)
+    if problems:
+        return None
+    return PlayerRow(int(player_id), first_name, last_name, position, archetype, team_id)
+
+
+def parse_season(files: Dict[str, str]) -> Season:
+    """Parses season files (file name -> contents). A .json file holds teams and players; a CSV holds either."""
+    season, errors = Season(), []
+
+    def add_rows(rows: Iterable[dict], file_name: str, kind: str):
+        for number, raw in enumerate(rows, 1):
+            where = f"{file_name} {kind} {number}"
+            if kind == "team":
+                row = _team_row(raw, errors, where)
+                if row is not None:
+                    if row.team_id in season.teams:
+                        errors.append(f"{where}: team {row.team_id} appears more than once")
+                    season.teams[row.team_id] = row
+            else:
+                row = _player_row(raw, errors, where)
+                if row is not None:
+                    if row.player_id in season.players:
+                        errors.append(f"{where}: player {row.player_id} appears more than once")
+                    season.players[row.player_id] = row
+
+    for file_name, text in files.items():
+        if file_name.lower().endswith(".json"):
+            try:
+                document = json.loads(text)
+            except json.JSONDecodeError as error:
+                errors.append(f"{file_name}: not valid JSON ({error})")
+                continue
+            add_rows(document.get("teams", ()), file_name, "team")
+            add_rows(document.get("players", ()), file_name, "player")
+        else:
+            reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+            add_rows(reader, file_name, "player" if "player_id" in (reader.fieldnames or ()) else "team")
+
+    # Rosters may only be one player deep at each position, and only on teams that exist
+    filled: Dict[Tuple[str, str], int] = {}
+    for player in season.players.values():
+        if player.team_id is None:
+            continue
+        key = (player.team_id, player.position)
+        if key in filled:
+            errors.append(f"players {filled[key]} and {player.player_id} are both {player.position.lower()}s for {player.team_id}")
+        filled[key] = player.player_id
+    if errors:
+        raise SeasonFileError(errors)
+    return season
+
+
+@dataclass
+class DatabasePlan:
+    """The rows an import would insert or change, and what changed in each."""
+    new_teams: List[TeamRow] = field(default_factory=list)
+    changed_teams: List[Tuple[TeamRow, Dict[str, tuple]]] = field(default_factory=list)
+    new_players: List[PlayerRow] = field(default_factory=list)
+    changed_players: List[Tuple[PlayerRow, Dict[str, tuple]]] = field(default_factory=list)
+    unchanged: int = 0
+
+    def __bool__(self):
+        return bool(self.new_teams or self.changed_teams or self.new_players or self.changed_players)
+
+    def describe(self) -> List[str]:
+        lines = [f"+ team {team.team_id} ({team.full_name()})" for team in self.new_teams]
+        lines += [f"~ team {team.team_id} " + ", ".join(f"{name}: {old!r} -> {new!r}" for name, (old, new) in changes.items())
+                  for team, changes in self.changed_teams]
+        lines += [f"+ player {player.player_id} {player.first_name} {player.last_name} ({player.position.lower()}, {player.team_id or 'FA'})"
+                  for player in self.new_players]
+        lines += [f"~ player {player.player_id} " + ", ".join(f"{name}: {old!r} -> {new!r}" for name, (old, new) in changes.items())
+                  for player, changes in self.changed_players]
+        return lines
+
+
+def _changes(current, wanted: Dict[str, object]) -> Dict[str, tuple]:
+    return {column: (current[column], value) for column, value in wanted.items() if current[column] != value}
+
+
+def _team_values(team: TeamRow) -> Dict[str, object]:
+    """The teams columns a team row sets. Anything left out of the file keeps its current value."""
+    values = {"roleid": team.role_id, "city": team.city, "name": team.name, "logourl": team.logo_url,
+              "channelid": team.stadium if isinstance(team.stadium, int) else None}
+    return {column: value for column, value in values.items() if value is not None}
+
+
+def _player_values(player: PlayerRow) -> Dict[str, object]:
+    return {"firstname": player.first_name, "lastname": player.last_name, "playerposition": player.position,
+            "playertype": player.archetype, "playerteam": player.team_id, "approved": True}
+
+
+def plan_database(season: Season, current_teams: Dict[str, dict], current_players: Dict[int, dict]) -> DatabasePlan:
+    """Diffs a season against the teams and players rows it touches."""
+    plan = DatabasePlan()
+    for team in season.teams.values():
+        current = current_teams.get(team.team_id)
+        if current is None:
+            plan.new_teams.append(team)
+            continue
+        changes = _changes(current, _team_values(team))
+        if changes:
+            plan.changed_teams.append((team, changes))
+        else:
+            plan.unchanged += 1
+    for player in season.players.values():
+        current = current_players.get(player.player_id)
+        if current is None:
+            plan.new_players.append(player)
+            continue
+        changes = _changes(current, _player_values(player))
+        if changes:
+            plan.changed_players.append((player, changes))
+        else:
+            plan.unchanged += 1
+    return plan
+
+
+def unknown_teams(season: Season, current_teams: Iterable[str]) -> List[str]:
+    """Teams that players are rostered to but that neither the file nor the database has."""
+    known = set(season.teams) | set(current_teams)
+    return sorted({player.team_id for player in season.players.values() if player.team_id and player.team_id not in known})
+
+
+def unnamed_teams(season: Season, current_teams: Iterable[str]) -> List[str]:
+    """New teams the file does not give both a city and a name, which their role would be named after."""
+    current_teams = set(current_teams)
+    return sorted(team.team_id for team in season.teams.values() if team.team_id not in current_teams and team.full_name() is None)
+
+
+async def current_rows(fetch: Callable[..., Awaitable[list]], season: Season) -> Tuple[Dict[str, dict], Dict[int, dict]]:
+    """Reads the rows a season touches. fetch runs a query and its arguments (Pool.fetch or Connection.fetch)."""
+    teams = {record["teamid"]: dict(record) for record in await fetch("SELECT teamid, roleid, city, name, logourl, channelid FROM teams")}
+    players = {record["playerid"]: dict(record) for record in await fetch(Statements.players.query, list(season.players))}
+    return teams, players
+
+
+def _team_record(team: TeamRow, current: Optional[dict]) -> tuple:
+    values = dict(current or {column: None for column in TEAM_COLUMNS}, teamid=team.team_id)
+    values.update(_team_values(team))
+    return tuple(values[column] for column in TEAM_COLUMNS)
+
+
+def _player_record(player: PlayerRow) -> tuple:
+    values = dict(_player_values(player), playerid=player.player_id)
+    return tuple(values[column] for column in PLAYER_COLUMNS)
+
+
+async def import_rows(connection, plan: DatabasePlan, current_teams: Dict[str, dict]):
+    """Copies every new and changed row in one transaction: COPY into temporary tables, then one upsert per table."""
+    teams = [_team_record(team, current_teams.get(team.team_id)) for team in plan.new_teams + [team for team, _ in plan.changed_teams]]
+    players = [_player_record(player) for player in plan.new_players + [player for player, _ in plan.changed_players]]
+    missing_roles = [team[0] for team in teams if team[1] is None]
+    if missing_roles:
+        raise SeasonFileError([f"team {team_id} has no role; give it a role_id or import it with the importseason command" for team_id in missing_roles])
+    async with connection.transaction():
+        if teams:
+            await connection.execute(IMPORT_TEAMS)
+            await connection.copy_records_to_table("teams_import", records=teams, columns=TEAM_COLUMNS)
+            await connection.execute(MERGE_TEAMS)
+        if players:
+            await connection.execute(IMPORT_PLAYERS)
+            await connection.copy_records_to_table("players_import", records=players, columns=PLAYER_COLUMNS)
+            await connection.execute(MERGE_PLAYERS)
+        double_rostered = await connection.fetch(DOUBLE_ROSTERED)
+        if double_rostered:
+            raise SeasonFileError([f"{record['playerteam']} would have more than one {record['playerposition'].lower()}" for record in double_rostered])
+
+
+class DiscordJob:
+    """One Discord request of an import, with a line describing it for dry runs."""
+    __slots__ = ("description", "run")
+
+    def __init__(self, description: str, run: Callable[[], Awaitable]):
+        self.description = description
+        self.run = run
+
+
+async def run_jobs(jobs: List[DiscordJob], concurrency: int = DEFAULT_CONCURRENCY,
+                   progress: Optional[Callable[[int, int], Awaitable]] = None, logger=None) -> List[str]:
+    """
+    Runs jobs on a bounded pool of workers. Discord server errors and rate limits are retried as every background
+    Discord request is (see discord_mutations.with_retries); anything else fails just that job. Returns a line for each
+    job that failed.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    failures, done = [], 0
+
+    async def worker():
+        nonlocal done
+        while not queue.empty():
+            job = queue.get_nowait()
+            try:
+                await with_retries(job.run)
+            except nextcord.HTTPException as error:
+                failures.append(f"{job.description}: {error}")
+                if logger:
+                    logger.warning(f"Season import: {job.description} failed: {error!r}")
+            done += 1
+            if progress is not None:
+                await progress(done, len(jobs))
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(jobs)))))
+    return failures
+
+
+class DiscordPlan:
+    """
+    What an import changes on Discord. create jobs make the roles and stadium channels that database rows refer to
+    and run before the database import; update jobs run after it.
+    """
+    def __init__(self, bot, guild: nextcord.Guild, season: Season):
+        self.bot, self.guild, self.season = bot, guild, season
+        self.index = bot.guild_indexes.get(guild)
+        self.roles: Dict[str, Optional[nextcord.Role]] = {}  # Team ID -> its role, once it exists
+        self.create: List[DiscordJob] = []
+        self.update: List[DiscordJob] = []
+        self.warnings: List[str] = []
+        self._plan_teams()
+
+    def _plan_teams(self):
+        for team in self.season.teams.values():
+            existing = self.bot.teams.get(team.team_id)
+            role_id = team.role_id or (existing.role_id if existing else None)
+            role_name = team.full_name(existing)
+            role = (self.guild.get_role(role_id) if role_id else None) or (self.index.role_named(role_name) if role_name else None)
+            self.roles[team.team_id] = role
+            if role is None and role_name is None:
+                self.warnings.append(f"{team.team_id} has no role, and no city and name to name a new one after")
+            elif role is None:
+                self.create.append(DiscordJob(f"create role {role_name}", self._creator(team, role_name)))
+            elif (role_name is not None and role.name != role_name) or (team.color is not None and role.color.value != team.color):
+                self.update.append(DiscordJob(f"edit role {role.name} -> {role_name or role.name}", self._editor(team, role, role_name)))
+            team.role_id = role.id if role else None
+            if isinstance(team.stadium, str):
+                channel = self.index.channel_named(team.stadium)
+                if channel is None:
+                    self.create.append(DiscordJob(f"create channel #{team.stadium}", self._channel_creator(team)))
+                else:
+                    team.stadium = channel.id
+            elif isinstance(team.stadium, int) and self.guild.get_channel(team.stadium) is None:
+                self.warnings.append(f"{team.team_id}'s stadium {team.stadium} is not a channel in this server")
+
+    def _creator(self, team: TeamRow, role_name: str):
+        async def create():
+            role = await self.guild.create_role(name=role_name, color=nextcord.Colour(team.color or 0), hoist=True)
+            team.role_id = role.id
+            self.roles[team.team_id] = role
+        return create
+
+    @staticmethod
+    def _editor(team: TeamRow, role: nextcord.Role, role_name: Optional[str]):
+        async def edit():  # The name is left alone while the team's city or name is unknown
+            await role.edit(name=role_name or role.name, color=nextcord.Colour(team.color) if team.color is not None else role.color)
+        return edit
+
+    def _channel_creator(self, team: TeamRow):
+        async def create():
+            channel = await self.guild.create_text_channel(team.stadium, category=self.index.category_named(STADIUM_CATEGORY))
+            team.stadium = channel.id
+        return create
+
+    def plan_members(self):
+        """Plans member role changes. On a real import, runs after the create jobs, once every team has a role."""
+        for team_id, role in self.roles.items():
+            if role is None and self.season.teams[team_id].role_id is not None:
+                self.roles[team_id] = self.guild.get_role(self.season.teams[team_id].role_id)
+        team_roles = {**{team.team_id: self.guild.get_role(team.role_id) for team in self.bot.teams}, **self.roles}
+        all_team_roles = {role for role in team_roles.values() if role is not None}
+        for player in self.season.players.values():
+            member = self.guild.get_member(player.player_id)
+            if member is None:
+                self.warnings.append(f"player {player.player_id} ({player.first_name} {player.last_name}) is not in this server")
+                continue
+            team_role = team_roles.get(player.team_id)
+            new_team = self.season.teams.get(player.team_id)
+            uncreated = f" and the new {new_team.full_name(self.bot.teams.get(player.team_id))} role" if new_team and team_role is None else ""
+            wanted = [team_role, self.index.role_named(player.position.title())]
+            roles = [role for role in member.roles[1:] if role not in all_team_roles] + [role for role in wanted if role is not None]
+            roles = list(dict.fromkeys(roles))  # member.roles[0] is @everyone, which cannot be set
+            if set(roles) != set(member.roles[1:]) or uncreated:
+                self.update.append(DiscordJob(f"set roles of {member} to {', '.join(role.name for role in roles)}{uncreated}",
+                                              lambda member=member, roles=roles: member.edit(roles=roles, reason="Season import")))
+
+
+async def main():
+    """Previews or imports season files into the database in configuration.json."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--dry-run", action="store_true", help="print what would change without changing it")
+    args = parser.parse_args()
+    files = {}
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as season_file:
+            files[path] = season_file.read()
+    try:
+        season = parse_season(files)
+    except SeasonFileError as error:
+        sys.exit(f"Cannot import:\n{error}")
+
+    with open("configuration.json", "r") as configuration_file:
+        configuration = json.load(configuration_file)
+    connection = await asyncpg.connect(**configuration["postgresql_creds"])
+    try:
+        current_teams, current_players = await current_rows(connection.fetch, season)
+        missing = unknown_teams(season, current_teams)
+        if missing:
+            sys.exit(f"Cannot import: players are rostered to unknown teams {', '.join(missing)}")
+        unnamed = unnamed_teams(season, current_teams)
+        if unnamed:
+            sys.exit(f"Cannot import: new teams need a city and a name: {', '.join(unnamed)}")
+        plan = plan_database(season, current_teams, current_players)
+        print("\n".join(plan.describe()) or "Nothing to change.")
+        print(f"{len(plan.new_teams)} new teams, {len(plan.changed_teams)} changed teams, {len(plan.new_players)} new players, "
+              f"{len(plan.changed_players)} changed players, {plan.unchanged} unchanged")
+        if args.dry_run or not plan:
+            return
+        start = time.perf_counter()
+        try:
+            await import_rows(connection, plan, current_teams)
+        except SeasonFileError as error:
+            sys.exit(f"Import rolled back:\n{error}")
+        print(f"Imported in {(time.perf_counter() - start) * 1000:.0f} ms. Run the importseason command with the same files to sync "
+              f"Discord roles, then refreshteams and refreshplayers.")
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,263 @@
+"""
+Registry of every prepared statement used by Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Awaitable, Callable, Generic, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from asyncpg import Record
+
+from metrics import STATEMENT, Metrics
+
+
+T = TypeVar("T")
+
+
+class Statement(Generic[T]):
+    """
+    A query that is prepared on every pooled connection. Accessing one through a Statements object returns an async
+    function that takes the query's arguments and runs it with the given method (fetch, fetchrow, fetchval or execute).
+    """
+    def __init__(self, method: str, query: str):
+        if method not in ("fetch", "fetchrow", "fetchval", "execute"):
+            raise ValueError(f"Unknown statement method {method}")
+        self.method = method
+        self.query = query
+        self.name: Optional[str] = None
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, registry, owner=None) -> Callable[..., Awaitable[T]]:
+        if registry is None:
+            return self
+
+        async def run(*args) -> T:
+            return await registry.run(self, *args)
+        return run
+
+
+class Statements:
+    """Declares every query the bot sends to the database. Command handlers should never send ad-hoc SQL."""
+    # Teams
+    all_teams = Statement[List[Record]]("fetch", """SELECT teamid, roleid, city, name, logourl, channelid FROM teams""")
+    team_exists = Statement[bool]("fetchval", """SELECT EXISTS(SELECT 1 FROM teams WHERE teamid = UPPER($1))""")
+    insert_team = Statement[Record]("fetchrow", """INSERT INTO teams (teamid, roleid) VALUES ($1, $2)
+                                                  RETURNING teamid, roleid, city, name, logourl, channelid""")
+    set_team_city = Statement[str]("execute", """UPDATE teams SET city = $1 WHERE teamid = $2""")
+    set_team_name = Statement[str]("execute", """UPDATE teams SET name = $1 WHERE teamid = $2""")
+    set_team_stadium = Statement[str]("execute", """UPDATE teams SET channelid = $1 WHERE teamid = $2""")
+    set_team_logo = Statement[str]("execute", """UPDATE teams SET logourl = $1 WHERE teamid = $2""")
+
+    # Players
+    player = Statement[List[Record]]("fetch", """SELECT * FROM players WHERE playerid = $1""")
+    players = Statement[List[Record]]("fetch", """SELECT * FROM players WHERE playerid = ANY($1)""")
+    player_names = Statement[List[Record]]("fetch", """SELECT playerid, firstname, lastname FROM players""")  # See player_search.PlayerSearch
+    player_registered = Statement[bool]("fetchval", """SELECT EXISTS(SELECT 1 FROM players WHERE playerid = $1)""")
+    player_team = Statement[Optional[str]]("fetchval", """SELECT playerteam FROM players WHERE playerid = $1""")
+    player_full_name = Statement[Optional[str]]("fetchval", """SELECT CONCAT(firstname, ' ', lastname) AS fullname FROM players WHERE playerid = $1""")
+    player_first_name = Statement[Optional[str]]("fetchval", """SELECT firstname FROM players WHERE playerid = $1""")
+    player_last_name = Statement[Optional[str]]("fetchval", """SELECT lastname FROM players WHERE playerid = $1""")
+    player_approved = Statement[Optional[bool]]("fetchval", """SELECT approved FROM players WHERE playerid = $1""")
+    player_name_and_team = Statement[Optional[Record]]("fetchrow", """SELECT CONCAT(firstname, ' ', lastname) AS fullname, playerteam
+                                                                     FROM players WHERE playerid = $1""")
+    player_roster_info = Statement[Optional[Record]]("fetchrow", """SELECT CONCAT(firstname, ' ', lastname) AS fullname, approved, playerposition
+                                                                   FROM players WHERE playerid = $1""")
+    player_approval_info = Statement[Optional[Record]]("fetchrow", """SELECT playerposition, playertype, lastname, approved FROM players WHERE playerid = $1""")
+    player_position_info = Statement[Optional[Record]]("fetchrow", """SELECT CONCAT(firstname, ' ', lastname) AS fullname, playerteam, playerposition, playertype
+                                                                     FROM players WHERE playerid = $1""")
+    team_members = Statement[List[Record]]("fetch", """SELECT playerid, playerposition FROM players WHERE playerteam = $1""")
+    team_player_at_position = Statement[Optional[int]]("fetchval", """SELECT playerid FROM players WHERE playerteam = $1 AND playerposition = $2""")
+    team_position_filled = Statement[bool]("fetchval", """SELECT EXISTS(SELECT 1 FROM players WHERE playerteam = $1 AND playerposition = $2)""")
+    insert_player = Statement[str]("execute", """INSERT INTO players
+                                                (playerid, playerposition, playertype, firstname, lastname)
+                                                VALUES ($1, $2, $3, $4, $5)""")
+    delete_player = Statement[str]("execute", """DELETE FROM players WHERE playerid = $1""")
+    approve_player = Statement[str]("execute", """UPDATE players SET approved = 't' WHERE playerid = $1""")
+    set_player_team = Statement[str]("execute", """UPDATE players SET playerteam = $1 WHERE playerid = $2""")
+    set_player_first_name = Statement[str]("execute", """UPDATE players SET firstname = $1 WHERE playerid = $2""")
+    set_player_last_name = Statement[str]("execute", """UPDATE players SET lastname = $1 WHERE playerid = $2""")
+    set_player_position = Statement[str]("execute", """UPDATE players SET playerposition = $1, playertype = $2 WHERE playerid = $3""")
+    set_player_archetype = Statement[str]("execute", """UPDATE players SET playertype = $1 WHERE playerid = $2""")
+
+    # Games
+    create_game = Statement[Record]("fetchrow", """SELECT * FROM create_game($1, $2, $3)""")  # See schema.CREATE_GAME_FUNCTION
+    active_game_routes = Statement[List[Record]]("fetch", """SELECT gameid, stadium,
+                                                            CASE WHEN homenumbers IS NULL THEN (homeroster).goalie END AS homegoalie,
+                                                            CASE WHEN awaynumbers IS NULL THEN (awayroster).goalie END AS awaygoalie
+                                                            FROM games WHERE game_active""")
+    set_goalie_numbers = Statement[str]("execute", """UPDATE games SET homenumbers = CASE WHEN (homeroster).goalie = $2 THEN $3 ELSE homenumbers END,
+                                                                     awaynumbers = CASE WHEN (awayroster).goalie = $2 THEN $3 ELSE awaynumbers END
+                                                     WHERE gameid = $1 AND game_active""")
+    active_game_states = Statement[List[Record]]("fetch", """SELECT gameid, hometeam, awayteam, homescore, awayscore, homeroster, awayroster, movenum,
+                                                            stadium, cleanpasses, possession, waitingon_pos, game_active, homedelays, awaydelays,
+                                                            deadline, homenumbers, awaynumbers FROM games WHERE game_active""")  # See game_store
+    game_state = Statement[Optional[Record]]("fetchrow", """SELECT gameid, hometeam, awayteam, homescore, awayscore, homeroster, awayroster, movenum,
+                                                           stadium, cleanpasses, possession, waitingon_pos, game_active, homedelays, awaydelays,
+                                                           deadline, homenumbers, awaynumbers FROM games WHERE gameid = $1""")
+    save_game_state = Statement[str]("execute", """UPDATE games SET homescore = $2, awayscore = $3, movenum = $4, cleanpasses = $5,
+                                                  possession = $6, waitingon_side = $6, waitingon_pos = $7, deadline = $8, game_active = $9
+                                                  WHERE gameid = $1""")
+    charge_delay = Statement[Optional[Record]]("fetchrow", """UPDATE games SET homedelays = homedelays + (waitingon_side = 'HOME')::int,
+                                                                          awaydelays = awaydelays + (waitingon_side = 'AWAY')::int,
+                                                                          deadline = NOW() + $2
+                                                             WHERE gameid = $1 AND game_active
+                                                             RETURNING deadline, homedelays, awaydelays""")
+
+    # Registrations
+    registrations = Statement[List[Record]]("fetch", """SELECT * FROM registrations""")
+    save_registration = Statement[str]("execute", """INSERT INTO registrations
+                                                    (channelid, playerid, guildid, messageid, step, expires, firstname, lastname, playerposition, archetype)
+                                                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                                                    ON CONFLICT (channelid) DO UPDATE SET step = EXCLUDED.step, expires = EXCLUDED.expires,
+                                                    firstname = EXCLUDED.firstname, lastname = EXCLUDED.lastname,
+                                                    playerposition = EXCLUDED.playerposition, archetype = EXCLUDED.archetype""")
+    delete_registration = Statement[str]("execute", """DELETE FROM registrations WHERE channelid = $1""")
+
+    # Statistics (see stats.StatsEngine). Each adds to the running totals, so they are only ever given deltas
+    standings = Statement[List[Record]]("fetch", """SELECT teamid, wins, losses, ties, goalsfor, goalsagainst FROM standings""")
+    all_player_stats = Statement[List[Record]]("fetch", """SELECT * FROM player_stats""")
+    archetype_stats = Statement[List[Record]]("fetch", """SELECT archetype, action, attempts, successes FROM archetype_stats""")
+    add_standings = Statement[str]("execute", """INSERT INTO standings (teamid, wins, losses, ties, goalsfor, goalsagainst) VALUES ($1, $2, $3, $4, $5, $6)
+                                                ON CONFLICT (teamid) DO UPDATE SET wins = standings.wins + EXCLUDED.wins,
+                                                losses = standings.losses + EXCLUDED.losses, ties = standings.ties + EXCLUDED.ties,
+                                                goalsfor = standings.goalsfor + EXCLUDED.goalsfor, goalsagainst = standings.goalsagainst + EXCLUDED.goalsagainst""")
+    add_player_stats = Statement[str]("execute", """INSERT INTO player_stats (playerid, moves, passes, completedpasses, dekes, completeddekes, shots, goals,
+                                                                           turnovers, shotsfaced, saves, goalsagainst)
+                                                   VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+                                                   ON CONFLICT (playerid) DO UPDATE SET moves = player_stats.moves + EXCLUDED.moves,
+                                                   passes = player_stats.passes + EXCLUDED.passes,
+                                                   completedpasses = player_stats.completedpasses + EXCLUDED.completedpasses,
+                                                   dekes = player_stats.dekes + EXCLUDED.dekes, completeddekes = player_stats.completeddekes + EXCLUDED.completeddekes,
+                                                   shots = player_stats.shots + EXCLUDED.shots, goals = player_stats.goals + EXCLUDED.goals,
+                                                   turnovers = player_stats.turnovers + EXCLUDED.turnovers,
+                                                   shotsfaced = player_stats.shotsfaced + EXCLUDED.shotsfaced, saves = player_stats.saves + EXCLUDED.saves,
+                                                   goalsagainst = player_stats.goalsagainst + EXCLUDED.goalsagainst""")
+    add_archetype_stats = Statement[str]("execute", """INSERT INTO archetype_stats (archetype, action, attempts, successes) VALUES ($1, $2, $3, $4)
+                                                      ON CONFLICT (archetype, action) DO UPDATE SET attempts = archetype_stats.attempts + EXCLUDED.attempts,
+                                                      successes = archetype_stats.successes + EXCLUDED.successes""")
+
+    # Play-by-play (see events.EventLog)
+    game_events = Statement[List[Record]]("fetch", """SELECT * FROM game_events WHERE gameid = $1 ORDER BY movenum""")
+
+    # Webhooks
+    webhook = Statement[Optional[Record]]("fetchrow", """SELECT webhookurl, twitter_handle, twittername, avatar, templates FROM webhooks WHERE webhookname = $1""")
+
+    def __init__(self, db, metrics: Metrics):
+        self.db = db
+        self.metrics = metrics
+
+    @classmethod
+    def declared(cls) -> Iterator[Statement]:
+        """Iterates over every statement declared on the registry."""
+        for value in vars(cls).values():
+            if isinstance(value, Statement):
+                yield value
+
+    @classmethod
+    async def prepare(cls, connection):
+        """Prepares every declared statement on a connection. Used as part of the pool's connection init hook."""
+        connection.prepared = {statement.name: await connection.prepare(statement.query) for statement in cls.declared()}
+
+    async def run(self, statement: Statement, *args):
+        """Runs a declared statement on a pooled connection, recording its latency."""
+        with self.metrics.measure(STATEMENT, statement.name):
+            async with self.db.acquire() as connection:
+                return await self.run_on(connection, statement, *args)
+
+    async def commit(self, work: "UnitOfWork"):
+        """Runs everything queued on a unit of work in one transaction, recording its latency."""
+        if not work:
+            return
+        with self.metrics.measure(STATEMENT, "unit_of_work"):
+            async with self.db.acquire() as connection:
+                if len(work.batches) == 1:  # A single statement, or a single executemany, is already atomic
+                    await work.run_on(connection)
+                else:
+                    async with connection.transaction():
+                        await work.run_on(connection)
+
+    @staticmethod
+    async def run_many_on(connection, statement: Statement, args):
+        """Runs an execute statement once per tuple of arguments in args, pipelined, on an already acquired connection."""
+        if statement.method != "execute":
+            raise ValueError(f"{statement.name} does not use execute, so its results cannot be batched")
+        await connection.prepared[statement.name].executemany(args)
+
+    @staticmethod
+    async def run_on(connection, statement: Statement, *args):
+        """Runs a declared statement on an already acquired connection (for example, inside a transaction)."""
+        prepared = connection.prepared[statement.name]
+        if statement.method == "execute":
+            await prepared.fetch(*args)
+            return prepared.get_statusmsg()
+        return await getattr(prepared, statement.method)(*args)
+
+
+class CopyRows(NamedTuple):
+    """A COPY of rows into a table, queued with UnitOfWork.copy()."""
+    table: str
+    columns: Tuple[str, ...]
+
+
+class UnitOfWork:
+    """
+    Writes queued to run together, in order, in a single transaction; see Bot.unit_of_work(). Consecutive writes with
+    the same statement are sent as one executemany, so a batch of N rows costs one round trip rather than N. Only
+    execute statements (and raw SQL) can be queued, since nothing runs until the unit of work is committed.
+    """
+    def __init__(self):
+        self.batches: List[Tuple[Union[Statement, str, CopyRows], List[tuple]]] = []
+
+    def __len__(self):
+        return sum(len(args) for _, args in self.batches)
+
+    def add(self, statement: Union[Statement, str], *args):
+        """Queues a declared execute statement (e.g. Statements.set_player_team) or a raw SQL string."""
+        self.add_many(statement, [args])
+
+    def add_many(self, statement: Union[Statement, str], args: Iterable[tuple]):
+        """Queues a statement once per tuple of arguments."""
+        if isinstance(statement, Statement) and statement.method != "execute":
+            raise ValueError(f"{statement.name} does not use execute, so it cannot be queued")
+        self._append(statement, list(args))
+
+    def copy(self, table: str, columns: Iterable[str], rows: Iterable[tuple]):
+        """Queues rows to be appended to a table with COPY, which is much cheaper than INSERT for large batches."""
+        self._append(CopyRows(table, tuple(columns)), list(rows))
+
+    def _append(self, statement: Union[Statement, str, CopyRows], args: List[tuple]):
+        if not args:
+            return
+        if self.batches and self.batches[-1][0] == statement:
+            self.batches[-1][1].extend(args)
+        else:
+            self.batches.append((statement, args))
+
+    async def run_on(self, connection):
+        """Runs every queued batch on an already acquired connection. The caller owns the transaction."""
+        for statement, args in self.batches:
+            if isinstance(statement, CopyRows):
+                await connection.copy_records_to_table(statement.table, records=args, columns=statement.columns)
+            elif isinstance(statement, str):
+                if len(args) == 1:
+                    await connection.execute(statement, *args[0])
+                else:
+                    await connection.executemany(statement, args)
+            elif len(args) == 1:
+                await Statements.run_on(connection, statement, *args[0])
+            else:
+                await Statements.run_many_on(connection, statement, args)
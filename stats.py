@@ -0,0 +1,214 @@
+"""
+League standings and player statistics for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from engine import Action, Archetype, Outcome
+from events import GameEvent
+from statements import Statements, UnitOfWork
+from util import MOVES_PER_GAME, home_away_opposite
+
+STANDING_COLUMNS = ("wins", "losses", "ties", "goalsfor", "goalsagainst")
+PLAYER_COLUMNS = ("moves", "passes", "completedpasses", "dekes", "completeddekes", "shots", "goals", "turnovers", "shotsfaced", "saves", "goalsagainst")
+SUCCESSES = {Outcome.PASS_COMPLETE, Outcome.DEKE_COMPLETE, Outcome.GOAL}
+# What each action counts towards for the player who made it: (attempt column, success column)
+ACTION_COLUMNS = {Action.PASS: ("passes", "completedpasses"), Action.DEKE: ("dekes", "completeddekes"), Action.SHOOT: ("shots", "goals")}
+
+# Recomputes standings from every game played to the end (abandoned games do not count)
+REBUILD_STANDINGS = f"""
+WITH results AS (
+    SELECT hometeam AS teamid, homescore AS goalsfor, awayscore AS goalsagainst FROM games WHERE NOT game_active AND movenum >= {MOVES_PER_GAME}
+    UNION ALL
+    SELECT awayteam, awayscore, homescore FROM games WHERE NOT game_active AND movenum >= {MOVES_PER_GAME}
+)
+INSERT INTO standings (teamid, wins, losses, ties, goalsfor, goalsagainst)
+SELECT teamid, COUNT(*) FILTER (WHERE goalsfor > goalsagainst), COUNT(*) FILTER (WHERE goalsfor < goalsagainst),
+       COUNT(*) FILTER (WHERE goalsfor = goalsagainst), SUM(goalsfor), SUM(goalsagainst)
+FROM results GROUP BY teamid
+"""
+# Recomputes player totals from the play-by-play log: skaters from the moves they made, goalies from the shots they faced
+REBUILD_PLAYER_STATS = f"""
+WITH skaters AS (
+    SELECT playerid, COUNT(*) AS moves,
+           COUNT(*) FILTER (WHERE action = {Action.PASS:d}) AS passes, COUNT(*) FILTER (WHERE outcome = {Outcome.PASS_COMPLETE:d}) AS completedpasses,
+           COUNT(*) FILTER (WHERE action = {Action.DEKE:d}) AS dekes, COUNT(*) FILTER (WHERE outcome = {Outcome.DEKE_COMPLETE:d}) AS completeddekes,
+           COUNT(*) FILTER (WHERE action = {Action.SHOOT:d}) AS shots, COUNT(*) FILTER (WHERE outcome = {Outcome.GOAL:d}) AS goals,
+           COUNT(*) FILTER (WHERE outcome = {Outcome.TURNOVER:d}) AS turnovers
+    FROM game_events GROUP BY playerid
+), goalies AS (
+    SELECT goalieid AS playerid, COUNT(*) AS shotsfaced, COUNT(*) FILTER (WHERE outcome = {Outcome.SAVE:d}) AS saves,
+           COUNT(*) FILTER (WHERE outcome = {Outcome.GOAL:d}) AS goalsagainst
+    FROM game_events WHERE outcome IN ({Outcome.GOAL:d}, {Outcome.SAVE:d}) GROUP BY goalieid
+)
+INSERT INTO player_stats ({", ".join(("playerid",) + PLAYER_COLUMNS)})
+SELECT playerid, {", ".join(f"COALESCE({column}, 0)" for column in PLAYER_COLUMNS)}
+FROM skaters FULL JOIN goalies USING (playerid)
+WHERE playerid IN (SELECT playerid FROM players)
+"""
+REBUILD_ARCHETYPE_STATS = f"""
+INSERT INTO archetype_stats (archetype, action, attempts, successes)
+SELECT (ARRAY{[archetype.name for archetype in Archetype]})[archetype + 1], (ARRAY{[action.name for action in Action]})[action + 1],
+       COUNT(*), COUNT(*) FILTER (WHERE outcome IN ({", ".join(f"{outcome:d}" for outcome in SUCCESSES)}))
+FROM game_events GROUP BY archetype, action
+"""
+
+
+class Standing(NamedTuple):
+    team_id: str
+    wins: int
+    losses: int
+    ties: int
+    goals_for: int
+    goals_against: int
+
+    @property
+    def points(self) -> int:
+        return 2 * self.wins + self.ties
+
+    @property
+    def goal_difference(self) -> int:
+        return self.goals_for - self.goals_against
+
+
+class StatsDeltas(NamedTuple):
+    """Changes made in memory since the last write, keyed like StatsEngine's totals."""
+    teams: Dict[str, Counter]
+    players: Dict[int, Counter]
+    archetypes: Dict[Tuple[str, str], Counter]
+
+
+class StatsEngine:
+    """
+    Keeps standings, per-player and per-archetype totals in memory, updated as each move resolves and each game ends,
+    so the stat commands never aggregate over past games. The same changes are collected as deltas and added onto the
+    stats tables in the transaction that saves the game state they came from (see ActiveGameStore._flush), so the
+    tables never count a move that was not saved, or miss one that was. rebuild() recomputes the tables from scratch
+    for corrections, from the games table and the play-by-play log (see events.EventLog).
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.teams: Dict[str, Counter] = {}
+        self.players: Dict[int, Counter] = {}
+        self.archetypes: Dict[Tuple[str, str], Counter] = {}  # (archetype, action) -> attempts and successes
+        self._pending = StatsDeltas({}, {}, {})
+        self._standings: Optional[List[Standing]] = None
+        self._leaders: Dict[str, List[Tuple[int, int]]] = {}
+
+    async def load(self):
+        """Reads the stats tables. Changes not yet written are added back on top, since the tables do not have them yet."""
+        statements = self.bot.statements
+        self.teams = {record["teamid"]: Counter({column: record[column] for column in STANDING_COLUMNS}) for record in await statements.standings()}
+        self.players = {record["playerid"]: Counter({column: record[column] for column in PLAYER_COLUMNS}) for record in await statements.all_player_stats()}
+        self.archetypes = {(record["archetype"], record["action"]): Counter(attempts=record["attempts"], successes=record["successes"])
+                           for record in await statements.archetype_stats()}
+        self._apply(self._pending, 1)
+        self._changed()
+
+    def _changed(self):
+        self._standings = None
+        self._leaders.clear()
+
+    @staticmethod
+    def _add(totals: dict, pending: dict, key, **changes):
+        totals.setdefault(key, Counter()).update(changes)
+        pending.setdefault(key, Counter()).update(changes)
+
+    def move_resolved(self, game, side: str, player_id: int, action: Action, archetype: Archetype, outcome: Outcome, sign: int = 1):
+        """Counts a move made by a skater on the given side, and the shot against the other side's goalie if it was one."""
+        attempted, succeeded = ACTION_COLUMNS[action]
+        self._add(self.players, self._pending.players, player_id, moves=sign, turnovers=sign * int(outcome == Outcome.TURNOVER),
+                  **{attempted: sign, succeeded: sign * int(outcome in SUCCESSES)})
+        if outcome in (Outcome.GOAL, Outcome.SAVE):  # Misses never reach the goalie
+            goalie_id = game.roster(home_away_opposite(side)).goalie
+            self._add(self.players, self._pending.players, goalie_id, shotsfaced=sign, saves=sign * int(outcome == Outcome.SAVE),
+                      goalsagainst=sign * int(outcome == Outcome.GOAL))
+        self._add(self.archetypes, self._pending.archetypes, (archetype.name, action.name), attempts=sign, successes=sign * int(outcome in SUCCESSES))
+        self._changed()
+
+    def game_finished(self, game, sign: int = 1):
+        """Counts the final score of a game that was played to the end."""
+        state = game.state
+        for team_id, goals_for, goals_against in ((game.home_team, state.homescore, state.awayscore), (game.away_team, state.awayscore, state.homescore)):
+            self._add(self.teams, self._pending.teams, team_id, wins=sign * int(goals_for > goals_against), losses=sign * int(goals_for < goals_against),
+                      ties=sign * int(goals_for == goals_against), goalsfor=sign * goals_for, goalsagainst=sign * goals_against)
+        self._changed()
+
+    def forget(self, game, events: List[GameEvent]):
+        """
+        Takes undrained moves of a game back out, for when the state they lead to will not be written. game is in the
+        state the last of them left it in, so if they ended it, its result is taken back out too.
+        """
+        if events and game.state.is_over:
+            self.game_finished(game, -1)
+        for event in events:
+            self.move_resolved(game, "HOME" if event.home else "AWAY", event.playerid, event.action, event.archetype, event.outcome, -1)
+
+    def drain(self, work: UnitOfWork) -> StatsDeltas:
+        """Queues every change made since the last drain on a unit of work. Pass the result to revert() if the work fails."""
+        deltas, self._pending = self._pending, StatsDeltas({}, {}, {})
+        work.add_many(Statements.add_standings, [(team_id, *(delta[column] for column in STANDING_COLUMNS)) for team_id, delta in deltas.teams.items()])
+        work.add_many(Statements.add_player_stats, [(player_id, *(delta[column] for column in PLAYER_COLUMNS)) for player_id, delta in deltas.players.items()])
+        work.add_many(Statements.add_archetype_stats, [(*key, delta["attempts"], delta["successes"]) for key, delta in deltas.archetypes.items()])
+        return deltas
+
+    def revert(self, deltas: StatsDeltas):
+        """Takes drained changes back out of memory after the transaction that would have written them failed."""
+        self._apply(deltas, -1)
+        self._changed()
+
+    def _apply(self, deltas: StatsDeltas, sign: int):
+        for totals, changes in ((self.teams, deltas.teams), (self.players, deltas.players), (self.archetypes, deltas.archetypes)):
+            for key, delta in changes.items():
+                counter = totals.setdefault(key, Counter())
+                for column, value in delta.items():
+                    counter[column] += sign * value
+
+    def standings(self) -> List[Standing]:
+        """Every team with a finished game, by points, then wins, then goal difference."""
+        if self._standings is None:
+            standings = [Standing(team_id, *(totals[column] for column in STANDING_COLUMNS)) for team_id, totals in self.teams.items()]
+            self._standings = sorted(standings, key=lambda standing: (-standing.points, -standing.wins, -standing.goal_difference, standing.team_id))
+        return self._standings
+
+    def leaders(self, column: str, limit: int = 10) -> List[Tuple[int, int]]:
+        """The players with the highest totals of one column of player_stats, as (player ID, total)."""
+        if column not in PLAYER_COLUMNS:
+            raise ValueError(f"Unknown stat {column}")
+        leaders = self._leaders.get(column)
+        if leaders is None:
+            leaders = self._leaders[column] = sorted(((player_id, totals[column]) for player_id, totals in self.players.items() if totals[column] > 0),
+                                                     key=lambda leader: (-leader[1], leader[0]))
+        return leaders[:limit]
+
+    def player(self, player_id: int) -> Counter:
+        return Counter(self.players.get(player_id, {}))
+
+    async def rebuild(self):
+        """
+        Recomputes the standings from the games table, and player and archetype totals from the play-by-play log, then
+        reloads everything. Game state writes are held off while it runs, so no move can be counted twice or not at
+        all. Moves made before the log existed (schema migration 6) are not in it, so they drop out of player totals.
+        """
+        async with self.bot.games.writes_held():
+            async with self.bot.unit_of_work() as work:
+                work.add("TRUNCATE standings, player_stats, archetype_stats")
+                work.add(REBUILD_STANDINGS)
+                work.add(REBUILD_PLAYER_STATS)
+                work.add(REBUILD_ARCHETYPE_STATS)
+            await self.load()
@@ -0,0 +1,87 @@
+"""
+In-memory registry of the teams table for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class Team:
+    """A single row of the teams table."""
+    team_id: str
+    role_id: int
+    city: Optional[str] = None
+    name: Optional[str] = None
+    logo_url: Optional[str] = None
+    channel_id: Optional[int] = None
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.city} {self.name}"
+
+
+class TeamRegistry:
+    """
+    Answers team lookups from memory. The teams table is small and rarely changes, so it is loaded once at startup and
+    kept current by the commands that write to it. Anything else that writes to the table should call refresh().
+    """
+    def __init__(self, statements):
+        self.statements = statements
+        self._teams: Dict[str, Team] = {}
+
+    async def refresh(self):
+        """Reloads every team from the database."""
+        records = await self.statements.all_teams()
+        self._teams = {record["teamid"]: self._team_from_record(record) for record in records}
+
+    def __len__(self):
+        return len(self._teams)
+
+    def __iter__(self):
+        return iter(self._teams.values())
+
+    def get(self, team_id: str) -> Optional[Team]:
+        return self._teams.get(team_id.upper())
+
+    def exists(self, team_id: str) -> bool:
+        return team_id.upper() in self._teams
+
+    def role_id(self, team_id: str) -> Optional[int]:
+        team = self.get(team_id)
+        return team.role_id if team else None
+
+    def add(self, record):
+        """Adds a team from a teams record, replacing any team with the same ID."""
+        team = self._team_from_record(record)
+        self._teams[team.team_id] = team
+        return team
+
+    def update(self, team_id: str, **fields):
+        """Updates the cached attributes of a team after they have been written to the database."""
+        team = self._teams[team_id.upper()]
+        for field, value in fields.items():
+            setattr(team, field, value)
+        return team
+
+    def remove(self, team_id: str):
+        self._teams.pop(team_id.upper(), None)
+
+    @staticmethod
+    def _team_from_record(record) -> Team:
+        return Team(team_id=record["teamid"], role_id=record["roleid"], city=record["city"], name=record["name"],
+                    logo_url=record["logourl"], channel_id=record["channelid"])
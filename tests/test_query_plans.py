@@ -0,0 +1,81 @@
+"""
+Query plan tests for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+if not DATABASE_URL:
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+asyncpg = pytest.importorskip("asyncpg")
+
+import schema  # noqa: E402
+
+# Roughly a busy season: 500 teams, 10,000 players and 50,000 games, of which only the last 50 are still being played
+SEED = [
+    """INSERT INTO teams (teamid, roleid) SELECT 'T' || n, n FROM generate_series(1, 500) AS n""",
+    """INSERT INTO teams (teamid, roleid) VALUES ('ABC', 501), ('DEF', 502)""",
+    """INSERT INTO players (playerid, firstname, lastname, playerposition, playertype, playerteam, approved)
+       SELECT n, 'First' || n, 'Last' || n, (ARRAY['FORWARD', 'DEFENSEMAN', 'GOALIE'])[1 + n % 3], 'PASSER', 'T' || (1 + n % 500), TRUE
+       FROM generate_series(1, 10000) AS n""",
+    """INSERT INTO players (playerid, firstname, lastname, playerposition, playertype, playerteam, approved)
+       SELECT 10000 + n, 'First' || n, 'Last' || n, (ARRAY['FORWARD', 'DEFENSEMAN', 'GOALIE'])[1 + n % 3], 'PASSER',
+              (ARRAY['ABC', 'DEF'])[1 + n % 2], TRUE
+       FROM generate_series(1, 6) AS n""",
+    """INSERT INTO games (hometeam, awayteam, homescore, awayscore, homeroster, awayroster, movenum, stadium, game_active)
+       SELECT 'T' || (1 + n % 500), 'T' || (1 + (n + 1) % 500), n % 5, n % 3,
+              ROW(ROW(1, 'PASSER')::skater, ROW(2, 'PASSER')::skater, 3)::roster, ROW(ROW(4, 'PASSER')::skater, ROW(5, 'PASSER')::skater, 6)::roster,
+              CASE WHEN n > 49950 THEN n % 60 ELSE 60 END, n, n > 49950
+       FROM generate_series(1, 50000) AS n""",
+    """ANALYZE teams, players, games""",
+]
+
+
+async def _plans():
+    """
+    Migrates an empty schema, seeds it and EXPLAINs every hot query. Everything runs in one transaction that is rolled
+    back, so the database is left as it was.
+    """
+    connection = await asyncpg.connect(DATABASE_URL)
+    try:
+        transaction = connection.transaction()
+        await transaction.start()
+        try:
+            await connection.execute("""CREATE SCHEMA query_plan_test""")
+            await connection.execute("""SET LOCAL search_path TO query_plan_test""")
+            await schema.apply(connection)
+            for statement in SEED:
+                await connection.execute(statement)
+            return {name: await schema.explain(connection, name) for name in schema.HOT_QUERIES}
+        finally:
+            await transaction.rollback()
+    finally:
+        await connection.close()
+
+
+@pytest.fixture(scope="module")
+def plans():
+    return asyncio.run(_plans())
+
+
+@pytest.mark.parametrize("name", list(schema.HOT_QUERIES))
+def test_hot_query_uses_index(plans, name):
+    nodes = plans[name]
+    assert any(node in schema.INDEX_SCANS for node in nodes), f"{name} uses no index: {', '.join(nodes)}"
@@ -16,9 +16,19 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import datetime
 from typing import Literal, Optional
 
 
+# How long a player has to submit a number, and how long before that deadline they get a warning
+DEADLINE_LENGTH = datetime.timedelta(hours=24)
+DEADLINE_WARNING = datetime.timedelta(hours=6)
+# Games are three periods of 25 moves each
+MOVES_PER_PERIOD = 25
+PERIODS = 3
+MOVES_PER_GAME = MOVES_PER_PERIOD * PERIODS
+
+
 def fancy_archetype_name(position: str, archetype: str) -> Optional[str]:
     """
     If given a non-goalie position and a string 'passer', 'shooter', or 'deker' (case insensitive), returns a string corresponding
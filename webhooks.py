@@ -0,0 +1,156 @@
+"""
+Cached, batched webhook posting for Fake Hockey Bot
+Copyright (C) 2022 NotAName
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+import nextcord
+
+from metrics import DISCORD, Metrics
+
+
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+CLOSE_TIMEOUT = 10.0  # How long close() waits for queued posts before dropping them
+
+
+@dataclass
+class CachedWebhook:
+    """A row of the webhooks table."""
+    name: str
+    url: str
+    twitter_handle: Optional[str]
+    twitter_name: Optional[str]
+    avatar: Optional[str]
+    templates: Dict[str, str] = field(default_factory=dict)
+
+
+class WebhookManager:
+    """
+    Owns a single HTTP session for every webhook post, caches webhook rows, and queues posts per webhook so that bursts
+    of messages are coalesced into as few requests as possible.
+    """
+    def __init__(self, statements, logger, metrics: Metrics, coalesce_delay: float = 1.0):
+        self.statements = statements
+        self.logger = logger
+        self.metrics = metrics
+        self.coalesce_delay = coalesce_delay
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._cache: Dict[str, CachedWebhook] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.posts_queued = 0
+        self.requests_sent = 0
+        self.failures = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session. Created lazily since it has to be created inside the running event loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=300))
+        return self._session
+
+    async def get(self, webhook_name: str) -> CachedWebhook:
+        """Returns a webhook from the cache, loading it from the database if needed. Raises KeyError if it does not exist."""
+        if webhook_name not in self._cache:
+            record = await self.statements.webhook(webhook_name)
+            if record is None:
+                raise KeyError(webhook_name)
+            self._cache[webhook_name] = CachedWebhook(name=webhook_name, url=record["webhookurl"], twitter_handle=record["twitter_handle"],
+                                                      twitter_name=record["twittername"], avatar=record["avatar"], templates=record["templates"])
+        return self._cache[webhook_name]
+
+    def invalidate(self, webhook_name: Optional[str] = None):
+        """Drops one webhook (or every webhook) from the cache so that it will be reloaded on next use."""
+        if webhook_name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(webhook_name, None)
+
+    async def render(self, webhook_name: str, template_name: str, **kwargs) -> str:
+        webhook = await self.get(webhook_name)
+        return webhook.templates[template_name].format(**kwargs)
+
+    def send(self, webhook_name: str, content: Optional[str] = None, embed: Optional[nextcord.Embed] = None):
+        """Queues a post. Returns immediately; the post is sent by the webhook's worker."""
+        if webhook_name not in self._queues:
+            self._queues[webhook_name] = asyncio.Queue()
+            self._workers[webhook_name] = asyncio.create_task(self._worker(webhook_name))
+        self._queues[webhook_name].put_nowait((content, embed))
+        self.posts_queued += 1
+
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def _worker(self, webhook_name: str):
+        queue = self._queues[webhook_name]
+        while True:
+            batch = [await queue.get()]
+            # Wait briefly so that posts made in quick succession go out together
+            await asyncio.sleep(self.coalesce_delay)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for contents, embeds in self._coalesce(batch):
+                await self._post(webhook_name, "\n".join(contents) or None, embeds)
+            for _ in batch:
+                queue.task_done()
+
+    @staticmethod
+    def _coalesce(batch):
+        """Groups queued posts into messages that stay within Discord's content and embed limits."""
+        messages = []
+        contents, content_length, embeds = [], 0, []
+        for content, embed in batch:
+            content_too_long = content is not None and content_length + len(content) + len(contents) > MAX_CONTENT_LENGTH
+            too_many_embeds = embed is not None and len(embeds) == MAX_EMBEDS
+            if (contents or embeds) and (content_too_long or too_many_embeds):
+                messages.append((contents, embeds))
+                contents, content_length, embeds = [], 0, []
+            if content is not None:
+                contents.append(content)
+                content_length += len(content)
+            if embed is not None:
+                embeds.append(embed)
+        if contents or embeds:
+            messages.append((contents, embeds))
+        return messages
+
+    async def _post(self, webhook_name: str, content: Optional[str], embeds: List[nextcord.Embed]):
+        try:
+            webhook = await self.get(webhook_name)
+            webhook_model = nextcord.Webhook.from_url(url=webhook.url, session=self.session)
+            with self.metrics.measure(DISCORD, "POST /webhooks/{webhook_id}/{webhook_token}"):
+                await webhook_model.send(content=content, embeds=embeds)
+            self.requests_sent += 1
+        except Exception as error:
+            self.failures += 1
+            self.logger.error(f"Failed to post to webhook {webhook_name}: {error!r}")
+
+    async def close(self):
+        """Sends everything still queued, for up to CLOSE_TIMEOUT seconds, then closes the session."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues.values())), CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Stopped waiting for webhook posts after {CLOSE_TIMEOUT:g} s; dropping the one being sent and {self.queue_depth()} queued")
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()